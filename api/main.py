@@ -43,7 +43,7 @@ wait_for_elasticsearch(es_host, es_port)
 
 # Now import modules that depend on Elasticsearch
 from search.index import ResourceSearch
-from crawler.run_crawler import start_crawler
+from crawler.run_crawler import get_job_status, start_crawler
 
 # Request models
 class CrawlerStartRequest(BaseModel):
@@ -114,6 +114,16 @@ async def start_crawling(request: CrawlerStartRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/crawler/jobs/{job_id}")
+async def get_crawler_job(job_id: str):
+    """
+    Get the progress of a distributed query job
+    """
+    status = get_job_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return status
+
 @app.get("/status")
 async def get_status():
     """
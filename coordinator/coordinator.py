@@ -7,8 +7,12 @@ import signal
 import sys
 from concurrent.futures import ThreadPoolExecutor
 import subprocess
-import hashlib
-import random
+from crawler.resource_crawler.frontier import (
+    INFLIGHT_PREFIX, MAX_ATTEMPTS, RING_VNODES, WORKER_IDS_KEY, WORKER_QUEUE_PREFIX, WORKER_STATUS_PREFIX, CrawlState,
+    RedisFrontier, score_url
+)
+from crawler.resource_crawler.cluster import ClusterMetrics, read_statuses
+from crawler.resource_crawler.jobs import QueryJobs
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -19,9 +23,73 @@ class CrawlerCoordinator:
     def __init__(self, redis_host='redis', redis_port=6379):
         self.redis = redis.Redis(host=redis_host, port=redis_port)
         self.running = True
-        self.worker_count = int(os.environ.get('CRAWLER_WORKERS', 3))
         self.workers = {}
         
+        # Autoscaling bounds; CRAWLER_WORKERS is the initial worker count
+        self.min_workers = int(os.environ.get('CRAWLER_MIN_WORKERS', 1))
+        self.max_workers = int(os.environ.get('CRAWLER_MAX_WORKERS', 8))
+        self.worker_count = min(max(int(os.environ.get('CRAWLER_WORKERS', 3)), self.min_workers), self.max_workers)
+        # Seconds the backlog should take to drain at the measured throughput
+        self.scale_target_drain = float(os.environ.get('SCALE_TARGET_DRAIN_SECONDS', 600))
+        # Backlog per worker that triggers a scale-up before throughput is known
+        self.scale_up_backlog = int(os.environ.get('SCALE_UP_BACKLOG', 1000))
+        # Seconds between scaling decisions
+        self.scale_cooldown = float(os.environ.get('SCALE_COOLDOWN', 60))
+        # Host limits: 1-minute load per CPU and minimum fraction of memory available
+        self.scale_max_load = float(os.environ.get('SCALE_MAX_LOAD', 0.85))
+        self.scale_min_free_memory = float(os.environ.get('SCALE_MIN_FREE_MEMORY', 0.15))
+        # Seconds a scaled-down worker may keep crawling its queue before it is stopped
+        self.drain_timeout = float(os.environ.get('SCALE_DRAIN_TIMEOUT', 300))
+        
+        # Workers removed from the ring that are finishing their queues, by start of the drain
+        self.draining = {}
+        self.last_scale = time.monotonic()
+        self.last_throughput_check = None
+        self.last_visited = 0
+        self.pages_per_worker = 0.0
+        # Crawl state buckets; must match the crawler's CRAWL_STATE_* settings
+        self.crawl_state = CrawlState(
+            float(os.environ.get('CRAWL_STATE_HORIZON_DAYS', 30)),
+            int(os.environ.get('CRAWL_STATE_BUCKETS', 4)),
+            int(os.environ.get('CRAWL_STATE_SHARD_BITS', 16))
+        )
+        self.frontier = RedisFrontier(self.redis, state=self.crawl_state)
+        
+        # Frontier entries routed per batch, and the most entries a worker queue may hold
+        self.distribute_batch_size = int(os.environ.get('DISTRIBUTE_BATCH_SIZE', 1000))
+        self.worker_queue_max = int(os.environ.get('WORKER_QUEUE_MAX', 2000))
+        # Seconds between routing attempts once the frontier has run dry
+        self.distribute_interval = float(os.environ.get('DISTRIBUTE_INTERVAL', 0.5))
+        # Claims of an entry that never finish before it is dead-lettered
+        self.max_attempts = int(os.environ.get('MAX_ATTEMPTS', MAX_ATTEMPTS))
+        # URLs queued for re-crawling per maintenance pass once they are due
+        self.recrawl_batch_size = int(os.environ.get('RECRAWL_BATCH_SIZE', 1000))
+        # Seconds between worker checks and stats reports
+        self.maintenance_interval = float(os.environ.get('MAINTENANCE_INTERVAL', 5))
+        
+        # Directory for worker log files
+        self.worker_log_dir = os.environ.get('WORKER_LOG_DIR')
+        if self.worker_log_dir:
+            os.makedirs(self.worker_log_dir, exist_ok=True)
+        
+        # Worker slots on the consistent-hash ring and virtual nodes per slot
+        self.ring_slots = []
+        self.ring_vnodes = int(os.environ.get('RING_VNODES', RING_VNODES))
+        
+        # Routing throughput counters
+        self.routed_total = 0
+        self.returned_total = 0
+        self.requeued_total = 0
+        self.last_report = time.monotonic()
+        self.last_routed = 0
+        
+        # Query jobs submitted by the API, and seconds a job may run
+        self.jobs = QueryJobs(self.redis)
+        self.query_job_timeout = float(os.environ.get('QUERY_JOB_TIMEOUT', 900))
+        
+        # Rolling cluster metrics aggregated from worker heartbeats
+        self.cluster_metrics = ClusterMetrics(window=float(os.environ.get('CLUSTER_METRICS_WINDOW', 60)))
+        
         # Set up signal handlers
         signal.signal(signal.SIGINT, self.shutdown)
         signal.signal(signal.SIGTERM, self.shutdown)
@@ -51,9 +119,27 @@ class CrawlerCoordinator:
         # Update workers dict
         self.workers = running_workers
         
-        # Start new workers if needed
-        while len(self.workers) < self.worker_count:
-            worker_id = f"worker_{random.randint(1000, 9999)}"
+        # Stop draining workers once their queue is empty or the drain times out
+        for worker_id, since in list(self.draining.items()):
+            process = self.workers.get(worker_id)
+            if process is None:
+                del self.draining[worker_id]
+                continue
+            queued = self.redis.llen(WORKER_QUEUE_PREFIX + worker_id)
+            if queued == 0 or time.monotonic() - since > self.drain_timeout:
+                logger.info(f"Stopping drained worker {worker_id} ({queued} queued URLs left)")
+                # Scrapy finishes in-flight requests and requeues its claims on SIGTERM
+                process.terminate()
+                del self.draining[worker_id]
+        
+        # Start workers for every empty slot. Worker IDs are stable slot
+        # names, so a restarted worker keeps its queue and its ring position
+        for slot in range(self.worker_count):
+            worker_id = f"worker_{slot}"
+            if worker_id in self.workers:
+                if self.draining.pop(worker_id, None) is not None:
+                    logger.info(f"Worker {worker_id} is needed again, no longer draining")
+                continue
             logger.info(f"Starting new crawler worker {worker_id}")
             
             # Start crawler process
@@ -62,46 +148,193 @@ class CrawlerCoordinator:
                 '-a', f'worker_id={worker_id}'
             ]
             
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            # Worker output goes to a per-worker log file, or to the
+            # coordinator's own output when WORKER_LOG_DIR is unset. An unread
+            # pipe would block the worker once its buffer fills
+            log_file = None
+            if self.worker_log_dir:
+                log_file = open(os.path.join(self.worker_log_dir, f"{worker_id}.log"), 'ab')
+            process = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT if log_file else None)
+            if log_file:
+                log_file.close()
             
             self.workers[worker_id] = process
+            self.redis.sadd(WORKER_IDS_KEY, worker_id)
+        
+        # Rebuild the ring when the set of worker slots changes
+        slots = [f"worker_{slot}" for slot in range(self.worker_count)]
+        if slots != self.ring_slots:
+            self.frontier.set_ring(slots, self.ring_vnodes)
+            self.ring_slots = slots
+            logger.info(f"Hash ring rebuilt for {len(slots)} workers with {self.ring_vnodes} virtual nodes each")
     
     def distribute_urls(self):
-        """Distribute pending URLs to worker-specific queues"""
-        # Get pending URLs
-        pending_urls = self.redis.lrange('crawler:pending_urls', 0, 100)
+        """
+        Route a batch of the highest scoring frontier URLs to worker-specific queues.
+        
+        Returns:
+            int: Number of URLs routed
+        """
+        if not self.ring_slots:
+            return 0
+        
+        # Route the batch atomically on the Redis server, by registered domain,
+        # skipping the entries of workers whose queue is full
+        routed, returned = self.frontier.distribute(self.distribute_batch_size, self.worker_queue_max)
+        self.routed_total += routed
+        self.returned_total += returned
+        return routed
+    
+    def recover_work(self):
+        """
+        Return lost crawl work to the frontier.
+        
+        Queues and in-flight entries of stopped workers outside the current
+        slots (old worker IDs, slots removed by scaling down) are drained. The claims
+        of a worker that is neither running here nor sending heartbeats are
+        requeued. For live workers, only claims whose lease expired are
+        requeued. Workers are found through the worker registry, and
+        drained workers without a heartbeat leave it.
+        """
+        worker_ids = {worker_id.decode() for worker_id in self.redis.smembers(WORKER_IDS_KEY)}
+        
+        now = time.time()
+        requeued = 0
+        for worker_id in worker_ids:
+            if worker_id not in self.ring_slots and worker_id not in self.workers:
+                count = self.frontier.requeue(worker_id, drain_queue=True, max_attempts=self.max_attempts)
+                reason = 'orphaned queue'
+                if not self.redis.exists(WORKER_STATUS_PREFIX + worker_id):
+                    self.redis.srem(WORKER_IDS_KEY, worker_id)
+            elif worker_id not in self.workers and not self.redis.exists(WORKER_STATUS_PREFIX + worker_id):
+                count = self.frontier.requeue(worker_id, max_attempts=self.max_attempts)
+                reason = 'missing heartbeat'
+            else:
+                count = self.frontier.requeue(worker_id, expired_before=now, max_attempts=self.max_attempts)
+                reason = 'expired leases'
+            if count:
+                logger.info(f"Requeued {count} entries from {worker_id} ({reason})")
+                requeued += count
+        
+        self.requeued_total += requeued
+        return requeued
+    
+    def register_known_workers(self):
+        """
+        Add workers that left queues or claims behind to the worker registry.
         
-        if not pending_urls:
+        Only needed once at startup, for work left by workers that ran
+        before the registry existed; it scans the keyspace.
+        """
+        worker_ids = set()
+        for prefix in (WORKER_QUEUE_PREFIX, INFLIGHT_PREFIX, WORKER_STATUS_PREFIX):
+            for key in self.redis.scan_iter(match=f'{prefix}*', count=1000):
+                worker_ids.add(key.decode()[len(prefix):])
+        if worker_ids:
+            self.redis.sadd(WORKER_IDS_KEY, *worker_ids)
+        return worker_ids
+    
+    def finish_jobs(self):
+        """Finish query jobs that used up their budget, ran dry or timed out"""
+        finished = self.jobs.finish_done(self.query_job_timeout)
+        for job in finished:
+            logger.info(
+                f"Query job {job['job_id']} ({job['query']!r}) {job['status']}: {job['crawled']} pages crawled, "
+                f"{job['failed']} failed, {job['items']} resources found in {job['finished'] - job['created']:.0f}s"
+            )
+        return finished
+    
+    def host_headroom(self):
+        """
+        Measure how busy this host is.
+        
+        Returns:
+            tuple: (1-minute load average per CPU, fraction of memory available)
+        """
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        free_memory = 1.0
+        try:
+            with open('/proc/meminfo') as f:
+                meminfo = {line.split(':')[0]: int(line.split()[1]) for line in f}
+            free_memory = meminfo['MemAvailable'] / meminfo['MemTotal']
+        except (OSError, KeyError, ValueError, ZeroDivisionError):
+            pass
+        return load, free_memory
+    
+    def autoscale(self):
+        """
+        Adjust the worker count to the backlog, one worker per decision.
+        
+        The target is the number of workers that would drain the backlog
+        (frontier plus worker queues) within SCALE_TARGET_DRAIN_SECONDS at
+        the measured pages/s per worker. Scaling up also requires CPU and
+        memory headroom on this host, and an overloaded host scales down.
+        Removed workers leave the ring at once but crawl their queue before
+        they are stopped.
+        """
+        now = time.monotonic()
+        visited = self.crawl_state.count(self.redis, 'visited')
+        if self.last_throughput_check is not None and self.workers:
+            elapsed = max(now - self.last_throughput_check, 1e-6)
+            self.pages_per_worker = max(visited - self.last_visited, 0) / elapsed / len(self.workers)
+        self.last_throughput_check = now
+        self.last_visited = visited
+        
+        if now - self.last_scale < self.scale_cooldown:
             return
         
-        # Get active worker IDs
-        worker_ids = list(self.workers.keys())
-        if not worker_ids:
+        with self.redis.pipeline(transaction=False) as pipe:
+            for worker_id in self.ring_slots:
+                pipe.llen(WORKER_QUEUE_PREFIX + worker_id)
+            backlog = len(self.frontier) + sum(pipe.execute())
+        
+        current = self.worker_count
+        if self.pages_per_worker > 0:
+            needed = -(-backlog // max(int(self.pages_per_worker * self.scale_target_drain), 1))
+        else:
+            needed = current + 1 if backlog > self.scale_up_backlog * current else current
+        
+        load, free_memory = self.host_headroom()
+        has_headroom = load < self.scale_max_load and free_memory > self.scale_min_free_memory
+        target, reason = current, None
+        if needed > current and has_headroom:
+            target, reason = current + 1, f"backlog {backlog} needs {needed} workers"
+        elif load > self.scale_max_load * 1.25 or free_memory < self.scale_min_free_memory / 2:
+            target, reason = current - 1, "host overloaded"
+        elif needed < current:
+            target, reason = current - 1, f"backlog {backlog} needs {needed} workers"
+        target = min(max(target, self.min_workers), self.max_workers)
+        if target == current:
             return
         
-        # Distribute URLs to workers
-        for url_bytes in pending_urls:
-            url = url_bytes.decode('utf-8')
-            # Select worker based on URL hash for consistent assignment
-            url_hash = int(hashlib.md5(url.encode()).hexdigest(), 16)
-            worker_idx = url_hash % len(worker_ids)
-            worker_id = worker_ids[worker_idx]
-            
-            # Add to worker's queue
-            worker_queue = f'crawler:pending_urls:{worker_id}'
-            self.redis.rpush(worker_queue, url)
-            
-            # Remove from main queue
-            self.redis.lrem('crawler:pending_urls', 1, url_bytes)
+        decision = {
+            'time': time.time(),
+            'from': current,
+            'to': target,
+            'reason': reason,
+            'backlog': backlog,
+            'pages_per_worker': round(self.pages_per_worker, 2),
+            'load_per_cpu': round(load, 2),
+            'free_memory': round(free_memory, 2),
+        }
+        logger.info(f"Scaling workers {current} -> {target}: {reason} (load {load:.2f}/CPU, {free_memory:.0%} memory free)")
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.lpush('crawler:coordinator:scaling', json.dumps(decision))
+            pipe.ltrim('crawler:coordinator:scaling', 0, 99)
+            pipe.execute()
+        
+        if target < current:
+            # The highest slot leaves the ring now and is stopped once drained
+            worker_id = f"worker_{target}"
+            if worker_id in self.workers:
+                self.draining[worker_id] = now
+        self.worker_count = target
+        self.last_scale = now
     
     def seed_urls(self):
         """Seed initial URLs if the queue is empty"""
-        pending_count = self.redis.llen('crawler:pending_urls')
-        seen_count = self.redis.scard('crawler:seen_urls')
+        pending_count = len(self.frontier)
+        seen_count = self.crawl_state.count(self.redis, 'seen')
         
         if pending_count == 0 and seen_count == 0:
             logger.info("Seeding initial URLs")
@@ -111,23 +344,47 @@ class CrawlerCoordinator:
                 from crawler.resource_crawler.spiders.distributed_spider import DistributedResourceSpider
                 
                 # Add default URLs to queue
-                for url in DistributedResourceSpider.default_start_urls:
-                    url_hash = hashlib.md5(url.encode()).hexdigest()
-                    if not self.redis.sismember('crawler:seen_urls', url_hash):
-                        self.redis.rpush('crawler:pending_urls', url)
-                        self.redis.sadd('crawler:seen_urls', url_hash)
-                        
+                self.frontier.enqueue((url, score_url(url), 0) for url in DistributedResourceSpider.default_start_urls)
+                
                 logger.info(f"Seeded {len(DistributedResourceSpider.default_start_urls)} URLs")
             except ImportError:
                 logger.error("Could not import DistributedResourceSpider to seed URLs")
     
     def report_stats(self):
         """Report crawler statistics"""
-        visited = self.redis.scard('crawler:visited_urls')
-        pending = self.redis.llen('crawler:pending_urls')
-        seen = self.redis.scard('crawler:seen_urls')
+        visited = self.crawl_state.count(self.redis, 'visited')
+        pending = len(self.frontier)
+        seen = self.crawl_state.count(self.redis, 'seen')
         
-        logger.info(f"Crawler stats: visited={visited}, pending={pending}, seen={seen}, workers={len(self.workers)}")
+        now = time.monotonic()
+        routed_per_sec = (self.routed_total - self.last_routed) / max(now - self.last_report, 1e-6)
+        self.last_report = now
+        self.last_routed = self.routed_total
+        
+        statuses = read_statuses(self.redis)
+        cluster = self.cluster_metrics.update(statuses)
+        
+        self.redis.hset('crawler:coordinator:stats', mapping={
+            'routed_total': self.routed_total,
+            'returned_total': self.returned_total,
+            'requeued_total': self.requeued_total,
+            'workers': self.worker_count,
+            'draining': len(self.draining),
+            'pages_per_worker': round(self.pages_per_worker, 2),
+            'routed_per_sec': round(routed_per_sec, 1),
+            'pending': pending,
+            'query_jobs': len(self.jobs.active()),
+            'updated': int(time.time()),
+            **cluster,
+        })
+        logger.info(
+            f"Crawler stats: visited={visited}, pending={pending}, seen={seen}, workers={self.worker_count} (+{len(self.draining)} draining), "
+            f"routed={self.routed_total} ({routed_per_sec:.1f}/s), returned_full={self.returned_total}, "
+            f"requeued={self.requeued_total}, cluster={cluster['cluster_pages_per_sec']:.1f} pages/s "
+            f"({cluster['cluster_pages_per_sec_avg']:.1f} avg), errors={cluster['cluster_error_rate']:.1%}"
+        )
+        if cluster['unhealthy_workers'] != '{}':
+            logger.warning(f"Unhealthy workers: {cluster['unhealthy_workers']}")
     
     def run(self):
         """Main coordinator loop"""
@@ -135,20 +392,32 @@ class CrawlerCoordinator:
         
         # Seed initial URLs
         self.seed_urls()
+        self.register_known_workers()
         
         try:
+            last_maintenance = None
             while self.running:
-                # Ensure worker count
-                self.ensure_worker_count()
-                
-                # Distribute URLs
-                self.distribute_urls()
-                
-                # Report stats
-                self.report_stats()
+                now = time.monotonic()
+                if last_maintenance is None or now - last_maintenance >= self.maintenance_interval:
+                    # Scale the worker pool, then start and stop workers to match
+                    self.autoscale()
+                    self.ensure_worker_count()
+                    
+                    # Requeue work claimed by dead workers or left in orphaned queues
+                    self.recover_work()
+                    self.finish_jobs()
+                    
+                    # Queue pages whose re-crawl is due
+                    self.frontier.promote_due(self.recrawl_batch_size)
+                    
+                    # Report stats
+                    self.report_stats()
+                    last_maintenance = now
                 
-                # Sleep
-                time.sleep(5)
+                # Keep routing full batches while the frontier has them,
+                # back off briefly once it runs dry or the worker queues are full
+                if self.distribute_urls() < self.distribute_batch_size:
+                    time.sleep(self.distribute_interval)
         except KeyboardInterrupt:
             self.shutdown(None, None)
         except Exception as e:
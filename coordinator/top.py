@@ -0,0 +1,78 @@
+"""
+Live, top-style view of the distributed crawl.
+
+Shows the coordinator's cluster metrics and one line per worker from the
+worker heartbeat hashes, with stale, stuck and slow workers flagged.
+
+Usage: python coordinator/top.py [--interval SECONDS] [--once]
+"""
+
+import argparse
+import json
+import os
+import time
+from statistics import median
+
+import redis
+
+from crawler.resource_crawler.cluster import decode_status, read_statuses, worker_health
+
+CLEAR_SCREEN = '\033[H\033[2J'
+
+
+def render(client):
+    now = time.time()
+    stats = decode_status(client.hgetall('crawler:coordinator:stats')) if client.exists('crawler:coordinator:stats') else {}
+    statuses = read_statuses(client)
+    rates = [status.get('pages_per_sec', 0) for status in statuses.values()]
+    typical = median(rates) if rates else 0.0
+
+    lines = [
+        f"resource-grep crawl  {time.strftime('%H:%M:%S')}  workers {int(stats.get('workers', 0))} "
+        f"(+{int(stats.get('draining', 0))} draining, {len(statuses)} reporting)",
+        f"cluster  pages/s {stats.get('cluster_pages_per_sec', 0):.1f} (avg {stats.get('cluster_pages_per_sec_avg', 0):.1f})  "
+        f"items/s {stats.get('cluster_items_per_sec', 0):.1f}  errors {stats.get('cluster_error_rate', 0):.1%}  "
+        f"rss {stats.get('cluster_rss_mb', 0):.0f}MB",
+        f"frontier {int(stats.get('pending', 0))}  routed/s {stats.get('routed_per_sec', 0):.1f}  "
+        f"requeued {int(stats.get('requeued_total', 0))}",
+        '',
+        f"{'WORKER':<12}{'PAGES/S':>9}{'ITEMS/S':>9}{'ERR%':>7}{'QUEUE':>8}{'FLIGHT':>8}{'RSS MB':>8}{'IDLE':>7}  "
+        f"{'FLAGS':<12}DOMAINS",
+    ]
+    for worker_id, status in sorted(statuses.items(), key=lambda item: item[0]):
+        flags = ','.join(worker_health(status, typical, now)) or '-'
+        domains = ' '.join(f"{domain}({count})" for domain, count in status.get('domains', {}).items())
+        lines.append(
+            f"{worker_id:<12}{status.get('pages_per_sec', 0):>9.1f}{status.get('items_per_sec', 0):>9.1f}"
+            f"{status.get('error_rate', 0) * 100:>7.1f}{int(status.get('queue', 0)):>8}{int(status.get('inflight', 0)):>8}"
+            f"{status.get('rss_mb', 0):>8.0f}{now - status.get('last_progress', now):>6.0f}s  {flags:<12}{domains}"
+        )
+    if not statuses:
+        lines.append('(no worker heartbeats)')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between refreshes')
+    parser.add_argument('--once', action='store_true', help='print one snapshot and exit')
+    parser.add_argument('--json', action='store_true', help='print worker statuses as JSON and exit')
+    args = parser.parse_args()
+
+    client = redis.Redis(host=os.environ.get('REDIS_HOST', 'redis'), port=int(os.environ.get('REDIS_PORT', 6379)))
+    if args.json:
+        print(json.dumps(read_statuses(client), indent=2))
+        return
+    if args.once:
+        print(render(client))
+        return
+    try:
+        while True:
+            print(CLEAR_SCREEN + render(client), flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
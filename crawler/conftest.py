@@ -0,0 +1 @@
+# Makes resource_crawler importable when pytest runs from this directory
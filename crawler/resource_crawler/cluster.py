@@ -0,0 +1,107 @@
+"""
+Cluster view of the distributed workers.
+
+Each DistributedResourceSpider publishes a status hash under
+crawler:workers:<worker_id> with every heartbeat and registers its ID in
+crawler:worker_ids. This module decodes those
+hashes, flags stale, stuck and slow workers, and keeps rolling cluster
+metrics. The coordinator stores them in crawler:coordinator:stats, and
+coordinator/top.py shows them live.
+
+This module has no Scrapy dependency so the coordinator can import it.
+"""
+
+import json
+import time
+from collections import deque
+from statistics import median
+
+from .frontier import WORKER_IDS_KEY, WORKER_STATUS_PREFIX
+
+
+def decode_status(raw):
+    """Decode a worker status hash read from Redis"""
+    status = {}
+    for key, value in raw.items():
+        key = key.decode() if isinstance(key, bytes) else key
+        value = value.decode() if isinstance(value, bytes) else value
+        if key == 'domains':
+            status[key] = json.loads(value or '{}')
+        else:
+            try:
+                status[key] = float(value)
+            except ValueError:
+                status[key] = value
+    return status
+
+
+def read_statuses(client):
+    """Status of every registered worker with a live heartbeat, keyed by worker ID"""
+    worker_ids = sorted(worker_id.decode() for worker_id in client.smembers(WORKER_IDS_KEY))
+    with client.pipeline(transaction=False) as pipe:
+        for worker_id in worker_ids:
+            pipe.hgetall(WORKER_STATUS_PREFIX + worker_id)
+        raw_statuses = pipe.execute()
+    return {worker_id: decode_status(raw) for worker_id, raw in zip(worker_ids, raw_statuses) if raw}
+
+
+def worker_health(status, typical_pages_per_sec, now=None, heartbeat_interval=10, stuck_after=120):
+    """
+    Flag workers that need attention.
+
+    Returns:
+        list: Any of 'stale' (missed heartbeats), 'stuck' (claimed work but no
+        responses for stuck_after seconds) and 'slow' (under a quarter of the
+        typical pages/s)
+    """
+    now = now or time.time()
+    flags = []
+    if now - status.get('updated', 0) > heartbeat_interval * 2:
+        flags.append('stale')
+    if status.get('inflight', 0) and now - status.get('last_progress', now) > stuck_after:
+        flags.append('stuck')
+    if typical_pages_per_sec > 0 and status.get('pages_per_sec', 0) < typical_pages_per_sec / 4:
+        flags.append('slow')
+    return flags
+
+
+class ClusterMetrics:
+    """Rolling cluster throughput over a time window"""
+
+    def __init__(self, window=60):
+        self.window = window
+        self.samples = deque()
+
+    def update(self, statuses, now=None):
+        """
+        Add a sample from the current worker statuses.
+
+        Returns:
+            dict: Current and rolling cluster metrics
+        """
+        now = now or time.time()
+        pages = sum(status.get('pages_per_sec', 0) for status in statuses.values())
+        items = sum(status.get('items_per_sec', 0) for status in statuses.values())
+        self.samples.append((now, pages, items))
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.samples.popleft()
+
+        rates = [status.get('pages_per_sec', 0) for status in statuses.values()]
+        typical = median(rates) if rates else 0.0
+        unhealthy = {
+            worker_id: flags for worker_id, status in statuses.items()
+            if (flags := worker_health(status, typical, now))
+        }
+        error_rates = [status.get('error_rate', 0) for status in statuses.values()]
+        return {
+            'live_workers': len(statuses),
+            'cluster_pages_per_sec': round(pages, 2),
+            'cluster_items_per_sec': round(items, 2),
+            'cluster_pages_per_sec_avg': round(sum(sample[1] for sample in self.samples) / len(self.samples), 2),
+            'cluster_items_per_sec_avg': round(sum(sample[2] for sample in self.samples) / len(self.samples), 2),
+            'cluster_error_rate': round(sum(error_rates) / len(error_rates), 3) if error_rates else 0.0,
+            'cluster_rss_mb': round(sum(status.get('rss_mb', 0) for status in statuses.values()), 1),
+            'cluster_queued': int(sum(status.get('queue', 0) for status in statuses.values())),
+            'cluster_inflight': int(sum(status.get('inflight', 0) for status in statuses.values())),
+            'unhealthy_workers': json.dumps(unhealthy),
+        }
@@ -0,0 +1,4 @@
+# Custom scrapy commands for the resource crawler
+#
+# Registered through the COMMANDS_MODULE setting, see
+# https://docs.scrapy.org/en/latest/topics/commands.html#custom-project-commands
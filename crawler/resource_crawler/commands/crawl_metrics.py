@@ -0,0 +1,64 @@
+import json
+
+import redis
+from scrapy.commands import ScrapyCommand
+
+from resource_crawler.instrumentation import METRICS_KEY_PREFIX
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Show published crawl metrics, slowest pages and most expensive selectors"
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument("--top", type=int, default=10, help="number of pages and selectors to list")
+        parser.add_argument("--json", action="store_true", help="print raw JSON snapshots")
+
+    def run(self, args, opts):
+        client = redis.Redis(host=self.settings.get("REDIS_HOST", "redis"), port=self.settings.getint("REDIS_PORT", 6379))
+        keys = sorted(client.scan_iter(match=METRICS_KEY_PREFIX + "*"))
+        snapshots = [json.loads(raw) for raw in client.mget(keys) if raw] if keys else []
+
+        if opts.json:
+            print(json.dumps(snapshots, indent=2))
+            return
+        if not snapshots:
+            print("No crawl metrics published")
+            return
+
+        for snapshot in snapshots:
+            rates = snapshot["rates"]
+            print(f"== {snapshot['instance']} ({snapshot['spider']})")
+            print(f"   pages/s {rates['pages_per_sec']:.1f}  items/s {rates['items_per_sec']:.1f}  "
+                  f"KB/s {rates['bytes_per_sec'] / 1024:.1f}")
+            print("   queues  " + "  ".join(f"{name}={depth}" for name, depth in snapshot["queues"].items()))
+            for stage, summary in sorted(snapshot["stages"].items()):
+                print(f"   {stage:<10} n={summary['count']:<8} mean={summary['mean'] * 1000:.1f}ms "
+                      f"p95<={summary['p95'] * 1000:.0f}ms p99<={summary['p99'] * 1000:.0f}ms")
+
+        pages = sorted(
+            (page for snapshot in snapshots for page in snapshot["slowest_pages"]),
+            key=lambda page: page["seconds"], reverse=True
+        )
+        print("\nSlowest pages:")
+        for page in pages[:opts.top]:
+            print(f"  {page['seconds'] * 1000:8.1f}ms  {page['stage']:<10} {page['url']}")
+
+        selectors = {}
+        for snapshot in snapshots:
+            for rule in snapshot["expensive_selectors"]:
+                calls, total = selectors.get(rule["rule"], (0, 0.0))
+                selectors[rule["rule"]] = (calls + rule["calls"], total + rule["total"])
+        if selectors:
+            print("\nMost expensive selectors:")
+            ranked = sorted(selectors.items(), key=lambda item: item[1][1], reverse=True)
+            for rule, (calls, total) in ranked[:opts.top]:
+                print(f"  {total * 1000:8.1f}ms total {total / calls * 1000:6.2f}ms/call  {rule}")
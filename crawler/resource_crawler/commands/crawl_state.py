@@ -0,0 +1,55 @@
+import json
+
+import redis
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from resource_crawler.commands.httpcache_stats import format_bytes
+from resource_crawler.frontier import STATE_KINDS, CrawlState
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] report|migrate"
+
+    def short_desc(self):
+        return "Report crawl state memory or migrate the legacy seen and visited sets"
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument("--delete", action="store_true",
+                            help="migrate: delete the legacy sets once copied")
+        parser.add_argument("--sample", type=int, default=200,
+                            help="report: keys per kind to measure (default: 200)")
+        parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    def run(self, args, opts):
+        if len(args) != 1 or args[0] not in ("report", "migrate"):
+            raise UsageError()
+
+        client = redis.Redis(host=self.settings.get("REDIS_HOST", "redis"), port=self.settings.getint("REDIS_PORT", 6379))
+        state = CrawlState.from_settings(self.settings)
+
+        if args[0] == "migrate":
+            migrated = state.migrate(client, delete=opts.delete)
+            for kind, copied in migrated.items():
+                print(f"{kind}: {copied} URLs copied into bucket {state.current_bucket()}")
+            return
+
+        report = state.memory_report(client, sample=opts.sample)
+        if opts.json:
+            print(json.dumps(report, indent=2))
+            return
+
+        print(f"Horizon:      {state.buckets} buckets of {state.bucket_seconds / 86400:g} days")
+        for kind in STATE_KINDS:
+            usage = report[kind]
+            print(f"{kind.capitalize() + ':':<13} {usage['urls']} URLs in {usage['keys']} keys, "
+                  f"~{format_bytes(usage['bytes'])} ({usage['bytes_per_url']:.1f} B/URL)")
+        if report['legacy_bytes']:
+            print(f"Legacy sets:  {format_bytes(report['legacy_bytes'])} (run 'scrapy crawl_state migrate --delete')")
+        print(f"Redis total:  {format_bytes(report['used_memory'])}")
@@ -0,0 +1,131 @@
+import json
+import time
+from pathlib import Path
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.http import HtmlResponse, Request
+
+from resource_crawler.extractors import get_extractor
+from resource_crawler.spiders.resource_spider import ResourceSpider
+
+COMPARED_FIELDS = ['title', 'description', 'type', 'languages', 'tags']
+# Fields of the site extraction checked against an expected file
+EXPECTED_FIELDS = COMPARED_FIELDS + ['code_snippets']
+
+
+def page_url(body, path):
+    """URL of a saved page from its canonical link or og:url"""
+    response = HtmlResponse(url=f"file://{path.resolve()}", body=body)
+    return (
+        response.css('link[rel="canonical"]::attr(href)').get()
+        or response.css('meta[property="og:url"]::attr(content)').get()
+    )
+
+
+def compare_expected(expected, actual):
+    """Return a list of human readable differences between expected and actual site extraction"""
+    mismatches = []
+    for name, record in sorted(expected.items()):
+        if name not in actual:
+            mismatches.append(f"{name}: no site extraction")
+            continue
+        for field, value in record.items():
+            if actual[name].get(field) != value:
+                mismatches.append(f"{name} {field}: expected {value!r:.120}, got {actual[name].get(field)!r:.120}")
+    return mismatches
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <saved page or directory> ..."
+
+    def short_desc(self):
+        return "Compare site-specific and generic extraction on saved pages"
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument("--url", help="URL of the page, when a single file is given")
+        parser.add_argument("-q", "--query", help="search query to extract with")
+        parser.add_argument("--repeat", type=int, default=20, help="timed runs per page and path (default: 20)")
+        parser.add_argument("--expected", help="check the site extraction against this expected file")
+        parser.add_argument("--write-expected", metavar="FILE", help="write the site extraction as an expected file")
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError()
+
+        paths = []
+        for arg in args:
+            path = Path(arg)
+            paths.extend(sorted(path.glob("*.htm*")) if path.is_dir() else [path])
+
+        spider = ResourceSpider(search_query=opts.query)
+        differences = 0
+        slower = 0
+        extracted = {}
+        for path in paths:
+            body = path.read_bytes()
+            url = opts.url if opts.url and len(paths) == 1 else page_url(body, path)
+            if not url:
+                print(f"SKIP {path}: no --url and no canonical URL in page")
+                continue
+            extractor = get_extractor(url)
+            if extractor is None:
+                print(f"SKIP {path}: no site extractor for {url}")
+                continue
+
+            response = HtmlResponse(url=url, body=body, request=Request(url))
+            results = {}
+            for use_site in (True, False):
+                spider.use_site_extractors = use_site
+                # A warm-up run, then the best of opts.repeat timed runs, so
+                # selector compilation and caches don't favour either path
+                item = spider.extract_resource(response)
+                best = float('inf')
+                for _ in range(opts.repeat):
+                    start = time.perf_counter()
+                    spider.extract_resource(response)
+                    best = min(best, time.perf_counter() - start)
+                results[use_site] = (item, best)
+
+            (site_item, site_time), (generic_item, generic_time) = results[True], results[False]
+            if site_item is not None:
+                extracted[path.name] = {
+                    'url': url, 'extractor': extractor.__name__,
+                    **{field: site_item[field] for field in EXPECTED_FIELDS},
+                }
+            print(f"== {path.name} [{extractor.__name__}] site {site_time * 1000:.2f}ms, generic {generic_time * 1000:.2f}ms")
+            if site_time > generic_time:
+                slower += 1
+                print("   site extraction is slower than generic")
+            if site_item is None or generic_item is None:
+                differences += 1
+                print(f"   item: site={'yes' if site_item else 'none'} generic={'yes' if generic_item else 'none'}")
+                continue
+            for field in COMPARED_FIELDS:
+                if site_item[field] != generic_item[field]:
+                    differences += 1
+                    print(f"   {field}:\n     site:    {site_item[field]!r:.120}\n     generic: {generic_item[field]!r:.120}")
+            print(f"   content: site {len(site_item['content'] or '')} chars, generic {len(generic_item['content'] or '')} chars")
+            print(f"   code snippets: site {len(site_item['code_snippets'])}, generic {len(generic_item['code_snippets'])}")
+
+        print(f"\n{len(paths)} pages, {differences} field differences, site extraction slower on {slower}")
+
+        if opts.write_expected:
+            with open(opts.write_expected, "w") as f:
+                json.dump(extracted, f, indent=1, sort_keys=True, ensure_ascii=False)
+                f.write("\n")
+
+        if opts.expected:
+            with open(opts.expected) as f:
+                mismatches = compare_expected(json.load(f), extracted)
+            for mismatch in mismatches:
+                print(f"EXPECTED {mismatch}")
+            print(f"{len(mismatches)} mismatches against {opts.expected}")
+            if mismatches:
+                self.exitcode = 1
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.project import data_path
+
+from resource_crawler.httpcache import CACHE_FILENAME, cache_stats
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False}
+
+    def short_desc(self):
+        return "Show hit rate and space used by the SQLite HTTP cache"
+
+    def run(self, args, opts):
+        path = Path(data_path(self.settings["HTTPCACHE_DIR"]), CACHE_FILENAME)
+        if not path.exists():
+            raise UsageError(f"No HTTP cache found at {path}")
+
+        stats = cache_stats(path)
+        max_size = self.settings.getint("HTTPCACHE_MAX_SIZE", 0)
+
+        print(f"Cache file:   {path}")
+        print(f"Entries:      {stats['entries']}")
+        print(f"Stored size:  {format_bytes(stats['stored_bytes'])}"
+              + (f" of {format_bytes(max_size)}" if max_size else ""))
+        print(f"File size:    {format_bytes(stats['file_bytes'])}")
+        print(f"Hit rate:     {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+        print(f"Expired:      {stats['expired']}")
+        print(f"Evicted:      {stats['evicted']}")
+
+        if stats['top_domains']:
+            print("\nLargest domains:")
+            for domain in stats['top_domains']:
+                print(f"  {domain['domain']:<40} {domain['entries']:>8} {format_bytes(domain['bytes']):>12}")
@@ -0,0 +1,92 @@
+import cProfile
+import json
+import pstats
+import tracemalloc
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict
+
+from resource_crawler.replay import compare_golden, replay
+
+
+class Command(ScrapyCommand):
+
+    requires_project = True
+    default_settings = {"LOG_ENABLED": False, "METRICS_ENABLED": False, "EXTRACTION_POOL_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <archive>"
+
+    def short_desc(self):
+        return "Replay recorded responses through a spider offline and report parse throughput"
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_argument("--spider", dest="spider_name", default="resource_spider",
+                            help="spider to replay through (default: resource_spider)")
+        parser.add_argument("-a", dest="spargs", action="append", default=[], metavar="NAME=VALUE",
+                            help="set spider argument (may be repeated)")
+        parser.add_argument("-n", "--repeat", type=int, default=1, help="passes over the archive")
+        parser.add_argument("--no-pipeline", action="store_true", help="do not run the item pipeline")
+        parser.add_argument("--golden", help="compare extracted items with this golden file")
+        parser.add_argument("--write-golden", metavar="FILE", help="write the extracted items as a golden file")
+        parser.add_argument("--top-functions", type=int, default=0, metavar="N",
+                            help="profile the replay and print the N most expensive functions")
+        parser.add_argument("--tracemalloc", action="store_true",
+                            help="also report peak Python heap usage (slows the replay)")
+        parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+    def process_options(self, args, opts):
+        ScrapyCommand.process_options(self, args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+        except ValueError:
+            raise UsageError("Invalid -a value, use -a NAME=VALUE", print_help=False)
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+
+        crawler = self.crawler_process.create_crawler(opts.spider_name)
+        profiler = cProfile.Profile() if opts.top_functions else None
+        if opts.tracemalloc:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+        report, golden = replay(crawler, opts.spargs, args[0], opts.repeat, not opts.no_pipeline)
+        if profiler:
+            profiler.disable()
+        if opts.tracemalloc:
+            report['peak_heap_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+        if opts.write_golden:
+            with open(opts.write_golden, "w") as f:
+                json.dump(golden, f, indent=1, sort_keys=True)
+
+        differences = []
+        if opts.golden:
+            with open(opts.golden) as f:
+                differences = compare_golden(json.load(f), golden)
+            report['golden_differences'] = len(differences)
+
+        if opts.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"{report['pages']} pages, {report['items']} items in {report['seconds']:.2f}s "
+                  f"({report['pages_per_sec']:.1f} pages/s), peak RSS {report['peak_rss_mb']:.0f}MB")
+            if 'peak_heap_mb' in report:
+                print(f"peak Python heap {report['peak_heap_mb']:.1f}MB")
+            for stage, summary in sorted(report['stages'].items()):
+                print(f"  {stage:10} total {report['stage_totals'][stage]:.3f}s  mean {summary['mean'] * 1000:.2f}ms  "
+                      f"p95 <= {summary['p95'] * 1000:g}ms")
+            for name, per_page in report['redis_calls_per_page'].items():
+                print(f"  redis {name:12} {per_page:.2f} calls/page")
+
+        for difference in differences:
+            print(f"GOLDEN {difference}")
+        if profiler:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(opts.top_functions)
+        if differences:
+            self.exitcode = 1
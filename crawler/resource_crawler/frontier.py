@@ -0,0 +1,807 @@
+"""
+Prioritized crawl frontier.
+
+URLs are scored at enqueue time from the signals the spiders already use
+(search query in the URL, priority domains, valuable URL patterns, the
+quality score of the page that linked to them and their depth). The
+standalone spider turns the score into a Scrapy request priority, the
+distributed spider pushes it into a Redis sorted set shared by all workers
+so the coordinator always hands out the most valuable URLs first.
+
+Each entry also carries the URL's registered domain, which the coordinator
+maps to a worker on a consistent-hash ring. A site's pages therefore all go
+to one worker, and changing the worker count moves only about 1/N of the
+domains.
+
+The Lua scripts below keep the frontier, worker queues, job keys and crawl
+state consistent in one atomic step, so all crawler keys must live on one
+Redis node: Redis Cluster is not supported. Scripts pass the keys they can
+name up front in KEYS. The worker queue a URL is routed to and the keys of
+a query job depend on the entries the script reads, so DISTRIBUTE_SCRIPT,
+REQUEUE_SCRIPT and the job claim script build those from prefixes given in
+ARGV, which Redis only allows outside cluster mode.
+
+This module has no Scrapy dependency so the coordinator can import it.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from urllib.parse import urlparse
+
+try:
+    from redis.cluster import RedisCluster
+except ImportError:
+    RedisCluster = None
+
+logger = logging.getLogger(__name__)
+
+# Redis sorted set holding the shared distributed frontier
+FRONTIER_KEY = 'crawler:frontier'
+
+# Sets of hex MD5 hashes used for crawl state before it was bucketed; only
+# read by the migration in `scrapy crawl_state migrate`
+LEGACY_SEEN_KEY = 'crawler:seen_urls'
+LEGACY_VISITED_KEY = 'crawler:visited_urls'
+
+# Crawl state: which URLs were queued ("seen") and crawled ("visited")
+# within the revisit horizon. URLs are stored as 8-byte MD5 fragments in
+# small hashes, crawler:<kind>:<bucket>:<shard>, that Redis keeps in its
+# compact listpack encoding. The horizon is split into time buckets, and
+# each bucket's keys expire once the bucket falls outside the horizon, so
+# memory stays bounded and URLs can be revisited after the horizon.
+# crawler:<kind>:<bucket>:count counts the URLs added to a bucket.
+STATE_KEY_PREFIX = 'crawler:'
+STATE_KINDS = ('seen', 'visited')
+
+# Marks a page visited and queues its new links in one round trip. Every key
+# it touches is passed in KEYS: KEYS[1] is the frontier, KEYS[2] and KEYS[3]
+# the current bucket's visited and seen counters, KEYS[4] the job's seen set
+# when ARGV[3] = '1', then for each shard involved a block of its seen hashes
+# for the ARGV[2] buckets of the horizon, oldest first. ARGV[1] is the bucket
+# key TTL. ARGV[4] is the index in KEYS of the visited page's visited hash
+# (0 for none), ARGV[5] and ARGV[6] the block index and field of its seen
+# entry, followed by (block index, field, score, entry) groups for the
+# links. A link is queued only if it was not seen in any bucket of the
+# horizon. A query job's links are deduplicated against the job's seen set
+# instead, so a job can crawl pages the background crawl saw recently.
+# Returns the number of links queued.
+ENQUEUE_SCRIPT = """
+local ttl = ARGV[1]
+local buckets = tonumber(ARGV[2])
+local job_seen = ARGV[3] == '1' and KEYS[4] or nil
+local function add(key, count_key, field)
+    if redis.call('HSETNX', key, field, 1) == 1 then
+        if redis.call('HLEN', key) == 1 then
+            redis.call('EXPIRE', key, ttl)
+        end
+        if redis.call('INCR', count_key) == 1 then
+            redis.call('EXPIRE', count_key, ttl)
+        end
+    end
+end
+local function seen(block, field)
+    for i = block, block + buckets - 1 do
+        if redis.call('HEXISTS', KEYS[i], field) == 1 then
+            return true
+        end
+    end
+    return false
+end
+local function mark_seen(block, field)
+    add(KEYS[block + buckets - 1], KEYS[3], field)
+end
+local function new(block, field)
+    if job_seen then
+        local added = redis.call('SADD', job_seen, field) == 1
+        if redis.call('TTL', job_seen) < 0 then
+            redis.call('EXPIRE', job_seen, ttl)
+        end
+        return added
+    end
+    return not seen(block, field)
+end
+local visited = tonumber(ARGV[4])
+if visited > 0 then
+    local block, field = tonumber(ARGV[5]), ARGV[6]
+    add(KEYS[visited], KEYS[2], field)
+    if job_seen then
+        new(block, field)
+    end
+    if not seen(block, field) then
+        mark_seen(block, field)
+    end
+end
+local queued = 0
+for i = 7, #ARGV, 4 do
+    local block, field = tonumber(ARGV[i]), ARGV[i + 1]
+    if new(block, field) then
+        mark_seen(block, field)
+        redis.call('ZADD', KEYS[1], 'NX', ARGV[i + 2], ARGV[i + 3])
+        queued = queued + 1
+    end
+end
+return queued
+"""
+
+# Entries given up on after MAX_ATTEMPTS claims that never finished (e.g. a
+# page whose callback keeps failing or crashing the worker), newest first
+DEAD_LETTER_KEY = 'crawler:dead_letter'
+DEAD_LETTER_MAX = 10000
+MAX_ATTEMPTS = 3
+
+# Redis sorted set holding the consistent-hash ring: one member per virtual
+# node ("<worker_id>#<n>"), scored by its position on the ring
+RING_KEY = 'crawler:ring'
+
+# Virtual nodes per worker; more nodes spread domains more evenly
+RING_VNODES = 64
+
+# Prefix of the per-worker queues the coordinator routes URLs into
+WORKER_QUEUE_PREFIX = 'crawler:pending_urls:'
+
+# Prefix of the per-worker sorted sets of claimed but unacknowledged
+# entries, scored by the time their lease expires
+INFLIGHT_PREFIX = 'crawler:inflight:'
+
+# Prefix of the per-worker heartbeat hashes, which expire when a worker stops
+# refreshing them
+WORKER_STATUS_PREFIX = 'crawler:workers:'
+
+# Set of the IDs of workers that may have a queue, claims or a heartbeat, so
+# the coordinator and `top` find them without scanning the keyspace. Workers
+# add themselves with every heartbeat and the coordinator removes the ones
+# it has drained.
+WORKER_IDS_KEY = 'crawler:worker_ids'
+
+# Sorted set of running query jobs scored by submission time, the prefix of
+# their status hashes and the prefix of their own frontiers (see jobs.py)
+JOBS_KEY = 'crawler:jobs'
+JOB_PREFIX = 'crawler:job:'
+JOB_FRONTIER_PREFIX = 'crawler:frontier:job:'
+
+# Prefix of the per-job sets of the URLs a query job has queued or crawled,
+# which deduplicate its links in place of the shared crawl state
+JOB_SEEN_PREFIX = 'crawler:job_seen:'
+
+# Sorted set of crawled URLs scored by the time their re-crawl is due,
+# filled by IncrementalRecrawlMiddleware and drained by promote_due()
+RECRAWL_DUE_KEY = 'crawler:recrawl:due'
+
+# Capped Redis stream of newly indexed resources, each entry holding the
+# resource as JSON under 'data'. The streaming API follows it with a
+# consumer group and replays it to clients that reconnect.
+RESULTS_STREAM = 'search:results:stream'
+
+# Moves up to ARGV[1] entries from a worker queue (KEYS[1]) into its
+# in-flight set (KEYS[2]) with lease expiry ARGV[2]. Returns the entries.
+CLAIM_SCRIPT = """
+local entries = redis.call('LPOP', KEYS[1], ARGV[1])
+if not entries then
+    return {}
+end
+for _, raw in ipairs(entries) do
+    redis.call('ZADD', KEYS[2], ARGV[2], raw)
+end
+return entries
+"""
+
+# Puts in-flight entries (KEYS[1]) whose lease expired by ARGV[1] back into
+# the frontier (KEYS[3]) with the score they carry. With ARGV[2] = '1' the
+# worker queue (KEYS[2]) is drained into the frontier as well. Entries of a
+# query job ("j") go back into the job's frontier and budget instead, given
+# its ID is still in the running jobs set ARGV[3]; ARGV[4] and ARGV[5] are
+# the job hash and job frontier prefixes. With ARGV[7] = '1' each in-flight
+# entry counts an attempt ("a"); one that reached ARGV[6] attempts (0 for no
+# limit) goes to the dead-letter list KEYS[4], capped at ARGV[8] entries,
+# and counts as failed for its job. Returns {entries requeued, entries
+# dead-lettered}.
+REQUEUE_SCRIPT = """
+local max_attempts = tonumber(ARGV[6])
+local dead = 0
+local function requeue(raw, attempted)
+    local score, job = 0, nil
+    local ok, entry = pcall(cjson.decode, raw)
+    if ok and type(entry) == 'table' then
+        score = entry['s'] or 0
+        job = entry['j']
+        if attempted then
+            entry['a'] = (entry['a'] or 0) + 1
+            raw = cjson.encode(entry)
+            if max_attempts > 0 and entry['a'] >= max_attempts then
+                redis.call('LPUSH', KEYS[4], raw)
+                redis.call('LTRIM', KEYS[4], 0, tonumber(ARGV[8]) - 1)
+                if job then
+                    redis.call('HINCRBY', ARGV[4] .. job, 'failed', 1)
+                end
+                dead = dead + 1
+                return
+            end
+        end
+    end
+    if not job then
+        redis.call('ZADD', KEYS[3], score, raw)
+    elseif redis.call('ZSCORE', ARGV[3], job) then
+        redis.call('ZADD', ARGV[5] .. job, score, raw)
+        redis.call('HINCRBY', ARGV[4] .. job, 'dispatched', -1)
+    end
+end
+local attempted = ARGV[7] == '1'
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, raw in ipairs(expired) do
+    requeue(raw, attempted)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local count = #expired
+if ARGV[2] == '1' then
+    local pending = redis.call('LRANGE', KEYS[2], 0, -1)
+    for _, raw in ipairs(pending) do
+        requeue(raw, false)
+    end
+    redis.call('DEL', KEYS[2])
+    count = count + #pending
+end
+return {count - dead, dead}
+"""
+
+# Two-label public suffixes, enough for the sites this crawler sees. Hosting
+# suffixes are included so that each project site counts as its own domain.
+MULTI_LABEL_SUFFIXES = {
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'com.au', 'net.au', 'org.au',
+    'co.jp', 'co.in', 'co.nz', 'com.br', 'com.cn', 'co.kr',
+    'github.io', 'gitlab.io', 'readthedocs.io', 'blogspot.com',
+    'herokuapp.com', 'netlify.app', 'vercel.app', 'pages.dev',
+}
+
+# Routes the best entries to their workers' queues in one atomic step. The
+# routing key ("k", the registered domain, or the URL for older entries) is
+# hashed onto the ring in KEYS[2]; the first virtual node at or after that
+# point owns it. KEYS[1] is the frontier. ARGV[1] is the number of entries to
+# route, ARGV[2] the maximum worker queue length, ARGV[3] the worker queue
+# prefix and ARGV[4] the most entries to look at. Entries whose worker's
+# queue is full stay where they are and the scan goes on deeper into the
+# frontier, so one busy domain at the top cannot starve the other workers.
+# It stops early once every worker's queue is full.
+# Returns {routed, skipped}.
+DISTRIBUTE_SCRIPT = """
+local nodes = redis.call('ZRANGE', KEYS[2], 0, -1)
+if #nodes == 0 then
+    return {0, 0}
+end
+local workers = {}
+local worker_count = 0
+for _, node in ipairs(nodes) do
+    local name = string.match(node, '^(.*)#')
+    if not workers[name] then
+        workers[name] = true
+        worker_count = worker_count + 1
+    end
+end
+local count = tonumber(ARGV[1])
+local max_queue = tonumber(ARGV[2])
+local scan = tonumber(ARGV[4])
+local routed, skipped, seen, offset = 0, 0, 0, 0
+local owners = {}
+local full = {}
+local full_count = 0
+local chunk = math.min(count, 1000)
+while routed < count and seen < scan and full_count < worker_count do
+    local entries = redis.call('ZREVRANGE', KEYS[1], offset, offset + chunk - 1)
+    if #entries == 0 then
+        break
+    end
+    for _, raw in ipairs(entries) do
+        if routed >= count or seen >= scan or full_count >= worker_count then
+            break
+        end
+        seen = seen + 1
+        local key = raw
+        local ok, entry = pcall(cjson.decode, raw)
+        if ok and type(entry) == 'table' then
+            key = entry['k'] or entry['u'] or raw
+        end
+        local worker = owners[key]
+        if not worker then
+            local point = tonumber(string.sub(redis.sha1hex(key), 1, 8), 16)
+            local node = redis.call('ZRANGEBYSCORE', KEYS[2], point, '+inf', 'LIMIT', 0, 1)[1] or nodes[1]
+            worker = string.match(node, '^(.*)#')
+            owners[key] = worker
+        end
+        local queue = ARGV[3] .. worker
+        if not full[worker] and redis.call('LLEN', queue) < max_queue then
+            redis.call('RPUSH', queue, raw)
+            redis.call('ZREM', KEYS[1], raw)
+            routed = routed + 1
+        else
+            if not full[worker] then
+                full[worker] = true
+                full_count = full_count + 1
+            end
+            -- Left in place, so the next chunk starts after it
+            offset = offset + 1
+            skipped = skipped + 1
+        end
+    end
+end
+return {routed, skipped}
+"""
+
+# Domains that are always worth following
+PRIORITY_DOMAINS = [
+    # General programming sites
+    'github.com', 'stackoverflow.com', 'dev.to', 'medium.com',
+    'freecodecamp.org', 'realpython.com', 'digitalocean.com',
+    'tutorialspoint.com', 'w3schools.com', 'mozilla.org', 'youtube.com',
+    'reddit.com', 'hackernews.com', 'substack.com', 'docs.google.com',
+    'kubernetes.io', 'docker.com', 'python.org', 'reactjs.org',
+    'angular.io', 'vuejs.org', 'rust-lang.org', 'golang.org',
+    'developer.mozilla.org', 'aws.amazon.com', 'cloud.google.com',
+    'docs.microsoft.com', 'graphql.org', 'postgresql.org', 'mysql.com',
+
+    # Legacy language resources
+    'ibm.com', 'mainframestechhelp.com', 'microfocus.com', 'borland.com',
+    'fortran-lang.org', 'cobol.com', 'mainframegurukul.com', 'cobolforgcc.com',
+    'clarabridge.com', 'netcobol.com', 'ibm.github.io', 'legacy.cplusplus.com',
+    'sourcecodesworld.com', 'findbestopensource.com', 'alternet.cobol.com',
+    'opencobol.org', 'fujitsu.com', 'visualcobol.net', 'jics.macc.wisc.edu',
+    'fortranplus.co.uk', 'netlib.org', 'fortran.com', 'gfortran.com',
+    'j3-fortran.org', 'gcc.gnu.org', 'cse.yorku.ca',
+
+    # Academic resources
+    'scholar.google.com', 'arxiv.org', 'dl.acm.org', 'ieeexplore.ieee.org',
+    'academia.edu', 'researchgate.net', 'mit.edu', 'stanford.edu',
+    'berkeley.edu', 'cam.ac.uk', 'ox.ac.uk', 'harvard.edu', 'princeton.edu',
+
+    # Documentation and references
+    'devdocs.io', 'readthedocs.io', 'docs.oracle.com', 'wikiwand.com',
+    'cppreference.com', 'manual.com', 'docs.rs', 'dartdocs.org',
+    'apidock.com', 'jsdoc.app', 'kotlinlang.org', 'scaladoc.org',
+
+    # Books and learning resources
+    'oreilly.com', 'manning.com', 'packtpub.com', 'informit.com',
+    'apress.com', 'wiley.com', 'springer.com', 'pragprog.com',
+    'edx.org', 'coursera.org', 'udemy.com', 'pluralsight.com',
+    'khanacademy.org', 'codecademy.com', 'udacity.com',
+
+    # Additional forums and community sites
+    'hashnode.com', 'lobste.rs', 'slashdot.org', 'infoq.com',
+    'codingforums.com', 'quora.com', 'sitepoint.com', 'dzone.com'
+]
+
+# URL keywords that suggest valuable content
+VALUABLE_URL_PATTERNS = [
+    'tutorial', 'guide', 'learn', 'how-to', 'lesson',
+    'example', 'documentation', 'reference', 'course',
+    'manual', 'handbook', 'getting-started', 'intro',
+    'cheatsheet', 'cookbook', 'primer', 'samples',
+    'snippets', 'library', 'framework', 'language',
+    'spec', 'standard', 'book', 'ebook', 'workshop',
+    'specification', 'resources', 'cheat-sheet',
+    'cobol', 'fortran', 'mainframe', 'compiler',
+    'interpreter', 'coding', 'programming', 'developer'
+]
+
+# URL keywords for navigation and listing pages that rarely hold resources
+LOW_VALUE_URL_PATTERNS = [
+    '/tag/', '/tags/', '/tagged/', '/topics/', '/category/', '/categories/',
+    '/users/', '/user/', '/author/', '/login', '/signup', '/register',
+    '/search', '?page=', '&page=', '?sort=', '&sort=', '?tab=', '/archive'
+]
+
+# Weights of the individual scoring signals
+SCORE_WEIGHTS = {
+    'base': 0.1,
+    'query_in_url': 0.3,
+    'priority_domain': 0.2,
+    'valuable_pattern': 0.2,
+    'parent_quality': 0.2,
+    'low_value_pattern': -0.2,
+}
+
+# Each level of depth shrinks the score by this factor
+DEPTH_DECAY = 0.9
+
+
+def score_url(url, search_query=None, parent_quality=None, depth=0):
+    """
+    Score a URL for the frontier, higher is more valuable.
+
+    Args:
+        url (str): Absolute URL to score
+        search_query (str): Query the crawl is running for, if any
+        parent_quality (float): Quality score of the page linking to the URL
+        depth (int): Link depth of the URL from the seeds
+
+    Returns:
+        float: Score between 0 and 1
+    """
+    lowered = url.lower()
+    url_domain = urlparse(lowered).netloc
+
+    score = SCORE_WEIGHTS['base']
+    if search_query and search_query.lower() in lowered:
+        score += SCORE_WEIGHTS['query_in_url']
+    if any(domain in url_domain for domain in PRIORITY_DOMAINS):
+        score += SCORE_WEIGHTS['priority_domain']
+    if any(pattern in lowered for pattern in VALUABLE_URL_PATTERNS):
+        score += SCORE_WEIGHTS['valuable_pattern']
+    if any(pattern in lowered for pattern in LOW_VALUE_URL_PATTERNS):
+        score += SCORE_WEIGHTS['low_value_pattern']
+    if parent_quality:
+        score += SCORE_WEIGHTS['parent_quality'] * parent_quality
+
+    score *= DEPTH_DECAY ** depth
+    return max(0.0, min(1.0, score))
+
+
+def url_priority(score):
+    """Convert a frontier score into an integer Scrapy request priority"""
+    return int(round(score * 100))
+
+
+def registered_domain(url):
+    """Registered domain of a URL's host, e.g. docs.python.org -> python.org"""
+    host = (urlparse(url).hostname or '').lower()
+    labels = host.split('.')
+    if len(labels) <= 2 or host.replace('.', '').isdigit():
+        return host
+    if '.'.join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def url_hash(url):
+    """Hash identifying a URL in the crawl state"""
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def publish_result(client, resource, maxlen):
+    """Append a new resource to the results stream, keeping about its last maxlen entries"""
+    return client.xadd(RESULTS_STREAM, {'data': json.dumps(resource)}, maxlen=maxlen, approximate=True)
+
+
+class CrawlState:
+    """Layout of the time-bucketed crawl state for a revisit horizon"""
+
+    def __init__(self, horizon_days=30, buckets=4, shard_bits=16):
+        self.buckets = buckets
+        self.bucket_seconds = int(horizon_days * 86400 / buckets)
+        self.shard_bits = shard_bits
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.getfloat('CRAWL_STATE_HORIZON_DAYS', 30),
+            settings.getint('CRAWL_STATE_BUCKETS', 4),
+            settings.getint('CRAWL_STATE_SHARD_BITS', 16)
+        )
+
+    @property
+    def ttl(self):
+        # A bucket lives until the last URL added to it leaves the horizon
+        return self.bucket_seconds * (self.buckets + 1)
+
+    def current_bucket(self, now=None):
+        return int((now or time.time()) // self.bucket_seconds)
+
+    def live_buckets(self, now=None):
+        current = self.current_bucket(now)
+        return list(range(current - self.buckets + 1, current + 1))
+
+    def locate(self, hex_digest):
+        """
+        Shard and field of a URL hash.
+
+        Returns:
+            tuple: (shard as hex string, 8-byte field)
+        """
+        digest = bytes.fromhex(hex_digest)
+        shard = int.from_bytes(digest[:4], 'big') >> (32 - self.shard_bits)
+        return format(shard, 'x'), digest[4:12]
+
+    def key(self, kind, bucket, shard):
+        return f'{STATE_KEY_PREFIX}{kind}:{bucket}:{shard}'
+
+    def count(self, client, kind):
+        """Number of URLs added to a kind of state within the horizon"""
+        counts = client.mget([f'{STATE_KEY_PREFIX}{kind}:{bucket}:count' for bucket in self.live_buckets()])
+        return sum(int(count) for count in counts if count)
+
+    def migrate(self, client, delete=False, batch=1000):
+        """
+        Copy the legacy seen and visited sets into the current bucket.
+
+        Returns:
+            dict: URLs copied per kind
+        """
+        bucket = self.current_bucket()
+        migrated = {}
+        for kind, legacy_key in zip(STATE_KINDS, (LEGACY_SEEN_KEY, LEGACY_VISITED_KEY)):
+            copied = 0
+            members = []
+            for member in client.sscan_iter(legacy_key, count=batch):
+                members.append(member.decode() if isinstance(member, bytes) else member)
+                if len(members) >= batch:
+                    copied += self._migrate_batch(client, kind, bucket, members)
+                    members = []
+            if members:
+                copied += self._migrate_batch(client, kind, bucket, members)
+            if copied:
+                count_key = f'{STATE_KEY_PREFIX}{kind}:{bucket}:count'
+                client.expire(count_key, self.ttl)
+            if delete:
+                client.unlink(legacy_key)
+            migrated[kind] = copied
+        return migrated
+
+    def _migrate_batch(self, client, kind, bucket, members):
+        keys = set()
+        with client.pipeline(transaction=False) as pipe:
+            for member in members:
+                shard, field = self.locate(member)
+                key = self.key(kind, bucket, shard)
+                pipe.hsetnx(key, field, 1)
+                keys.add(key)
+            added = sum(pipe.execute())
+            for key in keys:
+                pipe.expire(key, self.ttl)
+            pipe.incrby(f'{STATE_KEY_PREFIX}{kind}:{bucket}:count', added)
+            pipe.execute()
+        return added
+
+    def memory_report(self, client, sample=200):
+        """
+        Estimate the memory used by the crawl state.
+
+        MEMORY USAGE is read for up to `sample` keys of each kind and
+        extrapolated to all of its keys.
+
+        Returns:
+            dict: Per kind, the URL count, key count and estimated bytes,
+            plus the bytes held by legacy sets and Redis' used_memory
+        """
+        report = {}
+        for kind in STATE_KINDS:
+            keys = [
+                key for key in client.scan_iter(match=f'{STATE_KEY_PREFIX}{kind}:*', count=1000)
+                if not key.endswith(b':count')
+            ]
+            sampled = keys[:sample]
+            with client.pipeline(transaction=False) as pipe:
+                for key in sampled:
+                    pipe.memory_usage(key)
+                usages = [usage or 0 for usage in pipe.execute()]
+            estimated = sum(usages) * len(keys) // len(sampled) if sampled else 0
+            urls = self.count(client, kind)
+            report[kind] = {
+                'urls': urls,
+                'keys': len(keys),
+                'bytes': estimated,
+                'bytes_per_url': round(estimated / urls, 1) if urls else 0.0,
+            }
+        report['legacy_bytes'] = sum(
+            client.memory_usage(key) or 0 for key in (LEGACY_SEEN_KEY, LEGACY_VISITED_KEY) if client.exists(key)
+        )
+        report['used_memory'] = client.info('memory').get('used_memory', 0)
+        return report
+
+
+def ring_point(value):
+    """Position of a value on the hash ring, computed as in DISTRIBUTE_SCRIPT"""
+    return int(hashlib.sha1(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def encode_entry(url, depth=0, score=0.0, job=None, recrawl=False, attempts=0):
+    """Serialize a frontier entry for storage in Redis, tagged with its query job, whether it is a revisit and its attempts"""
+    data = {'u': url, 'd': depth, 's': round(score, 4), 'k': registered_domain(url)}
+    if job:
+        data['j'] = job
+    if recrawl:
+        data['r'] = 1
+    if attempts:
+        data['a'] = attempts
+    return json.dumps(data, separators=(',', ':'))
+
+
+def decode_entry(raw):
+    """
+    Deserialize a frontier entry read from Redis.
+
+    Plain URLs (as pushed by older workers) are accepted as well.
+
+    Returns:
+        dict: Entry with 'url', 'depth', 'score', 'domain', 'job', 'recrawl' and 'attempts' keys
+    """
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8')
+    if raw.startswith('{'):
+        data = json.loads(raw)
+        return {
+            'url': data['u'],
+            'depth': data.get('d', 0),
+            'score': data.get('s', 0.0),
+            'domain': data.get('k') or registered_domain(data['u']),
+            'job': data.get('j'),
+            'recrawl': bool(data.get('r')),
+            'attempts': data.get('a', 0),
+        }
+    return {
+        'url': raw, 'depth': 0, 'score': 0.0, 'domain': registered_domain(raw), 'job': None, 'recrawl': False,
+        'attempts': 0,
+    }
+
+
+class RedisFrontier:
+    """Frontier stored in a Redis sorted set, popped highest score first"""
+
+    def __init__(self, redis_client, key=FRONTIER_KEY, state=None):
+        if RedisCluster is not None and isinstance(redis_client, RedisCluster):
+            raise ValueError("The crawl frontier needs all crawler keys on one Redis node, not a Redis Cluster")
+        self.redis = redis_client
+        self.key = key
+        self.state = state or CrawlState()
+        self.enqueue_script = redis_client.register_script(ENQUEUE_SCRIPT)
+        self.distribute_script = redis_client.register_script(DISTRIBUTE_SCRIPT)
+        self.claim_script = redis_client.register_script(CLAIM_SCRIPT)
+        self.requeue_script = redis_client.register_script(REQUEUE_SCRIPT)
+
+    def push(self, url, score, depth=0):
+        """Add a URL to the frontier, keeping the first score it was queued with"""
+        self.redis.zadd(self.key, {encode_entry(url, depth, score): score}, nx=True)
+
+    def enqueue(self, links, visited_url=None, client=None, job=None):
+        """
+        Queue the links not seen before, and mark a page visited, in one call.
+
+        Args:
+            links: Iterable of (url, score, depth) tuples
+            visited_url (str): URL of the page the links were found on
+            client: Redis pipeline to add the call to instead of running it now
+            job (str): Query job whose frontier the links go to, instead of
+                the shared frontier. Its links are deduplicated per job.
+
+        Returns:
+            int: Number of links queued, or the pipeline when one was given
+        """
+        state = self.state
+        bucket = state.current_bucket()
+        live = state.live_buckets()
+        keys = [JOB_FRONTIER_PREFIX + job if job else self.key,
+                state.key('visited', bucket, 'count'), state.key('seen', bucket, 'count')]
+        if job:
+            keys.append(JOB_SEEN_PREFIX + job)
+        blocks = {}
+
+        def block(shard):
+            # Index in KEYS of the shard's seen hashes, added on first use
+            if shard not in blocks:
+                blocks[shard] = len(keys) + 1
+                keys.extend(state.key('seen', b, shard) for b in live)
+            return blocks[shard]
+
+        args = [state.ttl, state.buckets, '1' if job else '0']
+        if visited_url:
+            shard, field = state.locate(url_hash(visited_url))
+            keys.append(state.key('visited', bucket, shard))
+            args.extend((len(keys), block(shard), field))
+        else:
+            args.extend((0, 0, ''))
+        for url, score, depth in links:
+            shard, field = state.locate(url_hash(url))
+            args.extend((block(shard), field, score, encode_entry(url, depth, score, job)))
+        return self.enqueue_script(keys=keys, args=args, client=client)
+
+    def promote_due(self, count, now=None):
+        """
+        Move up to count URLs whose re-crawl is due from the due set into the frontier.
+
+        Revisits skip the crawl state check, which only knows the URLs were
+        seen before.
+
+        Returns:
+            int: Number of URLs queued
+        """
+        urls = self.redis.zrangebyscore(RECRAWL_DUE_KEY, '-inf', now or time.time(), start=0, num=count)
+        if not urls:
+            return 0
+        entries = {}
+        for url in urls:
+            url = url.decode() if isinstance(url, bytes) else url
+            score = score_url(url)
+            entries[encode_entry(url, 0, score, recrawl=True)] = score
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(RECRAWL_DUE_KEY, *urls)
+            pipe.zadd(self.key, entries, nx=True)
+            pipe.execute()
+        return len(urls)
+
+    def pop(self, count=1):
+        """
+        Pop the highest scoring entries.
+
+        Returns:
+            list: Tuples of (raw entry, decoded entry)
+        """
+        popped = self.redis.zpopmax(self.key, count)
+        return [(raw, decode_entry(raw)) for raw, _ in popped]
+
+    def set_ring(self, worker_ids, vnodes=RING_VNODES, key=RING_KEY):
+        """Replace the consistent-hash ring with virtual nodes for the given workers"""
+        nodes = {f'{worker_id}#{i}': ring_point(f'{worker_id}#{i}') for worker_id in worker_ids for i in range(vnodes)}
+        with self.redis.pipeline() as pipe:
+            pipe.delete(key)
+            if nodes:
+                pipe.zadd(key, nodes)
+            pipe.execute()
+
+    def distribute(self, count, max_queue, ring_key=RING_KEY, queue_prefix=WORKER_QUEUE_PREFIX, scan=None):
+        """
+        Atomically move up to count of the best entries into worker queues.
+
+        Each entry goes to the worker owning its registered domain on the
+        ring set with set_ring(). Entries for a full queue are skipped and
+        left in the frontier, looking at up to scan entries (10 * count by
+        default) to fill the other queues.
+
+        Returns:
+            tuple: (entries routed, entries skipped because their queue was full)
+        """
+        scan = scan or count * 10
+        routed, skipped = self.distribute_script(
+            keys=[self.key, ring_key], args=[count, max_queue, queue_prefix, scan]
+        )
+        return routed, skipped
+
+    def claim(self, worker_id, count, lease):
+        """
+        Atomically move up to count entries from a worker's queue to its in-flight set.
+
+        Claimed entries stay in flight until ack() removes them or their
+        lease of `lease` seconds expires and requeue() returns them to the
+        frontier.
+
+        Returns:
+            list: Tuples of (raw entry, decoded entry)
+        """
+        raw_entries = self.claim_script(
+            keys=[WORKER_QUEUE_PREFIX + worker_id, INFLIGHT_PREFIX + worker_id], args=[count, time.time() + lease]
+        )
+        return [(raw, decode_entry(raw)) for raw in raw_entries]
+
+    def ack(self, worker_id, raw_entries, client=None):
+        """Remove finished entries from a worker's in-flight set"""
+        return (client or self.redis).zrem(INFLIGHT_PREFIX + worker_id, *raw_entries)
+
+    def requeue(self, worker_id, expired_before=None, drain_queue=False, max_attempts=MAX_ATTEMPTS, attempted=True):
+        """
+        Return a worker's unfinished entries to the frontier.
+
+        Args:
+            worker_id (str): Worker whose entries to requeue
+            expired_before (float): Requeue in-flight entries with leases
+                expiring before this time; all of them when None
+            drain_queue (bool): Also move the worker's whole queue back
+            max_attempts (int): Claims after which an in-flight entry goes to
+                the dead-letter list instead, 0 for no limit
+            attempted (bool): Count an attempt for each in-flight entry;
+                False when a worker hands back work it did not start
+
+        Entries of running query jobs go back to their job's frontier.
+
+        Returns:
+            int: Number of entries requeued
+        """
+        requeued, dead = self.requeue_script(
+            keys=[INFLIGHT_PREFIX + worker_id, WORKER_QUEUE_PREFIX + worker_id, self.key, DEAD_LETTER_KEY],
+            args=[
+                '+inf' if expired_before is None else expired_before, '1' if drain_queue else '0',
+                JOBS_KEY, JOB_PREFIX, JOB_FRONTIER_PREFIX, max_attempts, '1' if attempted else '0', DEAD_LETTER_MAX
+            ]
+        )
+        if dead:
+            logger.warning(f"Dead-lettered {dead} entries of {worker_id} after {max_attempts} attempts")
+        return requeued
+
+    def __len__(self):
+        return self.redis.zcard(self.key)
@@ -0,0 +1,237 @@
+"""
+Size-bounded HTTP cache storage.
+
+Replaces Scrapy's FilesystemCacheStorage, which writes one directory tree per
+request and never shrinks, with a single SQLite file. Headers and bodies are
+stored zlib-compressed, entries expire after a per-domain TTL and the least
+recently used entries are evicted once the cache grows past HTTPCACHE_MAX_SIZE.
+
+Enable it with:
+
+    HTTPCACHE_STORAGE = 'resource_crawler.httpcache.SQLiteCacheStorage'
+
+Hit rate and space used are shown by `scrapy httpcache_stats`.
+"""
+
+import logging
+import pickle
+import sqlite3
+import zlib
+from pathlib import Path
+from time import time
+from urllib.parse import urlparse
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILENAME = 'httpcache.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def connect(path):
+    """Open the cache database, creating the schema if needed"""
+    db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+    # Must be set before the first table is created to take effect
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.executescript(SCHEMA)
+    return db
+
+
+def domain_ttl(domain, domain_ttls, default_ttl):
+    """Return the TTL for a domain, matching subdomains of configured domains"""
+    for configured, ttl in domain_ttls.items():
+        if domain == configured or domain.endswith('.' + configured):
+            return int(ttl)
+    return default_ttl
+
+
+def cache_stats(path):
+    """
+    Collect usage statistics from a cache database.
+
+    Args:
+        path (str): Path to the SQLite cache file
+
+    Returns:
+        dict: Entry count, stored and file sizes, hit rate and top domains
+    """
+    db = connect(path)
+    try:
+        entries, stored_bytes = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        counters = dict(db.execute('SELECT name, value FROM counters').fetchall())
+        domains = db.execute(
+            'SELECT domain, COUNT(*), SUM(size) FROM responses '
+            'GROUP BY domain ORDER BY SUM(size) DESC LIMIT 10'
+        ).fetchall()
+    finally:
+        db.close()
+
+    hits = counters.get('hits', 0)
+    misses = counters.get('misses', 0)
+    lookups = hits + misses
+    return {
+        'entries': entries,
+        'stored_bytes': stored_bytes,
+        'file_bytes': Path(path).stat().st_size,
+        'hits': hits,
+        'misses': misses,
+        'expired': counters.get('expired', 0),
+        'evicted': counters.get('evicted', 0),
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'top_domains': [
+            {'domain': domain, 'entries': count, 'bytes': size}
+            for domain, count, size in domains
+        ],
+    }
+
+
+class SQLiteCacheStorage:
+    """
+    HTTP cache storage backed by a single SQLite file.
+
+    Settings:
+        HTTPCACHE_EXPIRATION_SECS: Default TTL, 0 means never expire
+        HTTPCACHE_DOMAIN_TTLS: Dict of domain -> TTL overriding the default
+        HTTPCACHE_MAX_SIZE: Maximum compressed size in bytes, 0 disables eviction
+        HTTPCACHE_COMPRESSION_LEVEL: zlib compression level
+    """
+
+    # Persist hit/miss counters after this many lookups
+    counter_flush_interval = 100
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.domain_ttls = settings.getdict('HTTPCACHE_DOMAIN_TTLS')
+        self.max_size = settings.getint('HTTPCACHE_MAX_SIZE', 0)
+        self.compression_level = settings.getint('HTTPCACHE_COMPRESSION_LEVEL', 6)
+        self.db = None
+        self._total_size = 0
+        self._counters = {}
+
+    def open_spider(self, spider):
+        dbpath = Path(self.cachedir, CACHE_FILENAME)
+        self.db = connect(dbpath)
+        self._total_size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        logger.debug(
+            "Using SQLite cache storage in %(cachepath)s",
+            {'cachepath': dbpath},
+            extra={'spider': spider},
+        )
+
+        self._fingerprinter = spider.crawler.request_fingerprinter
+
+    def close_spider(self, spider):
+        self._flush_counters()
+        self.db.close()
+
+    def retrieve_response(self, spider, request):
+        """Return response if present in cache, or None otherwise."""
+        key = self._fingerprinter.fingerprint(request).hex()
+        row = self.db.execute(
+            'SELECT url, domain, status, headers, body, stored_at FROM responses WHERE fingerprint = ?',
+            (key,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+
+        url, domain, status, headers, body, stored_at = row
+        ttl = domain_ttl(domain, self.domain_ttls, self.expiration_secs)
+        if 0 < ttl < time() - stored_at:
+            self._count('misses')
+            self._count('expired')
+            return None
+
+        self._count('hits')
+        self.db.execute('UPDATE responses SET accessed_at = ? WHERE fingerprint = ?', (time(), key))
+
+        headers = Headers(pickle.loads(zlib.decompress(headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        """Store the given response in the cache."""
+        key = self._fingerprinter.fingerprint(request).hex()
+        headers = zlib.compress(pickle.dumps(dict(response.headers), protocol=4), self.compression_level)
+        body = zlib.compress(response.body, self.compression_level)
+        size = len(headers) + len(body)
+        now = time()
+
+        previous = self.db.execute('SELECT size FROM responses WHERE fingerprint = ?', (key,)).fetchone()
+        self.db.execute(
+            'INSERT OR REPLACE INTO responses '
+            '(fingerprint, url, domain, status, headers, body, size, stored_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, response.url, urlparse(response.url).netloc, response.status, headers, body, size, now, now)
+        )
+        self._total_size += size - (previous[0] if previous else 0)
+
+        if self.max_size and self._total_size > self.max_size:
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is 90% of its cap"""
+        # Other crawler processes share the file, so refresh the size first
+        self._total_size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        target = int(self.max_size * 0.9)
+        evicted = 0
+
+        while self._total_size > target:
+            rows = self.db.execute(
+                'SELECT fingerprint, size FROM responses ORDER BY accessed_at LIMIT 500'
+            ).fetchall()
+            if not rows:
+                break
+            self.db.execute('BEGIN')
+            for fingerprint, size in rows:
+                self.db.execute('DELETE FROM responses WHERE fingerprint = ?', (fingerprint,))
+                self._total_size -= size
+                evicted += 1
+                if self._total_size <= target:
+                    break
+            self.db.execute('COMMIT')
+
+        self.db.execute('PRAGMA incremental_vacuum')
+        self._count('evicted', evicted)
+        logger.info(f"Evicted {evicted} entries from HTTP cache, {self._total_size} bytes remaining")
+
+    def _count(self, name, value=1):
+        self._counters[name] = self._counters.get(name, 0) + value
+        if self._counters.get('hits', 0) + self._counters.get('misses', 0) >= self.counter_flush_interval:
+            self._flush_counters()
+
+    def _flush_counters(self):
+        if not self._counters:
+            return
+        counters, self._counters = self._counters, {}
+        self.db.executemany(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            counters.items()
+        )
@@ -0,0 +1,335 @@
+"""
+Crawl stage instrumentation.
+
+CrawlInstrumentation is a Scrapy extension that records latency histograms
+per stage (download, parse, classify, extract, pipeline) and per domain,
+counts pages, items and bytes, and samples queue depths. Every
+METRICS_INTERVAL seconds it publishes a JSON snapshot to the Redis key
+crawler:metrics:<instance> and, when METRICS_FILE is set, a Prometheus text
+file. The snapshot also lists the slowest pages and, with
+METRICS_PROFILE_SELECTORS, the most expensive selector rules.
+
+Spiders and pipelines record stages with the timed() context manager, which
+does nothing when the extension is disabled. `scrapy crawl_metrics` prints
+the published snapshots.
+"""
+
+import heapq
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import redis
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = 'crawler:metrics:'
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class CrawlMetrics:
+    """In-process registry of stage latencies, counters and expensive pages and rules"""
+
+    def __init__(self, slowest_size=20, profile_selectors=False, max_domain_stages=2000):
+        self.stages = {}
+        # (stage, domain) histograms, least recently observed first, capped
+        # at max_domain_stages so an open-ended crawl doesn't grow it forever
+        self.domain_stages = OrderedDict()
+        self.max_domain_stages = max_domain_stages
+        self.counters = {}
+        self.slowest_size = slowest_size
+        self.slowest = []
+        self.profile_selectors = profile_selectors
+        self.selectors = {}
+
+    def observe(self, stage, seconds, url=None):
+        self.stages.setdefault(stage, Histogram()).observe(seconds)
+        if url:
+            domain = urlparse(url).netloc
+            key = (stage, domain)
+            histogram = self.domain_stages.get(key)
+            if histogram is None:
+                histogram = self.domain_stages[key] = Histogram()
+                if len(self.domain_stages) > self.max_domain_stages:
+                    self.domain_stages.popitem(last=False)
+            else:
+                self.domain_stages.move_to_end(key)
+            histogram.observe(seconds)
+            entry = (seconds, stage, url)
+            if len(self.slowest) < self.slowest_size:
+                heapq.heappush(self.slowest, entry)
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def observe_selector(self, rule, seconds):
+        count, total = self.selectors.get(rule, (0, 0.0))
+        self.selectors[rule] = (count + 1, total + seconds)
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def slowest_pages(self):
+        return [
+            {'seconds': seconds, 'stage': stage, 'url': url}
+            for seconds, stage, url in sorted(self.slowest, reverse=True)
+        ]
+
+    def expensive_selectors(self, limit=20):
+        ranked = sorted(self.selectors.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'rule': rule, 'calls': count, 'total': total, 'mean': total / count}
+            for rule, (count, total) in ranked[:limit]
+        ]
+
+    def prometheus(self, instance, snapshot=None, domain_limit=0):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Stage histograms are exported across all domains. Per-domain
+        histograms are only exported for the domain_limit busiest of the
+        recently seen domains, to bound the number of series. The rates and queue depths of a
+        snapshot() are exported as gauges.
+        """
+        lines = [
+            '# HELP resource_crawler_stage_seconds Latency of crawl stages',
+            '# TYPE resource_crawler_stage_seconds histogram',
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            labels = f'instance="{instance}",stage="{stage}"'
+            lines.extend(histogram_lines('resource_crawler_stage_seconds', labels, histogram))
+
+        if domain_limit:
+            busiest = heapq.nlargest(domain_limit, self.domain_stages.items(), key=lambda item: item[1].count)
+            lines.append('# HELP resource_crawler_domain_stage_seconds Latency of crawl stages for the busiest domains')
+            lines.append('# TYPE resource_crawler_domain_stage_seconds histogram')
+            for (stage, domain), histogram in sorted(busiest):
+                labels = f'instance="{instance}",stage="{stage}",domain="{domain}"'
+                lines.extend(histogram_lines('resource_crawler_domain_stage_seconds', labels, histogram))
+
+        lines.append('# TYPE resource_crawler_total counter')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'resource_crawler_total{{instance="{instance}",name="{name}"}} {value}')
+
+        if snapshot:
+            lines.append('# HELP resource_crawler_rate Pages, items and bytes per second since the last snapshot')
+            lines.append('# TYPE resource_crawler_rate gauge')
+            for name, value in sorted(snapshot['rates'].items()):
+                lines.append(f'resource_crawler_rate{{instance="{instance}",name="{name}"}} {value}')
+            lines.append('# HELP resource_crawler_queue_depth Requests waiting in each queue')
+            lines.append('# TYPE resource_crawler_queue_depth gauge')
+            for name, value in sorted(snapshot['queues'].items()):
+                lines.append(f'resource_crawler_queue_depth{{instance="{instance}",queue="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def histogram_lines(name, labels, histogram):
+    """Prometheus bucket, sum and count lines of a histogram"""
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+@contextmanager
+def timed(spider, stage, url=None):
+    """Record the time spent in a block as a stage latency, if instrumentation is on"""
+    metrics = getattr(spider, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(stage, time.perf_counter() - start, url)
+
+
+def match_any_rule(spider, response, rules):
+    """
+    Return True as soon as one selector rule matches the response.
+
+    Rules are ('css', query) or ('xpath', query) tuples, evaluated in order.
+    Each rule is timed when selector profiling is on.
+    """
+    metrics = getattr(spider, 'metrics', None)
+    profile = metrics is not None and metrics.profile_selectors
+    for kind, query in rules:
+        select = response.css if kind == 'css' else response.xpath
+        if profile:
+            start = time.perf_counter()
+            matched = bool(select(query))
+            metrics.observe_selector(f'{kind}:{query}', time.perf_counter() - start)
+        else:
+            matched = bool(select(query))
+        if matched:
+            return True
+    return False
+
+
+class CrawlInstrumentation:
+    """Scrapy extension publishing per-stage crawl metrics to Redis and a Prometheus file"""
+
+    def __init__(self, crawler, redis_client, interval, metrics_file, profile_selectors, file_domains=0,
+                 max_domain_stages=2000):
+        self.crawler = crawler
+        self.redis = redis_client
+        self.interval = interval
+        self.metrics_file = metrics_file
+        self.file_domains = file_domains
+        self.metrics = CrawlMetrics(profile_selectors=profile_selectors, max_domain_stages=max_domain_stages)
+        self.loop = None
+        self.instance = None
+        self.last_publish = None
+        self.last_counters = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        redis_client = redis.Redis(host=settings.get('REDIS_HOST', 'redis'), port=settings.getint('REDIS_PORT', 6379))
+        ext = cls(
+            crawler,
+            redis_client,
+            settings.getfloat('METRICS_INTERVAL', 10.0),
+            settings.get('METRICS_FILE'),
+            settings.getbool('METRICS_PROFILE_SELECTORS'),
+            settings.getint('METRICS_FILE_DOMAINS', 0),
+            settings.getint('METRICS_MAX_DOMAIN_STAGES', 2000)
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        return ext
+
+    def spider_opened(self, spider):
+        self.instance = getattr(spider, 'worker_id', None) or f'{spider.name}_{os.getpid()}'
+        spider.metrics = self.metrics
+        self.last_publish = time.monotonic()
+        self.loop = task.LoopingCall(self.publish, spider)
+        self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        self.publish(spider)
+        for page in self.metrics.slowest_pages()[:5]:
+            logger.info(f"Slow page: {page['url']} {page['stage']} {page['seconds']:.3f}s")
+        for rule in self.metrics.expensive_selectors(5):
+            logger.info(f"Expensive selector: {rule['rule']} {rule['total']:.3f}s over {rule['calls']} calls")
+
+    def response_received(self, response, request, spider):
+        self.metrics.inc('pages')
+        self.metrics.inc('bytes', len(response.body))
+        latency = request.meta.get('download_latency')
+        if latency is not None and 'cached' not in response.flags:
+            self.metrics.observe('download', latency, response.url)
+
+    def item_scraped(self, item, response, spider):
+        self.metrics.inc('items')
+
+    def queue_depths(self, spider):
+        engine = self.crawler.engine
+        depths = {
+            'scheduler': len(engine.slot.scheduler) if engine and engine.slot else 0,
+            'downloader_active': len(engine.downloader.active) if engine else 0,
+        }
+        # Spiders with external queues (the distributed frontier) report them too
+        spider_depths = getattr(spider, 'queue_depths', None)
+        if spider_depths:
+            try:
+                depths.update(spider_depths())
+            except redis.RedisError as e:
+                logger.warning(f"Could not read queue depths: {e}")
+        return depths
+
+    def snapshot(self, spider):
+        now = time.monotonic()
+        elapsed = max(now - self.last_publish, 1e-6)
+        rates = {
+            f'{name}_per_sec': (self.metrics.counters.get(name, 0) - self.last_counters.get(name, 0)) / elapsed
+            for name in ('pages', 'items', 'bytes')
+        }
+        self.last_publish = now
+        self.last_counters = dict(self.metrics.counters)
+        return {
+            'instance': self.instance,
+            'spider': spider.name,
+            'timestamp': time.time(),
+            'rates': rates,
+            'counters': self.metrics.counters,
+            'queues': self.queue_depths(spider),
+            'stages': {stage: histogram.summary() for stage, histogram in self.metrics.stages.items()},
+            'slowest_pages': self.metrics.slowest_pages(),
+            'expensive_selectors': self.metrics.expensive_selectors(),
+        }
+
+    def publish(self, spider):
+        snapshot = self.snapshot(spider)
+        key = METRICS_KEY_PREFIX + self.instance
+        try:
+            self.redis.set(key, json.dumps(snapshot), ex=int(self.interval * 6))
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish crawl metrics: {e}")
+
+        if self.metrics_file:
+            path = self.metrics_file.format(instance=self.instance)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.metrics.prometheus(self.instance, snapshot, self.file_domains))
+            os.replace(tmp_path, path)
@@ -0,0 +1,209 @@
+"""
+Query jobs run by the distributed workers.
+
+When a search finds few results, run_crawler.start_crawler() can submit a
+query job to the cluster instead of starting a standalone spider. A job has
+its own frontier, crawler:frontier:job:<id>, seeded with ResourceSpider's
+search-specific URLs, and a budget of pages. Every worker claims a few job
+pages at a time ahead of its share of the background crawl, taking them
+round-robin from the running jobs, so a job is spread over the whole
+cluster and no job starves another. Links found on a job's pages go back
+into that job's frontier. The coordinator finishes jobs that used up their
+budget, ran dry or timed out.
+
+This module has no Scrapy dependency so the API and coordinator can import it.
+"""
+
+import time
+import uuid
+
+from .frontier import (
+    INFLIGHT_PREFIX, JOB_FRONTIER_PREFIX, JOB_PREFIX, JOB_SEEN_PREFIX, JOBS_KEY, decode_entry, encode_entry, score_url
+)
+
+# Counter rotating the job a claim starts from
+JOBS_TURN_KEY = 'crawler:jobs:turn'
+
+# Moves up to ARGV[1] entries from the frontiers of the running jobs
+# (KEYS[1]) into a worker's in-flight set (KEYS[2]) with lease expiry
+# ARGV[2]. Jobs take turns one entry at a time, starting from the job after
+# the one the previous claim started from (KEYS[3]), and a job stops giving
+# out entries once its budget is dispatched. ARGV[3] and ARGV[4] are the job
+# hash and job frontier prefixes. Returns the entries.
+CLAIM_JOBS_SCRIPT = """
+local jobs = redis.call('ZRANGE', KEYS[1], 0, -1)
+if #jobs == 0 then
+    return {}
+end
+local count = tonumber(ARGV[1])
+local start = redis.call('INCR', KEYS[3]) % #jobs
+local open = {}
+for i = 1, #jobs do
+    local job = jobs[(start + i - 1) % #jobs + 1]
+    local info = redis.call('HMGET', ARGV[3] .. job, 'budget', 'dispatched')
+    local left = tonumber(info[1] or 0) - tonumber(info[2] or 0)
+    if left > 0 then
+        open[#open + 1] = {job = job, left = left, taken = 0}
+    end
+end
+local claimed = {}
+local progress = true
+while progress and #claimed < count do
+    progress = false
+    for _, job in ipairs(open) do
+        if #claimed < count and job.taken < job.left then
+            local popped = redis.call('ZPOPMAX', ARGV[4] .. job.job)
+            if popped[1] then
+                redis.call('ZADD', KEYS[2], ARGV[2], popped[1])
+                claimed[#claimed + 1] = popped[1]
+                job.taken = job.taken + 1
+                progress = true
+            else
+                job.left = job.taken
+            end
+        end
+    end
+end
+for _, job in ipairs(open) do
+    if job.taken > 0 then
+        redis.call('HINCRBY', ARGV[3] .. job.job, 'dispatched', job.taken)
+    end
+end
+return claimed
+"""
+
+
+class QueryJobs:
+    """Submission, claiming and bookkeeping of query jobs"""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.claim_script = redis_client.register_script(CLAIM_JOBS_SCRIPT)
+        # Query of each job seen by this process; a job's query never changes
+        self.queries = {}
+
+    def submit(self, query, seed_urls, budget, job_id=None):
+        """
+        Start a query job with its own frontier and page budget.
+
+        Seeds skip the crawl state check, so a job always crawls its seeds
+        even if the background crawl saw them recently.
+
+        Returns:
+            str: Job ID
+        """
+        job_id = job_id or str(uuid.uuid4())
+        now = time.time()
+        entries = {}
+        for url in dict.fromkeys(seed_urls):
+            score = score_url(url, query)
+            entries[encode_entry(url, 0, score, job_id)] = score
+        with self.redis.pipeline() as pipe:
+            pipe.hset(JOB_PREFIX + job_id, mapping={
+                'query': query,
+                'budget': budget,
+                'status': 'running',
+                'created': now,
+                'dispatched': 0,
+                'crawled': 0,
+                'failed': 0,
+                'items': 0,
+            })
+            if entries:
+                pipe.zadd(JOB_FRONTIER_PREFIX + job_id, entries)
+            pipe.zadd(JOBS_KEY, {job_id: now})
+            pipe.execute()
+        return job_id
+
+    def claim(self, worker_id, count, lease):
+        """
+        Atomically move up to count entries of the running jobs into a worker's in-flight set.
+
+        Claimed entries are acknowledged and requeued like worker queue
+        entries, with RedisFrontier.ack() and RedisFrontier.requeue().
+
+        Returns:
+            list: Tuples of (raw entry, decoded entry)
+        """
+        raw_entries = self.claim_script(
+            keys=[JOBS_KEY, INFLIGHT_PREFIX + worker_id, JOBS_TURN_KEY],
+            args=[count, time.time() + lease, JOB_PREFIX, JOB_FRONTIER_PREFIX]
+        )
+        return [(raw, decode_entry(raw)) for raw in raw_entries]
+
+    def query(self, job_id):
+        """Search query of a job"""
+        if job_id not in self.queries:
+            query = self.redis.hget(JOB_PREFIX + job_id, 'query')
+            self.queries[job_id] = query.decode() if query else None
+        return self.queries[job_id]
+
+    def record(self, job_id, client=None, **counts):
+        """Add to a job's crawled, failed and items counters, optionally on a pipeline"""
+        client = client or self.redis
+        for name, value in counts.items():
+            if value:
+                client.hincrby(JOB_PREFIX + job_id, name, value)
+
+    def status(self, job_id):
+        """
+        Status of a job.
+
+        Returns:
+            dict: The job's fields and the size of its frontier, or None for
+            an unknown job
+        """
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(JOB_PREFIX + job_id)
+            pipe.zcard(JOB_FRONTIER_PREFIX + job_id)
+            raw, frontier = pipe.execute()
+        if not raw:
+            return None
+        status = {key.decode(): value.decode() for key, value in raw.items()}
+        for name in ('budget', 'dispatched', 'crawled', 'failed', 'items'):
+            status[name] = int(status.get(name, 0))
+        for name in ('created', 'finished'):
+            if name in status:
+                status[name] = float(status[name])
+        status['frontier'] = frontier
+        status['job_id'] = job_id
+        return status
+
+    def active(self):
+        """IDs of the running jobs, oldest first"""
+        return [job_id.decode() for job_id in self.redis.zrange(JOBS_KEY, 0, -1)]
+
+    def finish_done(self, timeout, keep=86400, now=None):
+        """
+        Finish the jobs that are done.
+
+        A job is done when none of its pages are in flight and its budget is
+        used up or its frontier is empty, or when it has run for timeout
+        seconds. Its frontier and seen set are deleted and its status hash is kept for
+        `keep` seconds.
+
+        Returns:
+            list: Statuses of the finished jobs
+        """
+        now = now or time.time()
+        finished = []
+        for job_id in self.active():
+            status = self.status(job_id)
+            if status is None:
+                self.redis.zrem(JOBS_KEY, job_id)
+                continue
+            in_flight = status['dispatched'] - status['crawled'] - status['failed']
+            exhausted = status['dispatched'] >= status['budget'] or status['frontier'] == 0
+            done = in_flight <= 0 and exhausted
+            if not done and now - status['created'] < timeout:
+                continue
+            status['status'] = 'done' if done else 'timed_out'
+            status['finished'] = now
+            with self.redis.pipeline() as pipe:
+                pipe.zrem(JOBS_KEY, job_id)
+                pipe.delete(JOB_FRONTIER_PREFIX + job_id, JOB_SEEN_PREFIX + job_id)
+                pipe.hset(JOB_PREFIX + job_id, mapping={'status': status['status'], 'finished': now})
+                pipe.expire(JOB_PREFIX + job_id, keep)
+                pipe.execute()
+            finished.append(status)
+        return finished
@@ -3,11 +3,21 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import hashlib
+import logging
+import time
+
+import redis
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured, StopDownload
+
+from resource_crawler.frontier import RECRAWL_DUE_KEY
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+logger = logging.getLogger(__name__)
+
 
 class ResourceCrawlerSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -33,15 +43,38 @@ class ResourceCrawlerSpiderMiddleware:
         # it has processed the response.
 
         # Must return an iterable of Request, or item objects.
-        for i in result:
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            for i in result:
+                yield i
+            return
+
+        # Time spent inside the callback is recorded as the parse stage
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                i = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
             yield i
+        metrics.observe('parse', elapsed, response.url)
 
     def process_spider_exception(self, response, exception, spider):
         # Called when a spider or process_spider_input() method
         # (from other spider middleware) raises an exception.
 
+        # Spiders with a work queue acknowledge the failed page, including
+        # failed offloaded extractions, so it is not retried forever
+        parse_failed = getattr(spider, 'parse_failed', None)
+        if parse_failed is not None:
+            parse_failed(response, exception)
+
         # Should return either None or an iterable of Request or item objects.
-        pass
+        return None
 
     def process_start_requests(self, start_requests, spider):
         # Called with the start requests of the spider, and works
@@ -57,47 +90,241 @@ class ResourceCrawlerSpiderMiddleware:
 
 
 class ResourceCrawlerDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    Downloader middleware that aborts downloads not worth parsing.
+
+    Content-Type and Content-Length are checked as soon as the headers
+    arrive, before the body is downloaded. Responses of a type missing from
+    EARLY_ABORT_MAX_SIZES, or larger than the limit for their type, are
+    stopped and dropped. Bodies without a Content-Length are stopped once
+    they grow past the limit. Requests with meta['early_abort'] = False are
+    never aborted.
+    """
+
+    def __init__(self, stats, max_sizes, default_max_size):
+        self.stats = stats
+        self.max_sizes = max_sizes
+        self.default_max_size = default_max_size
 
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(
+            crawler.stats,
+            crawler.settings.getdict('EARLY_ABORT_MAX_SIZES'),
+            crawler.settings.getint('EARLY_ABORT_DEFAULT_MAX_SIZE', 5 * 1024 * 1024)
+        )
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(s.bytes_received, signal=signals.bytes_received)
         return s
 
+    def headers_received(self, headers, body_length, request, spider):
+        if request.meta.get('early_abort') is False:
+            return
+
+        content_type = headers.get('Content-Type', b'').decode('latin-1').split(';')[0].strip().lower()
+        try:
+            content_length = int(headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            content_length = None
+
+        if not content_type:
+            max_size = self.default_max_size
+        else:
+            max_size = self.max_sizes.get(content_type)
+
+        if max_size is None:
+            self._abort(request, spider, 'type', content_length)
+        elif content_length is not None and content_length > max_size:
+            self._abort(request, spider, 'size', content_length)
+
+        # Bodies of unknown length are checked as they stream in
+        request.meta['early_abort_max_size'] = max_size
+        request.meta['early_abort_received'] = 0
+
+    def bytes_received(self, data, request, spider):
+        max_size = request.meta.get('early_abort_max_size')
+        if not max_size:
+            return
+        received = request.meta['early_abort_received'] + len(data)
+        request.meta['early_abort_received'] = received
+        if received > max_size:
+            self._abort(request, spider, 'size', None)
+
+    def _abort(self, request, spider, reason, content_length):
+        request.meta['early_abort_reason'] = reason
+        self.stats.inc_value(f'early_abort/{reason}', spider=spider)
+        if content_length is not None:
+            avoided = content_length - request.meta.get('early_abort_received', 0)
+            self.stats.inc_value('early_abort/bytes_avoided', avoided, spider=spider)
+        raise StopDownload(fail=False)
+
+    def process_response(self, request, response, spider):
+        reason = request.meta.get('early_abort_reason')
+        if reason and 'download_stopped' in response.flags:
+            raise IgnoreRequest(f"Download of {request.url} aborted ({reason})")
+        return response
+
+    def spider_opened(self, spider):
+        spider.logger.info("Spider opened: %s" % spider.name)
+
+
+# Records a visit to a URL and schedules its next one. KEYS[1] is the URL's
+# state hash and KEYS[2] the due set. ARGV[1] is the URL, ARGV[2] the time,
+# ARGV[3] the body hash ('' for a 304), ARGV[4] and ARGV[5] the ETag and
+# Last-Modified ('' for none), ARGV[6..8] the default, minimum and maximum
+# interval and ARGV[9] the state TTL. The interval halves when the page
+# changed and grows by half when it did not. Returns {changed, known}.
+RECORD_VISIT_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'interval', 'content_hash')
+local known = state[1] ~= false
+local interval = tonumber(state[1]) or tonumber(ARGV[6])
+local changed = 1
+if ARGV[3] == '' or (known and state[2] == ARGV[3]) then
+    changed = 0
+end
+if known then
+    if changed == 1 then
+        interval = math.max(tonumber(ARGV[7]), interval / 2)
+    else
+        interval = math.min(tonumber(ARGV[8]), interval * 1.5)
+    end
+end
+local now = tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'interval', interval, 'last_visit', now, 'next_visit', now + interval)
+redis.call('HINCRBY', KEYS[1], 'checks', 1)
+redis.call('HINCRBY', KEYS[1], 'changes', changed)
+if ARGV[3] ~= '' then
+    redis.call('HSET', KEYS[1], 'content_hash', ARGV[3])
+end
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[1], 'etag', ARGV[4])
+end
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[1], 'last_modified', ARGV[5])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[9])
+redis.call('ZADD', KEYS[2], now + interval, ARGV[1])
+return {changed, known and 1 or 0}
+"""
+
+
+class IncrementalRecrawlMiddleware:
+    """
+    Downloader middleware for incremental re-crawling.
+
+    Stores the ETag, Last-Modified and a content hash of every fetched URL in
+    Redis and gives each URL its own revisit interval: it halves when the
+    page changed and grows when it did not. The URL is then added to the
+    due set (crawler:recrawl:due), from which the coordinator queues it
+    again once the interval has passed.
+
+    Revisits queued that way (request.meta['recrawl']) bypass the HTTP cache
+    and send conditional requests, and 304 responses are dropped before they
+    reach the spider; the links on such pages come due on their own.
+    Unchanged 200 responses are passed on with meta['recrawl_unchanged'] set,
+    so the spiders follow their links without extracting the page again.
+    Requests with meta['recrawl_force'], such as search seeds and query job
+    pages, are fetched and parsed in full.
+    """
+
+    key_prefix = 'crawler:recrawl:'
+
+    def __init__(self, redis_client, stats, default_interval, min_interval, max_interval):
+        self.redis = redis_client
+        self.stats = stats
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.record_script = redis_client.register_script(RECORD_VISIT_SCRIPT)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RECRAWL_ENABLED'):
+            raise NotConfigured
+        redis_client = redis.Redis(
+            host=settings.get('REDIS_HOST', 'redis'),
+            port=settings.getint('REDIS_PORT', 6379),
+            decode_responses=True
+        )
+        return cls(
+            redis_client,
+            crawler.stats,
+            settings.getint('RECRAWL_DEFAULT_INTERVAL', 86400),
+            settings.getint('RECRAWL_MIN_INTERVAL', 3600),
+            settings.getint('RECRAWL_MAX_INTERVAL', 2419200)
+        )
+
+    def _key(self, url):
+        return self.key_prefix + hashlib.md5(url.encode()).hexdigest()
+
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        # Only scheduled revisits carry validators; other requests need no
+        # state before they are fetched
+        if request.method != 'GET' or request.meta.get('recrawl_force') or not request.meta.get('recrawl'):
+            return None
+
+        # A revisit must reach the origin: a cached copy would be recorded as
+        # nothing and the validators would never be sent
+        request.meta['dont_cache'] = True
+        try:
+            state = self.redis.hmget(self._key(request.url), 'etag', 'last_modified')
+        except redis.RedisError as e:
+            spider.logger.warning(f"Could not load re-crawl state for {request.url}: {e}")
+            return None
+
+        # Send validators so unchanged pages come back as 304
+        etag, last_modified = state
+        if etag:
+            request.headers.setdefault('If-None-Match', etag)
+        if last_modified:
+            request.headers.setdefault('If-Modified-Since', last_modified)
         return None
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+        if request.method != 'GET':
+            return response
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
-        return response
+        if response.status == 304:
+            self._record(request.url)
+            self.stats.inc_value('recrawl/not_modified', spider=spider)
+            raise IgnoreRequest(f"{request.url} not modified")
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+        # Cached responses say nothing about the origin, only record live
+        # fetches. A revisit served from a cache anyway is rescheduled like a
+        # 304, so it stays in the re-crawl cycle.
+        if 'cached' in response.flags:
+            if response.status == 200 and request.meta.get('recrawl'):
+                self._record(request.url)
+            return response
+        if response.status != 200:
+            return response
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+        result = self._record(request.url, response, hashlib.sha1(response.body).hexdigest())
+        if result and not request.meta.get('recrawl_force'):
+            changed, known = result
+            if known and not changed:
+                self.stats.inc_value('recrawl/unchanged', spider=spider)
+                request.meta['recrawl_unchanged'] = True
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        return response
+
+    def _record(self, url, response=None, content_hash=''):
+        """Record a visit and schedule the URL's next one from its change history"""
+        etag = last_modified = ''
+        if response is not None:
+            etag = (response.headers.get('ETag') or b'').decode('latin-1')
+            last_modified = (response.headers.get('Last-Modified') or b'').decode('latin-1')
+        try:
+            return self.record_script(
+                keys=[self._key(url), RECRAWL_DUE_KEY],
+                args=[
+                    url, time.time(), content_hash, etag, last_modified,
+                    self.default_interval, self.min_interval, self.max_interval, int(self.max_interval * 2)
+                ]
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not save re-crawl state for {url}: {e}")
+            return None
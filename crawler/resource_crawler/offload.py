@@ -0,0 +1,193 @@
+"""
+Page classification and extraction in worker processes.
+
+is_resource_page() and extract_resource() are pure lxml and string work
+that can take tens of milliseconds on large pages. Run on the reactor
+thread, they keep a crawler process on one core while downloads wait. With
+EXTRACTION_POOL_ENABLED, the ExtractionOffload extension gives the spider a
+pool of worker processes (one per CPU by default). The spider ships each
+response body to the pool and gets the ResourceItem back as a Deferred.
+
+At most EXTRACTION_POOL_MAX_PENDING pages are in the pool at once. Further
+pages wait on a DeferredSemaphore, and Scrapy's SCRAPER_SLOT_MAX_ACTIVE_SIZE
+then slows downloads while parsing catches up. Link extraction and Redis
+calls stay in the crawler process.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.misc import load_object
+from twisted.internet import defer, reactor
+
+from resource_crawler.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# Spider attributes that classification and extraction depend on
+SPIDER_STATE_ATTRIBUTES = ('search_query', 'use_site_extractors')
+
+# Spiders built in this worker process, keyed by class path and state
+_worker_spiders = {}
+
+
+def _init_worker():
+    # Ctrl-C is handled by the crawler process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _worker_spider(spider_path, state):
+    key = (spider_path, tuple(sorted(state.items())))
+    spider = _worker_spiders.get(key)
+    if spider is None:
+        # Skip __init__: it opens Redis connections and reads start URLs
+        spidercls = load_object(spider_path)
+        spider = spidercls.__new__(spidercls)
+        spider.__dict__.update(state)
+        _worker_spiders[key] = spider
+    return spider
+
+
+def classify_and_extract(spider_path, state, url, status, headers, body, submitted):
+    """
+    Worker process entry point.
+
+    Returns:
+        tuple: (ResourceItem or None, {stage: seconds}) where the stages are
+        the queue wait, classify and extract times
+    """
+    started = time.time()
+    spider = _worker_spider(spider_path, state)
+    response = HtmlResponse(url=url, status=status, headers=headers, body=body, request=Request(url))
+
+    timings = {'offload_wait': started - submitted}
+    start = time.perf_counter()
+    is_resource = spider.is_resource_page(response)
+    timings['classify'] = time.perf_counter() - start
+    if not is_resource:
+        return None, timings
+
+    start = time.perf_counter()
+    resource = spider.extract_resource(response)
+    timings['extract'] = time.perf_counter() - start
+    return resource, timings
+
+
+class ExtractionPool:
+    """Process pool running a spider's classify_and_extract() with bounded concurrency"""
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            # Forking a process with reactor threads running is unsafe
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        self.semaphore = defer.DeferredSemaphore(max_pending)
+
+    def extract(self, spider, response):
+        """Classify and extract a response in the pool, returning a Deferred firing with the item or None"""
+        return self.semaphore.run(self._submit, spider, response)
+
+    def _submit(self, spider, response):
+        spidercls = type(spider)
+        state = {name: getattr(spider, name, None) for name in SPIDER_STATE_ATTRIBUTES}
+        future = self.executor.submit(
+            classify_and_extract,
+            f'{spidercls.__module__}.{spidercls.__name__}',
+            state,
+            response.url,
+            response.status,
+            dict(response.headers),
+            response.body,
+            time.time()
+        )
+
+        d = defer.Deferred()
+
+        def done(future):
+            # Futures still queued when the spider closes are cancelled by shutdown()
+            if future.cancelled():
+                d.errback(defer.CancelledError(f"Extraction of {response.url} cancelled on shutdown"))
+            elif future.exception() is not None:
+                d.errback(future.exception())
+            else:
+                d.callback(future.result())
+
+        future.add_done_callback(lambda future: reactor.callFromThread(done, future))
+        d.addCallback(self._record, spider, response.url)
+        return d
+
+    def _record(self, result, spider, url):
+        resource, timings = result
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is not None:
+            for stage, seconds in timings.items():
+                metrics.observe(stage, seconds, url)
+        return resource
+
+    def shutdown(self):
+        # Don't block the reactor on pages still in the workers
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def classify_and_extract_locally(spider, response):
+    """Run classification and extraction on the reactor thread, as without the pool"""
+    with timed(spider, 'classify', response.url):
+        is_resource = spider.is_resource_page(response)
+    if not is_resource:
+        return None
+    with timed(spider, 'extract', response.url):
+        return spider.extract_resource(response)
+
+
+def extract_page(spider, response):
+    """
+    Classify and extract a page, in the spider's extraction pool if it has one.
+
+    Returns:
+        Deferred firing with the ResourceItem or None when the pool is on,
+        otherwise the ResourceItem or None
+    """
+    pool = getattr(spider, 'extraction_pool', None)
+    if pool is None:
+        return classify_and_extract_locally(spider, response)
+    return pool.extract(spider, response)
+
+
+class ExtractionOffload:
+    """Scrapy extension giving the spider a process pool for classification and extraction"""
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('EXTRACTION_POOL_ENABLED'):
+            raise NotConfigured
+        workers = settings.getint('EXTRACTION_POOL_WORKERS') or os.cpu_count() or 1
+        max_pending = settings.getint('EXTRACTION_POOL_MAX_PENDING') or workers * 2
+        ext = cls(workers, max_pending)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.pool = ExtractionPool(self.workers, self.max_pending)
+        spider.extraction_pool = self.pool
+        logger.info(f"Extraction pool started with {self.workers} processes, {self.max_pending} pages in flight")
+
+    def spider_closed(self, spider):
+        spider.extraction_pool = None
+        self.pool.shutdown()
@@ -15,6 +15,8 @@ from elasticsearch.helpers import bulk
 from elasticsearch.exceptions import NotFoundError
 import redis
 import json
+from resource_crawler.frontier import publish_result
+from resource_crawler.instrumentation import timed
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +24,8 @@ class ResourcePipeline:
     """
     Pipeline that saves scraped resources to Elasticsearch
     """
-    def __init__(self, elasticsearch_host='localhost', elasticsearch_port=9200, redis_host='redis', redis_port=6379):
+    def __init__(self, elasticsearch_host='localhost', elasticsearch_port=9200, redis_host='redis', redis_port=6379,
+                 stream_maxlen=100000):
         self.elasticsearch_host = elasticsearch_host
         self.elasticsearch_port = elasticsearch_port
         self.es = Elasticsearch([{'host': elasticsearch_host, 'port': elasticsearch_port, 'scheme': 'http'}])
@@ -31,6 +34,7 @@ class ResourcePipeline:
         self.redis_host = redis_host
         self.redis_port = redis_port
         self.redis_client = redis.Redis(host=redis_host, port=redis_port)
+        self.stream_maxlen = stream_maxlen
         
         # Check if index exists. If not, create it
         if not self.es.indices.exists(index='resources'):
@@ -72,6 +76,10 @@ class ResourcePipeline:
             logging.info("Index created successfully")
 
     def process_item(self, item, spider):
+        with timed(spider, 'pipeline', item['url']):
+            return self._process_item(item, spider)
+
+    def _process_item(self, item, spider):
         # Create a hash of the URL to use as document ID
         url_hash = hashlib.md5(item['url'].encode()).hexdigest()
         
@@ -104,8 +112,11 @@ class ResourcePipeline:
             except Exception as e:
                 logging.error(f"Error indexing document: {e}")
         
-        # Publish to Redis for real-time updates if it's a new item or search_query is specified
-        if is_new or (hasattr(spider, 'search_query') and spider.search_query):
+        # Add the item to the results stream for real-time updates if it's a
+        # new item or search_query is specified, unless the spider adds its
+        # items itself
+        publish = is_new or (hasattr(spider, 'search_query') and spider.search_query)
+        if publish and not getattr(spider, 'publishes_results', False):
             try:
                 # Prepare a simplified version of the item for real-time updates
                 realtime_item = {
@@ -115,21 +126,24 @@ class ResourcePipeline:
                     'description': item['description'],
                     'type': item['type'],
                     'domain': item['domain'],
+                    'tags': item.get('tags') or [],
+                    'code_snippets': item.get('code_snippets') or [],
                     'timestamp': datetime.now().isoformat()
                 }
                 
                 # Add language if available
                 if 'languages' in item and item['languages']:
                     realtime_item['language'] = item['languages'][0]
+                    realtime_item['languages'] = item['languages']
                 
-                # If spider has a search query, publish to that specific channel
-                if hasattr(spider, 'search_query') and spider.search_query:
-                    channel = f"search:results:{spider.search_query}"
-                    self.redis_client.publish(channel, json.dumps(realtime_item))
-                    logging.info(f"Published result to channel: {channel}")
+                # Clients of the query the page was crawled for get it even
+                # if it doesn't contain every word of the query
+                if getattr(spider, 'search_query', None):
+                    realtime_item['query'] = spider.search_query
                 
-                # Always publish to general updates channel
-                self.redis_client.publish('search:results:all', json.dumps(realtime_item))
+                # The streaming API matches every new resource against its
+                # clients' queries, so one stream serves all of them
+                publish_result(self.redis_client, realtime_item, self.stream_maxlen)
             except Exception as e:
                 logging.error(f"Error publishing to Redis: {e}")
         
@@ -141,4 +155,5 @@ class ResourcePipeline:
         elasticsearch_port = crawler.settings.get('ELASTICSEARCH_PORT', 9200)
         redis_host = crawler.settings.get('REDIS_HOST', 'redis')
         redis_port = crawler.settings.get('REDIS_PORT', 6379)
-        return cls(elasticsearch_host, elasticsearch_port, redis_host, redis_port)
+        stream_maxlen = crawler.settings.getint('RESULTS_STREAM_MAXLEN', 100000)
+        return cls(elasticsearch_host, elasticsearch_port, redis_host, redis_port, stream_maxlen)
@@ -0,0 +1,262 @@
+"""
+Offline page recording and replay.
+
+ResponseRecorderMiddleware saves the responses that reach the spider to a
+compact archive: gzip-compressed JSON lines with base64 bodies. replay()
+feeds an archive through a spider's parse() and the item pipeline with no
+network. Redis and Elasticsearch are replaced by in-process stubs. It
+reports pages/s, per-stage time, Redis calls and peak memory, and can check
+the extracted items against golden results.
+
+Record with RECORD_RESPONSES_FILE, replay with `scrapy replay <archive>`.
+"""
+
+import base64
+import gzip
+import json
+import logging
+import resource
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+import redis
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers, Request
+from scrapy.responsetypes import responsetypes
+
+from resource_crawler.instrumentation import CrawlMetrics, timed
+
+logger = logging.getLogger(__name__)
+
+# Item fields that change on every run and are left out of golden results
+VOLATILE_FIELDS = ('timestamp',)
+
+
+def write_record(f, response):
+    record = {
+        'url': response.url,
+        'status': response.status,
+        'headers': {
+            key.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for key, values in response.headers.items()
+        },
+        'body': base64.b64encode(response.body).decode('ascii'),
+    }
+    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def read_archive(path):
+    """Yield the responses saved in an archive"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            url = record['url']
+            headers = Headers(record['headers'])
+            body = base64.b64decode(record['body'])
+            respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+            yield respcls(url=url, status=record['status'], headers=headers, body=body, request=Request(url))
+
+
+class ResponseRecorderMiddleware:
+    """Downloader middleware appending every response the spider sees to an archive"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.count = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('RECORD_RESPONSES_FILE')
+        if not path:
+            raise NotConfigured
+        middleware = cls(path)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.file = gzip.open(self.path.format(spider=spider.name), 'at', encoding='utf-8')
+
+    def spider_closed(self, spider):
+        self.file.close()
+        logger.info(f"Recorded {self.count} responses to {self.file.name}")
+
+    def process_response(self, request, response, spider):
+        if response.status == 200 and hasattr(response, 'text'):
+            write_record(self.file, response)
+            self.count += 1
+        return response
+
+
+class StubRedis:
+    """
+    In-process stand-in for redis.Redis that accepts any command.
+
+    Commands return empty results and are counted, so the replay reports how
+    many Redis round trips each page would cost.
+    """
+
+    empty_results = {
+        'sismember': False, 'exists': 0, 'get': None, 'hget': None, 'hgetall': {},
+        'lrange': [], 'zpopmax': [], 'zrange': [], 'smembers': set(), 'mget': [],
+        'llen': 0, 'scard': 0, 'zcard': 0, 'lpop': None, 'blpop': None, 'execute': [],
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.calls = StubRedis.calls
+
+    calls = {}
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return self.empty_results.get(name)
+        return command
+
+    def pipeline(self, *args, **kwargs):
+        return StubPipeline(self)
+
+    def register_script(self, script):
+        def run(keys=None, args=None, client=None):
+            if client is not None:
+                # Queued on a pipeline, counted when it executes
+                return client.evalsha(keys, args)
+            self.calls['evalsha'] = self.calls.get('evalsha', 0) + 1
+            return []
+        return run
+
+
+class StubPipeline:
+    """Pipeline for StubRedis, counting one round trip per execute()"""
+
+    def __init__(self, client):
+        self.client = client
+        self.size = 0
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.size += 1
+            return self
+        return command
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self):
+        self.client.calls['pipeline'] = self.client.calls.get('pipeline', 0) + 1
+        results, self.size = [None] * self.size, 0
+        return results
+
+
+class StubElasticsearch:
+    """In-process stand-in for the Elasticsearch client used by ResourcePipeline"""
+
+    def __init__(self, *args, **kwargs):
+        self.documents = {}
+        self.indices = mock.Mock()
+        self.indices.exists.return_value = True
+
+    def exists(self, index, id):
+        return id in self.documents
+
+    def index(self, index, id, body=None, **kwargs):
+        self.documents[id] = body
+
+    def update(self, index, id, body=None, **kwargs):
+        self.documents.setdefault(id, {}).update(body['doc'])
+
+
+def golden_record(response, output):
+    """Deterministic summary of a parse() result for golden comparisons"""
+    items = [
+        {key: value for key, value in dict(result).items() if key not in VOLATILE_FIELDS}
+        for result in output if not isinstance(result, Request)
+    ]
+    links = sorted(result.url for result in output if isinstance(result, Request))
+    return {'url': response.url, 'items': items, 'links': len(links)}
+
+
+def replay(crawler, spider_kwargs, archive, repeat=1, use_pipeline=True):
+    """
+    Replay an archive through a spider and the item pipeline.
+
+    Args:
+        crawler: Crawler for the spider class to replay
+        spider_kwargs (dict): Arguments for the spider, e.g. search_query
+        archive (str): Path to an archive written by ResponseRecorderMiddleware
+        repeat (int): Number of passes over the archive
+        use_pipeline (bool): Send items through ResourcePipeline
+
+    Returns:
+        tuple: (report dict, list of golden records from the first pass)
+    """
+    responses = list(read_archive(archive))
+    StubRedis.calls = {}
+
+    with ExitStack() as stack:
+        # Every redis.Redis() created during the replay is a stub
+        stack.enter_context(mock.patch.object(redis, 'Redis', StubRedis))
+        spider = crawler.spidercls.from_crawler(crawler, **spider_kwargs)
+        spider.metrics = CrawlMetrics()
+        # Extract in process so parse() returns its output instead of a
+        # Deferred, and extraction shows up in the stage timings
+        spider.extraction_pool = None
+
+        pipeline = None
+        if use_pipeline:
+            from resource_crawler import pipelines
+            stack.enter_context(mock.patch.object(pipelines, 'Elasticsearch', StubElasticsearch))
+            pipeline = pipelines.ResourcePipeline.from_crawler(crawler)
+
+        golden = []
+        items = 0
+        start = time.perf_counter()
+        for run in range(repeat):
+            for response in responses:
+                with timed(spider, 'parse', response.url):
+                    output = list(spider.parse(response))
+                for result in output:
+                    if not isinstance(result, Request):
+                        items += 1
+                        if pipeline:
+                            pipeline.process_item(result, spider)
+                if run == 0:
+                    golden.append(golden_record(response, output))
+        elapsed = time.perf_counter() - start
+
+    pages = len(responses) * repeat
+    report = {
+        'pages': pages,
+        'items': items,
+        'seconds': elapsed,
+        'pages_per_sec': pages / elapsed if elapsed else 0.0,
+        'stages': {stage: histogram.summary() for stage, histogram in spider.metrics.stages.items()},
+        'stage_totals': {stage: histogram.sum for stage, histogram in spider.metrics.stages.items()},
+        'redis_calls_per_page': {name: count / pages for name, count in sorted(StubRedis.calls.items())} if pages else {},
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    return report, golden
+
+
+def compare_golden(expected, actual):
+    """Return a list of human readable differences between golden record lists"""
+    differences = []
+    expected_by_url = {record['url']: record for record in expected}
+    for record in actual:
+        reference = expected_by_url.pop(record['url'], None)
+        if reference is None:
+            differences.append(f"{record['url']}: not in golden results")
+        elif reference != record:
+            for key in ('items', 'links'):
+                if reference[key] != record[key]:
+                    differences.append(f"{record['url']}: {key} differ")
+    for url in expected_by_url:
+        differences.append(f"{url}: missing from replay")
+    return differences
@@ -25,10 +25,93 @@ COOKIES_ENABLED = False
 
 # Enable and configure HTTP caching  
 HTTPCACHE_ENABLED = True  
-HTTPCACHE_EXPIRATION_SECS = 0  
+HTTPCACHE_EXPIRATION_SECS = 86400  # 1 day
 HTTPCACHE_DIR = 'httpcache'  
-HTTPCACHE_IGNORE_HTTP_CODES = []  
-HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'  
+HTTPCACHE_IGNORE_HTTP_CODES = [304]  
+# Single-file SQLite cache with compressed bodies and LRU eviction
+# Run `scrapy httpcache_stats` to see hit rate and space used
+HTTPCACHE_STORAGE = 'resource_crawler.httpcache.SQLiteCacheStorage'
+HTTPCACHE_MAX_SIZE = 2 * 1024 ** 3  # 2 GB
+HTTPCACHE_COMPRESSION_LEVEL = 6
+# Per-domain cache TTLs in seconds (subdomains match), 0 means never expire
+HTTPCACHE_DOMAIN_TTLS = {
+    'stackoverflow.com': 3600,
+    'reddit.com': 3600,
+    'news.ycombinator.com': 900,
+    'dev.to': 3600,
+    'docs.python.org': 604800,
+    'developer.mozilla.org': 604800,
+    'w3schools.com': 604800,
+    'tutorialspoint.com': 604800,
+}
+
+# Custom commands
+COMMANDS_MODULE = 'resource_crawler.commands'
+
+# Configure downloader middlewares
+DOWNLOADER_MIDDLEWARES = {
+    'resource_crawler.middlewares.IncrementalRecrawlMiddleware': 560,
+    # Runs before the HTTP cache so aborted downloads are never cached
+    'resource_crawler.middlewares.ResourceCrawlerDownloaderMiddleware': 950,
+    # Closest to the engine, so it records exactly what the spider parses
+    'resource_crawler.replay.ResponseRecorderMiddleware': 100,
+}
+
+# Record responses for `scrapy replay` (gzip JSON lines, {spider} is expanded)
+RECORD_RESPONSES_FILE = None
+
+# Abort downloads early: content type -> maximum body size in bytes
+# Types missing from this dict are not downloaded at all
+EARLY_ABORT_MAX_SIZES = {
+    'text/html': 5 * 1024 ** 2,
+    'application/xhtml+xml': 5 * 1024 ** 2,
+    'text/plain': 1024 ** 2,
+}
+# Limit for responses without a Content-Type header
+EARLY_ABORT_DEFAULT_MAX_SIZE = 5 * 1024 ** 2
+
+# Incremental re-crawling: conditional requests and per-URL revisit intervals.
+# The coordinator queues URLs again as they come due (RECRAWL_BATCH_SIZE per pass).
+RECRAWL_ENABLED = True
+RECRAWL_DEFAULT_INTERVAL = 86400  # 1 day
+RECRAWL_MIN_INTERVAL = 3600  # 1 hour
+RECRAWL_MAX_INTERVAL = 2419200  # 4 weeks
+
+# Sitemap discovery for priority domains (or pass -a sitemap_mode=1)
+SITEMAP_DISCOVERY_ENABLED = False
+SITEMAP_MAX_URLS_PER_HOST = 5000
+# Most bytes decompressed from a gzipped sitemap (the protocol limit is 50 MB)
+SITEMAP_MAX_SIZE = 50 * 1024 ** 2
+# Skip sitemap entries whose lastmod is older than this, 0 disables the filter
+SITEMAP_MAX_AGE_DAYS = 730
+
+# Spider middlewares: times spider callbacks for crawl instrumentation
+SPIDER_MIDDLEWARES = {
+    'resource_crawler.middlewares.ResourceCrawlerSpiderMiddleware': 950,
+}
+
+# Crawl instrumentation: per-stage latency, throughput and queue depths
+# published to Redis (crawler:metrics:<instance>), see `scrapy crawl_metrics`
+EXTENSIONS = {
+    'resource_crawler.instrumentation.CrawlInstrumentation': 500,
+    'resource_crawler.offload.ExtractionOffload': 510,
+}
+METRICS_ENABLED = True
+METRICS_INTERVAL = 10
+# Prometheus text file, {instance} is replaced by the worker id
+METRICS_FILE = None
+# Busiest domains with their own stage histograms in METRICS_FILE (0 = none)
+METRICS_FILE_DOMAINS = 0
+# Per-domain stage histograms kept in memory, least recently used dropped first
+METRICS_MAX_DOMAIN_STAGES = 2000
+# Time every is_resource_page selector rule (adds overhead)
+METRICS_PROFILE_SELECTORS = False
+
+# Classify and extract pages in worker processes (0 workers = one per CPU,
+# 0 pending = twice the workers)
+EXTRACTION_POOL_ENABLED = False
+EXTRACTION_POOL_WORKERS = 0
+EXTRACTION_POOL_MAX_PENDING = 0
 
 # Configure item pipelines
 ITEM_PIPELINES = {
@@ -41,7 +124,9 @@ LOG_FORMAT = '%(asctime)s [%(name)s] %(levelname)s: %(message)s'
 
 # Configure depth - increased substantially to allow deeper crawling
 DEPTH_LIMIT = 12
-DEPTH_PRIORITY = 1
+# Depth is already part of the frontier score (see resource_crawler/frontier.py)
+DEPTH_PRIORITY = 0
+# Requests are dequeued by frontier score; LIFO only breaks ties within a priority
 SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleLifoDiskQueue'
 SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.LifoMemoryQueue'
 
@@ -69,12 +154,39 @@ SIGNALS_ENABLED = False
 REDIS_HOST = 'redis'
 REDIS_PORT = 6379
 
+# Distributed workers: entries popped from the worker queue at a time, seconds
+# a blocking pop waits for new URLs, and idle seconds before a worker exits
+# (0 = keep running)
+BATCH_SIZE = 100
+WORKER_BLOCK_TIMEOUT = 5
+WORKER_IDLE_TIMEOUT = 0
+
+# Seconds between worker heartbeats (they expire after three intervals) and
+# seconds a claimed URL may stay unacknowledged before it is requeued
+WORKER_HEARTBEAT_INTERVAL = 10
+WORKER_LEASE_SECONDS = 900
+
+# Query jobs: pages of the running jobs each worker keeps in progress, and
+# seconds between checks for new job pages
+JOB_CONCURRENCY = 16
+JOB_POLL_INTERVAL = 1
+
+# Crawl state: days before a queued or crawled URL may be crawled again, time
+# buckets the horizon is split into, and bits of the URL hash that pick a
+# bucket's shard. The coordinator reads the same names from its environment.
+CRAWL_STATE_HORIZON_DAYS = 30
+CRAWL_STATE_BUCKETS = 4
+CRAWL_STATE_SHARD_BITS = 16
+
 # Elasticsearch settings 
 ELASTICSEARCH_HOST = 'elasticsearch'
 ELASTICSEARCH_PORT = 9200
 
 # Real-time updates
 REALTIME_UPDATES = True
+# Entries kept in the results stream (search:results:stream) that streaming
+# clients can resume from after reconnecting
+RESULTS_STREAM_MAXLEN = 100000
 
 # Disable auto-throttling to crawl faster
 AUTOTHROTTLE_ENABLED = False
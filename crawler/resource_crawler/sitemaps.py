@@ -0,0 +1,202 @@
+"""
+Sitemap-driven discovery.
+
+Instead of finding documentation pages by following every link from the
+start URLs, SitemapDiscoveryMixin reads the robots.txt sitemap entries (or
+/sitemap.xml) of the priority domains the spider starts from. It walks
+sitemap indexes and stream-parses sitemaps, gzipped or not, with bounded
+memory. Entries are filtered with the spider's should_follow rules and
+their lastmod, then handed to the spider's handle_sitemap_urls() in chunks.
+
+Enable it with `-a sitemap_mode=1` or the SITEMAP_DISCOVERY_ENABLED setting.
+"""
+
+import gzip
+import logging
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from urllib.parse import urlparse
+
+import scrapy
+from lxml import etree
+from scrapy.utils.sitemap import sitemap_urls_from_robots
+
+from resource_crawler.frontier import PRIORITY_DOMAINS
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Largest uncompressed sitemap the protocol allows
+MAX_SITEMAP_SIZE = 50 * 1024 ** 2
+
+
+class BoundedReader:
+    """Reads a decompressing stream up to max_size bytes, then reports end of file"""
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.remaining = max_size
+        self.truncated = False
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        if not data and not self.truncated and self.stream.read(1):
+            self.truncated = True
+            logger.warning("Sitemap larger than its size limit once decompressed, ignoring the rest")
+        return data
+
+
+def parse_lastmod(value):
+    """Parse a W3C datetime from a sitemap, returning an aware datetime or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def iter_sitemap(body, max_size=MAX_SITEMAP_SIZE):
+    """
+    Stream-parse a sitemap or sitemap index.
+
+    Elements are cleared as soon as they are read, so memory stays flat even
+    for 50,000-entry sitemaps.
+
+    Args:
+        body (bytes): Raw sitemap, optionally gzip-compressed
+        max_size (int): Most bytes decompressed from a gzipped sitemap
+
+    Yields:
+        tuple: (kind, loc, lastmod) where kind is 'sitemap' for index
+        entries and 'url' for page entries
+    """
+    stream = BytesIO(body)
+    if body[:2] == GZIP_MAGIC:
+        stream = BoundedReader(gzip.GzipFile(fileobj=stream), max_size)
+
+    context = etree.iterparse(
+        stream, events=('end',), resolve_entities=False, no_network=True, huge_tree=True, recover=True
+    )
+    loc = lastmod = None
+    for _, element in context:
+        tag = etree.QName(element).localname if isinstance(element.tag, str) else ''
+        if tag == 'loc':
+            loc = (element.text or '').strip()
+        elif tag == 'lastmod':
+            lastmod = element.text
+        elif tag in ('url', 'sitemap'):
+            if loc:
+                yield tag, loc, parse_lastmod(lastmod)
+            loc = lastmod = None
+            # Drop the finished entry and everything parsed before it
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+class SitemapDiscoveryMixin:
+    """
+    Adds sitemap discovery to a spider.
+
+    The spider must provide should_follow(url) and handle_sitemap_urls(urls),
+    which turns a chunk of sitemap URLs into requests or frontier entries.
+    """
+
+    # Overridden by `-a sitemap_mode=1`
+    sitemap_mode = None
+
+    # Number of URLs handed to handle_sitemap_urls() at a time
+    sitemap_chunk_size = 1000
+
+    def sitemap_enabled(self):
+        if self.sitemap_mode is not None:
+            return str(self.sitemap_mode).lower() in ('1', 'true', 'yes', 'on')
+        return self.settings.getbool('SITEMAP_DISCOVERY_ENABLED', False)
+
+    def sitemap_hosts(self):
+        """Hosts of the start URLs that belong to a priority domain"""
+        extra = getattr(self, 'sitemap_domains', None)
+        if extra:
+            return [host.strip() for host in extra.split(',') if host.strip()]
+
+        hosts = []
+        for url in getattr(self, 'start_urls', None) or self.default_start_urls:
+            host = urlparse(url).netloc
+            if host not in hosts and any(domain in host for domain in PRIORITY_DOMAINS):
+                hosts.append(host)
+        return hosts
+
+    def sitemap_start_requests(self):
+        self.sitemap_url_counts = {}
+        for host in self.sitemap_hosts():
+            yield scrapy.Request(
+                f'https://{host}/robots.txt',
+                callback=self.parse_robots,
+                errback=self.robots_failed,
+                meta={'early_abort': False, 'sitemap_host': host},
+                dont_filter=True
+            )
+
+    def _sitemap_request(self, url, host):
+        return scrapy.Request(
+            url,
+            callback=self.parse_sitemap,
+            meta={'early_abort': False, 'sitemap_host': host},
+            dont_filter=True
+        )
+
+    def parse_robots(self, response):
+        host = response.meta['sitemap_host']
+        sitemap_urls = list(sitemap_urls_from_robots(response.text, base_url=response.url))
+        if not sitemap_urls:
+            sitemap_urls = [f'https://{host}/sitemap.xml']
+        logger.info(f"Found {len(sitemap_urls)} sitemaps for {host}")
+        for url in sitemap_urls:
+            yield self._sitemap_request(url, host)
+
+    def robots_failed(self, failure):
+        host = failure.request.meta['sitemap_host']
+        logger.info(f"No robots.txt for {host}, trying /sitemap.xml")
+        return [self._sitemap_request(f'https://{host}/sitemap.xml', host)]
+
+    def parse_sitemap(self, response):
+        host = response.meta['sitemap_host']
+        max_urls = self.settings.getint('SITEMAP_MAX_URLS_PER_HOST', 5000)
+        max_age = self.settings.getint('SITEMAP_MAX_AGE_DAYS', 0)
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max_age) if max_age else None
+
+        chunk = []
+        skipped = 0
+        max_size = self.settings.getint('SITEMAP_MAX_SIZE', MAX_SITEMAP_SIZE)
+        for kind, loc, lastmod in iter_sitemap(response.body, max_size):
+            if self.sitemap_url_counts.get(host, 0) >= max_urls:
+                break
+            if cutoff and lastmod and lastmod < cutoff:
+                skipped += 1
+                continue
+            if kind == 'sitemap':
+                yield self._sitemap_request(loc, host)
+            elif self.should_follow(loc):
+                chunk.append(loc)
+                self.sitemap_url_counts[host] = self.sitemap_url_counts.get(host, 0) + 1
+                if len(chunk) >= self.sitemap_chunk_size:
+                    yield from self.handle_sitemap_urls(chunk) or ()
+                    chunk = []
+
+        if chunk:
+            yield from self.handle_sitemap_urls(chunk) or ()
+        logger.info(
+            f"Parsed sitemap {response.url}: {self.sitemap_url_counts.get(host, 0)} URLs from {host}, "
+            f"{skipped} skipped as older than {max_age} days"
+        )
@@ -9,24 +9,73 @@ For standalone crawling, see resource_spider.py instead.
 
 import scrapy
 from resource_crawler.items import ResourceItem
+from resource_crawler.frontier import (
+    INFLIGHT_PREFIX, WORKER_IDS_KEY, WORKER_QUEUE_PREFIX, WORKER_STATUS_PREFIX, CrawlState, RedisFrontier, decode_entry,
+    publish_result, score_url
+)
+from resource_crawler.jobs import QueryJobs
+from resource_crawler.sitemaps import SitemapDiscoveryMixin
+from resource_crawler.instrumentation import match_any_rule
+from resource_crawler.offload import extract_page
+from resource_crawler.extractors import extract_site_fields
 import re
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urldefrag, urlparse, urljoin
 from datetime import datetime
 import logging
 import json
 import redis
 from scrapy.utils.project import get_project_settings
-import hashlib
+import os
+from resource import RUSAGE_SELF, getrusage
+import time
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet import task, threads
+from twisted.internet.defer import Deferred
 
 logger = logging.getLogger(__name__)
 
-class DistributedResourceSpider(scrapy.Spider):
+# Selector rules that indicate a page holds programming resources,
+# evaluated in order until one matches
+RESOURCE_INDICATOR_RULES = (
+    ('css', 'pre'), ('css', 'code'),
+    ('xpath', '//h1[contains(text(), "Guide")]'),
+    ('xpath', '//h1[contains(text(), "Tutorial")]'),
+    ('css', 'article'), ('css', '.markdown-body'),
+    ('css', '.documentation'), ('css', '.tutorial'),
+    ('css', '.content-body'), ('css', '.post-content'),
+)
+
+def current_rss():
+    """Resident memory of this process in bytes, or its peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux
+        return getrusage(RUSAGE_SELF).ru_maxrss * 1024
+
+class DistributedResourceSpider(SitemapDiscoveryMixin, scrapy.Spider):
     name = "distributed_resource_spider"
     
     # Get allowed domains from settings
     settings = get_project_settings()
     allowed_domains = settings.get('ALLOWED_DOMAINS', [])
     
+    # Use site-specific extractors (resource_crawler/extractors.py) where available
+    use_site_extractors = True
+    
+    # Workers run continuously, so the standalone crawl's page and time
+    # limits do not apply
+    custom_settings = {
+        'CLOSESPIDER_PAGECOUNT': 0,
+        'CLOSESPIDER_TIMEOUT': 0,
+    }
+    
+    # Resources go to the results stream with the page's acknowledgement
+    # (publish_resource), so ResourcePipeline does not add them again
+    publishes_results = True
+    
     # Default start URLs
     default_start_urls = [
         'https://github.com/topics/python',
@@ -69,27 +118,173 @@ class DistributedResourceSpider(scrapy.Spider):
         redis_port = self.settings.get('REDIS_PORT', 6379)
         self.redis_client = redis.Redis(host=redis_host, port=redis_port)
         
+        # Shared prioritized frontier
+        self.frontier = RedisFrontier(self.redis_client, state=CrawlState.from_settings(self.settings))
+        
+        # Claimed frontier entry of each start URL, acknowledged once crawled
+        self.start_entries = {}
+        
+        # Query jobs submitted by the API, and the claim time of each job
+        # entry this worker is crawling
+        self.jobs = QueryJobs(self.redis_client)
+        self.job_entries = {}
+        self.job_poll = None
+        
+        # Pending blocking wait on the worker queue and start of the current idle period
+        self.waiting = None
+        self.idle_since = None
+        self.heartbeat = None
+        
+        # Entries a previous run of this worker claimed but never finished
+        requeued = self.frontier.requeue(self.worker_id)
+        if requeued:
+            logger.info(f"Requeued {requeued} unfinished entries from the previous run of {self.worker_id}")
+        
         # Use distributed URL queue if available
         self.start_urls = self.get_start_urls(start_urls)
         
         logger.info(f"Initialized distributed spider {self.worker_id} with search query: {search_query}")
         logger.info(f"Starting URLs: {self.start_urls[:5]}...")
     
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(DistributedResourceSpider, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+    
+    @property
+    def queue_key(self):
+        return WORKER_QUEUE_PREFIX + self.worker_id
+    
+    @property
+    def status_key(self):
+        return WORKER_STATUS_PREFIX + self.worker_id
+    
+    def spider_opened(self, spider):
+        self.started = time.time()
+        self.last_progress = self.started
+        self.last_heartbeat = (time.monotonic(), 0, 0, 0)
+        self.heartbeat = task.LoopingCall(self.send_heartbeat)
+        self.heartbeat.start(self.settings.getfloat('WORKER_HEARTBEAT_INTERVAL', 10))
+        self.job_poll = task.LoopingCall(self.poll_jobs)
+        self.job_poll.start(self.settings.getfloat('JOB_POLL_INTERVAL', 1))
+    
+    def spider_closed(self, spider, reason):
+        if self.heartbeat and self.heartbeat.running:
+            self.heartbeat.stop()
+        if self.job_poll and self.job_poll.running:
+            self.job_poll.stop()
+        # Hand unfinished work back to the frontier instead of waiting for
+        # leases to expire. It was not tried, so it costs no attempt.
+        requeued = self.frontier.requeue(self.worker_id, attempted=False)
+        self.redis_client.delete(self.status_key)
+        logger.info(f"Worker {self.worker_id} closed ({reason}), requeued {requeued} unfinished entries")
+    
+    def worker_status(self):
+        """Throughput, errors, queues, busiest domains and memory of this worker"""
+        stats = self.crawler.stats
+        pages = stats.get_value('response_received_count', 0)
+        items = stats.get_value('item_scraped_count', 0)
+        errors = stats.get_value('downloader/exception_count', 0) + sum(
+            value for key, value in stats.get_stats().items() if key.startswith('spider_exceptions/')
+        )
+        
+        now = time.monotonic()
+        last_time, last_pages, last_items, last_errors = self.last_heartbeat
+        elapsed = max(now - last_time, 1e-6)
+        self.last_heartbeat = (now, pages, items, errors)
+        if pages > last_pages:
+            self.last_progress = time.time()
+        attempts = (pages - last_pages) + (errors - last_errors)
+        
+        engine = self.crawler.engine
+        domains = {}
+        scheduled = 0
+        if engine:
+            domains = {key: len(slot.active) for key, slot in engine.downloader.slots.items() if slot.active}
+            scheduled = len(engine.slot.scheduler) if engine.slot else 0
+        busiest = dict(sorted(domains.items(), key=lambda item: item[1], reverse=True)[:5])
+        
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.llen(self.queue_key)
+            pipe.zcard(INFLIGHT_PREFIX + self.worker_id)
+            queued, inflight = pipe.execute()
+        
+        return {
+            'updated': time.time(),
+            'started': self.started,
+            'pid': os.getpid(),
+            'pages_total': pages,
+            'items_total': items,
+            'errors_total': errors,
+            'pages_per_sec': round((pages - last_pages) / elapsed, 2),
+            'items_per_sec': round((items - last_items) / elapsed, 2),
+            'error_rate': round((errors - last_errors) / attempts, 3) if attempts else 0.0,
+            'queue': queued,
+            'inflight': inflight,
+            'job_pages': len(self.job_entries),
+            'scheduled': scheduled,
+            'domains': json.dumps(busiest),
+            'rss_mb': round(current_rss() / (1024 * 1024), 1),
+            'last_progress': self.last_progress,
+        }
+    
+    def send_heartbeat(self):
+        """Publish this worker's status hash, which expires if the worker stops"""
+        interval = self.settings.getfloat('WORKER_HEARTBEAT_INTERVAL', 10)
+        try:
+            status = self.worker_status()
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(self.status_key, mapping=status)
+                pipe.expire(self.status_key, int(interval * 3))
+                pipe.sadd(WORKER_IDS_KEY, self.worker_id)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not send heartbeat for {self.worker_id}: {e}")
+    
+    def claim_batch(self):
+        """Atomically claim up to BATCH_SIZE entries from this worker's queue"""
+        return self.frontier.claim(
+            self.worker_id, self.settings.getint('BATCH_SIZE', 100), self.settings.getint('WORKER_LEASE_SECONDS', 900)
+        )
+    
+    def poll_jobs(self):
+        """
+        Keep up to JOB_CONCURRENCY pages of the running query jobs in progress.
+        
+        Job pages are claimed a few at a time by every worker, so a job
+        spreads over the whole cluster, and are scheduled ahead of this
+        worker's share of the background crawl.
+        """
+        lease = self.settings.getint('WORKER_LEASE_SECONDS', 900)
+        # Entries whose request never came back were requeued with their lease
+        expired = time.monotonic() - lease
+        self.job_entries = {raw: claimed for raw, claimed in self.job_entries.items() if claimed > expired}
+        slots = self.settings.getint('JOB_CONCURRENCY', 16) - len(self.job_entries)
+        if slots <= 0:
+            return
+        try:
+            claimed = self.jobs.claim(self.worker_id, slots, lease)
+        except redis.RedisError as e:
+            logger.warning(f"Could not claim query job pages for {self.worker_id}: {e}")
+            return
+        now = time.monotonic()
+        for raw, entry in claimed:
+            self.job_entries[raw] = now
+        if claimed:
+            self.idle_since = None
+            self.schedule_entries(claimed)
+    
     def get_start_urls(self, start_urls=None):
         """Get URLs from Redis queue or use provided ones"""
-        # Check if there are URLs in Redis
-        urls_key = f'crawler:pending_urls:{self.worker_id}'
-        urls = self.redis_client.lrange(urls_key, 0, -1)
-        
-        if urls:
-            # Get a batch of URLs from Redis
-            batch_size = self.settings.get('BATCH_SIZE', 10)
-            batch_urls = []
-            for _ in range(min(batch_size, len(urls))):
-                url = self.redis_client.lpop(urls_key)
-                if url:
-                    batch_urls.append(url.decode('utf-8'))
-            return batch_urls
+        # Take the first batch from this worker's queue, if it has any
+        claimed = self.claim_batch()
+        if claimed:
+            for raw, entry in claimed:
+                self.start_entries[entry['url']] = raw
+            return [entry['url'] for _, entry in claimed]
         
         # If no URLs in Redis, use provided start_urls or defaults
         if start_urls:
@@ -101,70 +296,200 @@ class DistributedResourceSpider(scrapy.Spider):
         # Use default URLs
         return self.default_start_urls
     
+    def start_requests(self):
+        # Sitemaps of priority domains feed the shared frontier directly
+        if self.sitemap_enabled():
+            yield from self.sitemap_start_requests()
+        for url in self.start_urls:
+            raw = self.start_entries.pop(url, None)
+            entry = decode_entry(raw) if raw else {}
+            yield self.queue_request(url, entry.get('depth', 0), raw, recrawl=entry.get('recrawl', False))
+    
+    def queue_request(self, url, depth, raw=None, job=None, recrawl=False):
+        return scrapy.Request(
+            url,
+            dont_filter=True,
+            errback=self.request_failed,
+            # Query job pages go ahead of the background crawl
+            priority=1 if job else 0,
+            # Query job pages are always fetched and parsed in full
+            meta={
+                'frontier_depth': depth, 'frontier_entry': raw, 'job': job, 'recrawl': recrawl,
+                'recrawl_force': bool(job)
+            }
+        )
+    
+    def schedule_entries(self, claimed):
+        for raw, entry in claimed:
+            self.crawler.engine.crawl(
+                self.queue_request(entry['url'], entry['depth'], raw, entry['job'], entry['recrawl'])
+            )
+    
+    def request_failed(self, failure):
+        """Acknowledge requests that failed for good, so they are not requeued"""
+        raw = failure.request.meta.get('frontier_entry')
+        job = failure.request.meta.get('job')
+        if raw:
+            with self.redis_client.pipeline(transaction=False) as pipe:
+                self.frontier.ack(self.worker_id, [raw], client=pipe)
+                if job:
+                    self.jobs.record(job, client=pipe, failed=1)
+                pipe.execute()
+            self.job_entries.pop(raw, None)
+        logger.debug(f"Request failed: {failure.request.url}: {failure.getErrorMessage()}")
+    
+    def parse_failed(self, response, exception):
+        """
+        Acknowledge pages whose callback or extraction failed, so they are not
+        requeued and retried when their lease expires.
+        
+        Called from ResourceCrawlerSpiderMiddleware.process_spider_exception.
+        """
+        raw = response.meta.get('frontier_entry')
+        job = response.meta.get('job')
+        if raw:
+            # Only entries still in flight count as failed; a page may fail
+            # after process_page acknowledged it
+            if self.frontier.ack(self.worker_id, [raw]) and job:
+                self.jobs.record(job, failed=1)
+            self.job_entries.pop(raw, None)
+        self.crawler.stats.inc_value('worker/parse_failed', spider=self)
+        logger.warning(f"Failed to parse {response.url}: {exception!r}")
+    
+    def spider_idle(self, spider):
+        """
+        Refill the scheduler from this worker's queue whenever it runs dry.
+        
+        The worker stays alive while its queue is empty: a blocking wait in a
+        thread returns as soon as new URLs arrive. It only closes after
+        WORKER_IDLE_TIMEOUT seconds without work, if that is set.
+        """
+        if self.waiting is not None:
+            raise DontCloseSpider
+        
+        claimed = self.claim_batch()
+        if claimed:
+            self.idle_since = None
+            self.schedule_entries(claimed)
+            raise DontCloseSpider
+        
+        now = time.monotonic()
+        if self.idle_since is None:
+            self.idle_since = now
+        idle_timeout = self.settings.getint('WORKER_IDLE_TIMEOUT', 0)
+        if idle_timeout and now - self.idle_since >= idle_timeout:
+            logger.info(f"Worker {self.worker_id} idle for {idle_timeout}s, closing")
+            return
+        
+        # Moving the head of the queue onto itself blocks until the queue is
+        # non-empty without taking anything off it; claim_batch() does that
+        self.waiting = threads.deferToThread(
+            self.redis_client.blmove, self.queue_key, self.queue_key,
+            self.settings.getint('WORKER_BLOCK_TIMEOUT', 5), 'LEFT', 'LEFT'
+        )
+        self.waiting.addCallbacks(self.queue_ready, self.queue_failed)
+        raise DontCloseSpider
+    
+    def queue_ready(self, head):
+        self.waiting = None
+        if head:
+            self.idle_since = None
+            self.schedule_entries(self.claim_batch())
+    
+    def queue_failed(self, failure):
+        self.waiting = None
+        logger.warning(f"Could not read queue {self.queue_key}: {failure.getErrorMessage()}")
+    
     def parse(self, response):
-        # Store this URL as visited
-        self.mark_url_visited(response.url)
+        # Pages unchanged since the last visit only contribute their links
+        if response.meta.get('recrawl_unchanged'):
+            return self.process_page(None, response)
+        
+        # Check if page contains valuable resources, in the extraction pool when enabled
+        resource = extract_page(self, response)
+        if isinstance(resource, Deferred):
+            return resource.addCallback(self.process_page, response)
+        return self.process_page(resource, response)
+    
+    def process_page(self, resource, response):
+        # Pages of a query job are scored and published for the job's query
+        job = response.meta.get('job')
+        search_query = self.jobs.query(job) if job else self.search_query
         
-        # Extract links to follow
+        # Extract links to follow, each once per page
+        parent_quality = resource['quality_score'] if resource else 0.0
+        depth = response.meta.get('frontier_depth', 0) + 1
+        links = {}
         for link in response.css('a::attr(href)').getall():
-            full_url = response.urljoin(link)
-            if self.should_follow(full_url):
-                # Add URL to Redis queue for distributed processing
-                self.enqueue_url(full_url)
-        
-        # Check if page contains valuable resources
-        if self.is_resource_page(response):
-            resource = self.extract_resource(response)
+            full_url = urldefrag(response.urljoin(link))[0]
+            if full_url not in links and self.should_follow(full_url):
+                links[full_url] = score_url(full_url, search_query, parent_quality, depth)
+        
+        # Mark this page visited, queue unseen links to the frontier (or the
+        # job's frontier), acknowledge its frontier entry and publish the
+        # resource in a single round trip
+        with self.redis_client.pipeline(transaction=False) as pipe:
+            self.frontier.enqueue(
+                ((url, score, depth) for url, score in links.items()), visited_url=response.url, client=pipe, job=job
+            )
+            raw = response.meta.get('frontier_entry')
+            if raw:
+                self.frontier.ack(self.worker_id, [raw], client=pipe)
+                self.job_entries.pop(raw, None)
+            if job:
+                self.jobs.record(job, client=pipe, crawled=1, items=1 if resource else 0)
             if resource:
                 # Publish resource for real-time updates
-                self.publish_resource(resource)
-                yield resource
-    
-    def enqueue_url(self, url):
-        """Add URL to Redis queue if not already processed"""
-        # Generate URL hash for deduplication
-        url_hash = hashlib.md5(url.encode()).hexdigest()
-        
-        # Check if URL was already processed
-        if not self.redis_client.sismember('crawler:visited_urls', url_hash):
-            # Add to pending queue
-            self.redis_client.rpush('crawler:pending_urls', url)
-            # Mark as seen but not yet processed
-            self.redis_client.sadd('crawler:seen_urls', url_hash)
-    
-    def mark_url_visited(self, url):
-        """Mark URL as fully processed"""
-        url_hash = hashlib.md5(url.encode()).hexdigest()
-        self.redis_client.sadd('crawler:visited_urls', url_hash)
-    
-    def publish_resource(self, resource):
-        """Publish resource to Redis for real-time processing"""
+                self.publish_resource(resource, pipe, search_query)
+            pipe.execute()
+        
+        if resource:
+            yield resource
+    
+    def queue_depths(self):
+        """Lengths of the Redis queues feeding this worker, for instrumentation"""
+        return {
+            'frontier': len(self.frontier),
+            'worker_queue': self.redis_client.llen(self.queue_key),
+        }
+    
+    def handle_sitemap_urls(self, urls):
+        """Push URLs found in sitemaps into the shared frontier"""
+        self.frontier.enqueue((url, score_url(url, self.search_query, depth=1), 1) for url in urls)
+        return []
+    
+    def publish_resource(self, resource, client=None, search_query=None):
+        """Add resource to the results stream for real-time processing, optionally on a pipeline"""
+        client = client or self.redis_client
+        search_query = search_query or self.search_query
         resource_data = {
             'url': resource['url'],
             'title': resource['title'],
             'description': resource['description'],
             'type': resource['type'],
+            'domain': resource['domain'],
             'language': resource['languages'][0] if resource['languages'] else None,
+            'languages': resource['languages'],
+            'tags': resource['tags'],
+            'code_snippets': resource['code_snippets'],
             'timestamp': resource['timestamp']
         }
         
-        # Publish to Redis channel for real-time updates
-        if self.search_query:
-            # Only publish if the resource matches the search query
-            search_terms = self.search_query.lower().split()
+        if search_query:
+            # Clients of the query get the page even if it doesn't contain
+            # every word of it
+            resource_data['query'] = search_query
+            
+            # Score the resource for the query it was crawled for
+            search_terms = search_query.lower().split()
             content = (resource['title'] + ' ' + resource['description']).lower()
             
             if all(term in content for term in search_terms):
-                # Calculate relevance score
-                score = sum(content.count(term) for term in search_terms)
-                resource_data['score'] = score
-                
-                # Publish to search-specific channel
-                channel = f'search:results:{self.search_query}'
-                self.redis_client.publish(channel, json.dumps(resource_data))
+                resource_data['score'] = sum(content.count(term) for term in search_terms)
         
-        # Also publish to a general channel for all new resources
-        self.redis_client.publish('crawler:new_resources', json.dumps(resource_data))
+        # The streaming API matches every new resource against its clients'
+        # queries, so one stream serves all of them
+        publish_result(client, resource_data, self.settings.getint('RESULTS_STREAM_MAXLEN', 100000))
     
     def should_follow(self, url):
         # Define rules for which URLs to follow
@@ -179,28 +504,21 @@ class DistributedResourceSpider(scrapy.Spider):
         # Check if URL matches any relevant pattern
         if any(re.search(pattern, url, re.I) for pattern in relevant_patterns):
             # Check if URL is from allowed domains
+            # An empty allowed_domains list means no restriction
             domain = urlparse(url).netloc
-            if any(allowed in domain for allowed in self.allowed_domains):
+            if not self.allowed_domains or any(allowed in domain for allowed in self.allowed_domains):
                 return True
         return False
     
     def is_resource_page(self, response):
         # Detect if a page contains valuable resources
-        resource_indicators = [
-            response.css('pre'), response.css('code'),
-            response.xpath('//h1[contains(text(), "Guide")]'),
-            response.xpath('//h1[contains(text(), "Tutorial")]'),
-            response.css('article'), response.css('.markdown-body'),
-            response.css('.documentation'), response.css('.tutorial'),
-            response.css('.content-body'), response.css('.post-content')
-        ]
         
         # Check for programming keywords in title
         title = response.css('title::text').get() or ''
         programming_keywords = ['python', 'javascript', 'js', 'react', 'node', 'code', 'programming', 'tutorial', 'guide']
         has_programming_title = any(keyword in title.lower() for keyword in programming_keywords)
         
-        return has_programming_title or any(indicator for indicator in resource_indicators)
+        return has_programming_title or match_any_rule(self, response, RESOURCE_INDICATOR_RULES)
     
     def extract_resource(self, response):
         resource = ResourceItem()
@@ -208,10 +526,15 @@ class DistributedResourceSpider(scrapy.Spider):
         # Extract domain to categorize content
         domain = urlparse(response.url).netloc
         
+        # Use the site-specific extractor for high-volume domains, if one applies
+        site_fields = extract_site_fields(response) if self.use_site_extractors else {}
+        
         # Extract title and description
-        title = response.css('title::text').get() or response.css('h1::text').get()
-        meta_desc = response.css('meta[name="description"]::attr(content)').get()
-        description = meta_desc if meta_desc else ' '.join(response.css('p::text').getall()[:3])
+        title = site_fields.get('title') or response.css('title::text').get() or response.css('h1::text').get()
+        description = site_fields.get('description')
+        if not description:
+            meta_desc = response.css('meta[name="description"]::attr(content)').get()
+            description = meta_desc if meta_desc else ' '.join(response.css('p::text').getall()[:3])
         
         # Skip if no meaningful content
         if not title or not description:
@@ -223,7 +546,11 @@ class DistributedResourceSpider(scrapy.Spider):
         
         # Detect programming language
         languages = ['python', 'javascript', 'java', 'cpp', 'c++', 'ruby', 'php', 'golang', 'rust', 'typescript', 'react']
-        detected_languages = [lang for lang in languages if lang.lower() in (title + ' ' + description).lower()]
+        # Site extractors read tags from the page (e.g. the question tags on
+        # Stack Overflow), which name the language more reliably than the text
+        site_tags = {tag.strip().lower() for tag in site_fields.get('tags', '').split(',')}
+        text = (title + ' ' + description).lower()
+        detected_languages = [lang for lang in languages if lang.lower() in text or lang.lower() in site_tags]
         
         # If search query is provided, only process content related to that query
         if self.search_query and self.search_query.lower() not in (title + ' ' + description).lower():
@@ -236,20 +563,22 @@ class DistributedResourceSpider(scrapy.Spider):
             '.documentation', '.tutorial-content'
         ]
         
-        content = None
-        for selector in content_selectors:
-            content = response.css(f'{selector}::text').getall()
-            if content:
-                content = ' '.join(content)
-                break
+        content = site_fields.get('content')
+        if not content:
+            for selector in content_selectors:
+                content = response.css(f'{selector}::text').getall()
+                if content:
+                    content = ' '.join(content)
+                    break
         
         # Extract code snippets
-        code_snippets = []
-        for code_block in response.css('pre code::text').getall():
-            code_snippets.append(code_block)
+        code_snippets = list(site_fields.get('code_snippets', []))
+        if not code_snippets:
+            for code_block in response.css('pre code::text').getall():
+                code_snippets.append(code_block)
         
         # Extract tags/keywords
-        tags = response.css('meta[name="keywords"]::attr(content)').get()
+        tags = site_fields.get('tags') or response.css('meta[name="keywords"]::attr(content)').get()
         
         # Determine resource type
         resource_type = 'article'  # default
@@ -9,21 +9,224 @@ For distributed crawling, see distributed_spider.py instead.
 
 import scrapy
 from resource_crawler.items import ResourceItem
+from resource_crawler.frontier import PRIORITY_DOMAINS, VALUABLE_URL_PATTERNS, score_url, url_priority
+from resource_crawler.sitemaps import SitemapDiscoveryMixin
+from resource_crawler.instrumentation import match_any_rule
+from resource_crawler.offload import extract_page
+from resource_crawler.extractors import extract_site_fields
 import re
 from urllib.parse import urlparse, urljoin
 from datetime import datetime
 import logging
 from scrapy.utils.project import get_project_settings
+from twisted.internet.defer import Deferred
 
 logger = logging.getLogger(__name__)
 
-class ResourceSpider(scrapy.Spider):
+# Selector rules that indicate a page holds programming resources,
+# evaluated in order until one matches
+RESOURCE_INDICATOR_RULES = (
+    # Code examples
+    ('css', 'pre'), ('css', 'code'),
+    ('css', '.highlight'), ('css', '.code'),
+    ('css', '.CodeMirror'), ('css', '.ace_editor'),
+    ('css', '.program'), ('css', '.syntax'),
+    
+    # Documentation structures
+    ('css', '.markdown-body'), ('css', '.documentation'),
+    ('css', '.api-docs'), ('css', '.reference'),
+    ('css', '.man-page'), ('css', '.docstring'),
+    ('css', '.manual'), ('css', '.handbook'),
+    
+    # Tutorials and guides
+    ('xpath', '//h1[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "guide")]'),
+    ('xpath', '//h1[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "tutorial")]'),
+    ('xpath', '//h1[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "how to")]'),
+    ('xpath', '//h2[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "tutorial")]'),
+    ('xpath', '//h2[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "guide")]'),
+    ('xpath', '//h2[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "introduction")]'),
+    
+    # Legacy language specific indicators
+    ('xpath', '//pre[contains(@class, "cobol")]'),
+    ('xpath', '//pre[contains(@class, "fortran")]'),
+    ('xpath', '//code[contains(@class, "cobol")]'),
+    ('xpath', '//code[contains(@class, "fortran")]'),
+    ('xpath', '//table[contains(@class, "syntax")]'),
+    ('xpath', '//div[contains(@class, "compiler")]'),
+    
+    # Common content containers
+    ('css', 'article'), ('css', '.post'),
+    ('css', '.entry'), ('css', '.content'),
+    ('css', '#content'), ('css', 'main'),
+    ('css', '.page'), ('css', '.doc'),
+    
+    # Technical blogs
+    ('css', '.blog-post'), ('css', '.article'),
+    ('css', '.entry-content'), ('css', '.blog-entry'),
+    
+    # Forums and Q&A
+    ('css', '.question'), ('css', '.answer'),
+    ('css', '.post-text'), ('css', '.comment-body'),
+    ('css', '.reply'), ('css', '.discussion'),
+    
+    # Educational content
+    ('css', '.lesson'), ('css', '.course'),
+    ('css', '.curriculum'), ('css', '.tutorial'),
+    ('css', '.lecture'), ('css', '.module'),
+)
+
+
+def search_seed_urls(search_query):
+    """Search and listing pages of programming resource sites for a query"""
+    return [
+        # Major programming resource sites
+        f'https://github.com/topics/{search_query}',
+        f'https://stackoverflow.com/questions/tagged/{search_query}',
+        f'https://stackoverflow.com/search?q={search_query}',
+        f'https://dev.to/t/{search_query}',
+        f'https://dev.to/search?q={search_query}',
+        f'https://medium.com/search?q={search_query}',
+        f'https://www.geeksforgeeks.org/search/{search_query}',
+        f'https://www.freecodecamp.org/news/search/?query={search_query}',
+        f'https://www.digitalocean.com/community/tutorials?q={search_query}',
+        f'https://realpython.com/search?q={search_query}',
+        f'https://www.tutorialspoint.com/index.htm?search={search_query}',
+        f'https://www.tutorialspoint.com/{search_query}/index.htm',
+        f'https://hackernoon.com/search?query={search_query}',
+        f'https://substack.com/search?q={search_query}',
+        
+        # Documentation sites
+        f'https://docs.python.org/3/search.html?q={search_query}',
+        f'https://developer.mozilla.org/en-US/search?q={search_query}',
+        f'https://www.w3schools.com/search/search.php?q={search_query}',
+        f'https://ibm.github.io/mainframe-downloads/search.html?q={search_query}',
+        f'https://docs.oracle.com/search/?q={search_query}',
+        f'https://learn.microsoft.com/en-us/search/?terms={search_query}',
+        f'https://www.ibm.com/search?q={search_query}',
+        
+        # Google search - expanded with more variations
+        f'https://www.google.com/search?q={search_query}+programming+tutorial',
+        f'https://www.google.com/search?q={search_query}+programming+guide',
+        f'https://www.google.com/search?q={search_query}+coding+tutorial',
+        f'https://www.google.com/search?q={search_query}+programming+examples',
+        f'https://www.google.com/search?q={search_query}+language+tutorial',
+        f'https://www.google.com/search?q={search_query}+programming+book',
+        f'https://www.google.com/search?q={search_query}+documentation',
+        f'https://www.google.com/search?q=learn+{search_query}+programming',
+        f'https://www.google.com/search?q=best+{search_query}+resources',
+        f'https://www.google.com/search?q={search_query}+implementation',
+        f'https://www.google.com/search?q={search_query}+language+specification',
+        f'https://www.google.com/search?q={search_query}+code+examples',
+        f'https://www.google.com/search?q={search_query}+reference+manual',
+        f'https://www.google.com/search?q={search_query}+programming+language',
+        f'https://www.google.com/search?q={search_query}+compiler',
+        f'https://www.google.com/search?q={search_query}+interpreter',
+        f'https://www.google.com/search?q=what+is+{search_query}',
+        f'https://www.google.com/search?q={search_query}+history',
+        f'https://www.google.com/search?q={search_query}+vs',
+        # Pure search query without modifiers - broadest possible
+        f'https://www.google.com/search?q={search_query}',
+        
+        # Other search engines 
+        f'https://www.bing.com/search?q={search_query}+programming+guide',
+        f'https://www.bing.com/search?q={search_query}+programming',
+        f'https://duckduckgo.com/?q={search_query}+programming',
+        f'https://duckduckgo.com/?q={search_query}',
+        f'https://search.brave.com/search?q={search_query}+programming',
+        f'https://search.brave.com/search?q={search_query}',
+        f'https://www.startpage.com/do/search?q={search_query}+programming',
+        f'https://www.qwant.com/?q={search_query}+programming',
+        f'https://www.mojeek.com/search?q={search_query}+programming',
+        f'https://search.yahoo.com/search?p={search_query}+programming',
+        
+        # Forums
+        f'https://www.reddit.com/search/?q={search_query}+programming',
+        f'https://www.reddit.com/r/learnprogramming/search/?q={search_query}',
+        f'https://www.reddit.com/r/programming/search/?q={search_query}',
+        f'https://news.ycombinator.com/item?id=search&q={search_query}',
+        f'https://forums.oracle.com/ords/apexds/domain/dev-community/search?search={search_query}',
+        f'https://community.ibm.com/community/user/search?query={search_query}',
+        f'https://stackoverflow.blog/?s={search_query}',
+        f'https://discuss.codecademy.com/search?q={search_query}',
+        f'https://talk.automators.fm/search?q={search_query}',
+        
+        # Video platforms
+        f'https://www.youtube.com/results?search_query={search_query}+programming+tutorial',
+        f'https://www.youtube.com/results?search_query={search_query}+tutorial',
+        f'https://www.youtube.com/results?search_query=learn+{search_query}',
+        f'https://vimeo.com/search?q={search_query}+programming',
+        
+        # University course repositories
+        f'https://ocw.mit.edu/search/?q={search_query}',
+        f'https://www.coursera.org/search?query={search_query}',
+        f'https://www.khanacademy.org/search?page_search_query={search_query}',
+        f'https://www.edx.org/search?q={search_query}',
+        f'https://www.udemy.com/courses/search/?src=ukw&q={search_query}',
+        f'https://www.udacity.com/courses/all?search={search_query}',
+        f'https://online-learning.harvard.edu/search-classes/{search_query}',
+        f'https://online.stanford.edu/search-catalog/{search_query}',
+        
+        # Specialized programming sites
+        f'https://legacy.cplusplus.com/search.do?q={search_query}',
+        f'https://en.cppreference.com/mwiki/index.php?title=Special%3ASearch&search={search_query}',
+        f'https://www.sourcecodesworld.com/source/search.asp?key={search_query}',
+        f'https://sourceforge.net/directory/?q={search_query}',
+        f'https://mvnrepository.com/search?q={search_query}',
+        f'https://devdocs.io/#q={search_query}',
+        f'https://hackage.haskell.org/packages/search?terms={search_query}',
+        f'https://crates.io/search?q={search_query}',
+        f'https://www.npmjs.com/search?q={search_query}',
+        f'https://pypi.org/search/?q={search_query}',
+        f'https://rubygems.org/search?query={search_query}',
+        f'https://packagist.org/?query={search_query}',
+        
+        # Legacy language specific resources
+        f'https://www.microfocus.com/search?q={search_query}',
+        f'https://www.mainframestechhelp.com/search-results?query={search_query}',
+        f'https://www.ibm.com/search?lang=en&cc=us&q={search_query}',
+        f'https://fortran-lang.org/search/?q={search_query}',
+        f'https://www.ibm.com/docs/en/search/{search_query}',
+        f'https://www.tutorialspoint.com/{search_query.lower()}/index.htm',
+        
+        # Academic resources
+        f'https://scholar.google.com/scholar?q={search_query}+programming',
+        f'https://arxiv.org/search/?query={search_query}&searchtype=all',
+        f'https://dl.acm.org/action/doSearch?AllField={search_query}',
+        f'https://ieeexplore.ieee.org/search/searchresult.jsp?queryText={search_query}',
+        f'https://www.sciencedirect.com/search?qs={search_query}',
+        f'https://link.springer.com/search?query={search_query}',
+        f'https://pubmed.ncbi.nlm.nih.gov/?term={search_query}+programming',
+        
+        # Books and documentation
+        f'https://books.google.com/books?q={search_query}+programming',
+        f'https://archive.org/search?query={search_query}%20programming',
+        f'https://www.pdfdrive.com/search?q={search_query}+programming',
+        f'https://openlibrary.org/search?q={search_query}+programming',
+        f'https://www.gutenberg.org/ebooks/search/?query={search_query}',
+        f'https://www.oreilly.com/search/?query={search_query}',
+        f'https://www.manning.com/search?q={search_query}',
+        f'https://www.packtpub.com/search?query={search_query}',
+        
+        # General websites
+        f'https://en.wikipedia.org/w/index.php?search={search_query}+programming+language',
+        f'https://wiki.c2.com/?SearchResults&search={search_query}',
+        f'https://www.wikiwand.com/?search={search_query}',
+        f'https://rosettacode.org/w/index.php?search={search_query}',
+        f'https://alternativeto.net/browse/search?q={search_query}',
+        f'https://lobste.rs/search?q={search_query}&what=stories&order=relevance'
+    ]
+
+
+class ResourceSpider(SitemapDiscoveryMixin, scrapy.Spider):
     name = "resource_spider"
     
     # Get allowed domains from settings
     settings = get_project_settings()
     allowed_domains = settings.get('ALLOWED_DOMAINS', [])
     
+    # Use site-specific extractors (resource_crawler/extractors.py) where available
+    use_site_extractors = True
+    
     # Default start URLs
     default_start_urls = [
         'https://github.com/topics/python',
@@ -63,144 +266,7 @@ class ResourceSpider(scrapy.Spider):
         if search_query:
             logger.info(f"Initializing spider with search query: {search_query}")
             
-            # Add specific search URLs for different sites based on the query
-            search_specific_urls = [
-                # Major programming resource sites
-                f'https://github.com/topics/{search_query}',
-                f'https://stackoverflow.com/questions/tagged/{search_query}',
-                f'https://stackoverflow.com/search?q={search_query}',
-                f'https://dev.to/t/{search_query}',
-                f'https://dev.to/search?q={search_query}',
-                f'https://medium.com/search?q={search_query}',
-                f'https://www.geeksforgeeks.org/search/{search_query}',
-                f'https://www.freecodecamp.org/news/search/?query={search_query}',
-                f'https://www.digitalocean.com/community/tutorials?q={search_query}',
-                f'https://realpython.com/search?q={search_query}',
-                f'https://www.tutorialspoint.com/index.htm?search={search_query}',
-                f'https://www.tutorialspoint.com/{search_query}/index.htm',
-                f'https://hackernoon.com/search?query={search_query}',
-                f'https://substack.com/search?q={search_query}',
-                
-                # Documentation sites
-                f'https://docs.python.org/3/search.html?q={search_query}',
-                f'https://developer.mozilla.org/en-US/search?q={search_query}',
-                f'https://www.w3schools.com/search/search.php?q={search_query}',
-                f'https://ibm.github.io/mainframe-downloads/search.html?q={search_query}',
-                f'https://docs.oracle.com/search/?q={search_query}',
-                f'https://learn.microsoft.com/en-us/search/?terms={search_query}',
-                f'https://www.ibm.com/search?q={search_query}',
-                
-                # Google search - expanded with more variations
-                f'https://www.google.com/search?q={search_query}+programming+tutorial',
-                f'https://www.google.com/search?q={search_query}+programming+guide',
-                f'https://www.google.com/search?q={search_query}+coding+tutorial',
-                f'https://www.google.com/search?q={search_query}+programming+examples',
-                f'https://www.google.com/search?q={search_query}+language+tutorial',
-                f'https://www.google.com/search?q={search_query}+programming+book',
-                f'https://www.google.com/search?q={search_query}+documentation',
-                f'https://www.google.com/search?q=learn+{search_query}+programming',
-                f'https://www.google.com/search?q=best+{search_query}+resources',
-                f'https://www.google.com/search?q={search_query}+implementation',
-                f'https://www.google.com/search?q={search_query}+language+specification',
-                f'https://www.google.com/search?q={search_query}+code+examples',
-                f'https://www.google.com/search?q={search_query}+reference+manual',
-                f'https://www.google.com/search?q={search_query}+programming+language',
-                f'https://www.google.com/search?q={search_query}+compiler',
-                f'https://www.google.com/search?q={search_query}+interpreter',
-                f'https://www.google.com/search?q=what+is+{search_query}',
-                f'https://www.google.com/search?q={search_query}+history',
-                f'https://www.google.com/search?q={search_query}+vs',
-                # Pure search query without modifiers - broadest possible
-                f'https://www.google.com/search?q={search_query}',
-                
-                # Other search engines 
-                f'https://www.bing.com/search?q={search_query}+programming+guide',
-                f'https://www.bing.com/search?q={search_query}+programming',
-                f'https://duckduckgo.com/?q={search_query}+programming',
-                f'https://duckduckgo.com/?q={search_query}',
-                f'https://search.brave.com/search?q={search_query}+programming',
-                f'https://search.brave.com/search?q={search_query}',
-                f'https://www.startpage.com/do/search?q={search_query}+programming',
-                f'https://www.qwant.com/?q={search_query}+programming',
-                f'https://www.mojeek.com/search?q={search_query}+programming',
-                f'https://search.yahoo.com/search?p={search_query}+programming',
-                
-                # Forums
-                f'https://www.reddit.com/search/?q={search_query}+programming',
-                f'https://www.reddit.com/r/learnprogramming/search/?q={search_query}',
-                f'https://www.reddit.com/r/programming/search/?q={search_query}',
-                f'https://news.ycombinator.com/item?id=search&q={search_query}',
-                f'https://forums.oracle.com/ords/apexds/domain/dev-community/search?search={search_query}',
-                f'https://community.ibm.com/community/user/search?query={search_query}',
-                f'https://stackoverflow.blog/?s={search_query}',
-                f'https://discuss.codecademy.com/search?q={search_query}',
-                f'https://talk.automators.fm/search?q={search_query}',
-                
-                # Video platforms
-                f'https://www.youtube.com/results?search_query={search_query}+programming+tutorial',
-                f'https://www.youtube.com/results?search_query={search_query}+tutorial',
-                f'https://www.youtube.com/results?search_query=learn+{search_query}',
-                f'https://vimeo.com/search?q={search_query}+programming',
-                
-                # University course repositories
-                f'https://ocw.mit.edu/search/?q={search_query}',
-                f'https://www.coursera.org/search?query={search_query}',
-                f'https://www.khanacademy.org/search?page_search_query={search_query}',
-                f'https://www.edx.org/search?q={search_query}',
-                f'https://www.udemy.com/courses/search/?src=ukw&q={search_query}',
-                f'https://www.udacity.com/courses/all?search={search_query}',
-                f'https://online-learning.harvard.edu/search-classes/{search_query}',
-                f'https://online.stanford.edu/search-catalog/{search_query}',
-                
-                # Specialized programming sites
-                f'https://legacy.cplusplus.com/search.do?q={search_query}',
-                f'https://en.cppreference.com/mwiki/index.php?title=Special%3ASearch&search={search_query}',
-                f'https://www.sourcecodesworld.com/source/search.asp?key={search_query}',
-                f'https://sourceforge.net/directory/?q={search_query}',
-                f'https://mvnrepository.com/search?q={search_query}',
-                f'https://devdocs.io/#q={search_query}',
-                f'https://hackage.haskell.org/packages/search?terms={search_query}',
-                f'https://crates.io/search?q={search_query}',
-                f'https://www.npmjs.com/search?q={search_query}',
-                f'https://pypi.org/search/?q={search_query}',
-                f'https://rubygems.org/search?query={search_query}',
-                f'https://packagist.org/?query={search_query}',
-                
-                # Legacy language specific resources
-                f'https://www.microfocus.com/search?q={search_query}',
-                f'https://www.mainframestechhelp.com/search-results?query={search_query}',
-                f'https://www.ibm.com/search?lang=en&cc=us&q={search_query}',
-                f'https://fortran-lang.org/search/?q={search_query}',
-                f'https://www.ibm.com/docs/en/search/{search_query}',
-                f'https://www.tutorialspoint.com/{search_query.lower()}/index.htm',
-                
-                # Academic resources
-                f'https://scholar.google.com/scholar?q={search_query}+programming',
-                f'https://arxiv.org/search/?query={search_query}&searchtype=all',
-                f'https://dl.acm.org/action/doSearch?AllField={search_query}',
-                f'https://ieeexplore.ieee.org/search/searchresult.jsp?queryText={search_query}',
-                f'https://www.sciencedirect.com/search?qs={search_query}',
-                f'https://link.springer.com/search?query={search_query}',
-                f'https://pubmed.ncbi.nlm.nih.gov/?term={search_query}+programming',
-                
-                # Books and documentation
-                f'https://books.google.com/books?q={search_query}+programming',
-                f'https://archive.org/search?query={search_query}%20programming',
-                f'https://www.pdfdrive.com/search?q={search_query}+programming',
-                f'https://openlibrary.org/search?q={search_query}+programming',
-                f'https://www.gutenberg.org/ebooks/search/?query={search_query}',
-                f'https://www.oreilly.com/search/?query={search_query}',
-                f'https://www.manning.com/search?q={search_query}',
-                f'https://www.packtpub.com/search?query={search_query}',
-                
-                # General websites
-                f'https://en.wikipedia.org/w/index.php?search={search_query}+programming+language',
-                f'https://wiki.c2.com/?SearchResults&search={search_query}',
-                f'https://www.wikiwand.com/?search={search_query}',
-                f'https://rosettacode.org/w/index.php?search={search_query}',
-                f'https://alternativeto.net/browse/search?q={search_query}',
-                f'https://lobste.rs/search?q={search_query}&what=stories&order=relevance'
-            ]
+            search_specific_urls = search_seed_urls(search_query)
             
             # Handle start URLs from command line
             if start_urls:
@@ -226,15 +292,47 @@ class ResourceSpider(scrapy.Spider):
             
         logger.info(f"Starting URLs: {self.start_urls}")
     
+    def start_requests(self):
+        # Sitemaps of priority domains first when sitemap discovery is on
+        if self.sitemap_enabled():
+            yield from self.sitemap_start_requests()
+        for request in super(ResourceSpider, self).start_requests():
+            # A search crawl fetches and parses its seeds in full
+            request.meta['recrawl_force'] = bool(self.search_query)
+            yield request
+    
+    def handle_sitemap_urls(self, urls):
+        """Turn URLs found in sitemaps into prioritized requests"""
+        for url in urls:
+            score = score_url(url, self.search_query, depth=1)
+            yield scrapy.Request(url, self.parse, priority=url_priority(score), meta={'depth': 1})
+    
     def parse(self, response):
-        # Extract links to follow
+        # Pages unchanged since the last visit only contribute their links
+        if response.meta.get('recrawl_unchanged'):
+            return self.process_page(None, response)
+        
+        # Check if page contains valuable resources, in the extraction pool when enabled
+        resource = extract_page(self, response)
+        if isinstance(resource, Deferred):
+            return resource.addCallback(self.process_page, response)
+        return self.process_page(resource, response)
+    
+    def process_page(self, resource, response):
+        # Extract links to follow, prioritized by their frontier score
+        parent_quality = resource['quality_score'] if resource else 0.0
+        depth = response.meta.get('depth', 0) + 1
         for link in response.css('a::attr(href)').getall():
-            if self.should_follow(link):
-                yield response.follow(link, self.parse)
+            full_url = response.urljoin(link)
+            if self.should_follow(full_url):
+                score = score_url(full_url, self.search_query, parent_quality, depth)
+                yield response.follow(
+                    full_url, self.parse, priority=url_priority(score),
+                    meta={'recrawl_force': bool(self.search_query)}
+                )
         
-        # Check if page contains valuable resources
-        if self.is_resource_page(response):
-            yield self.extract_resource(response)
+        if resource:
+            yield resource
     
     def should_follow(self, url):
         """
@@ -254,53 +352,11 @@ class ResourceSpider(scrapy.Spider):
         if self.search_query and self.search_query.lower() in url.lower():
             return True
         
-        # Priority domains to always follow - expanded significantly
-        priority_domains = [
-            # General programming sites
-            'github.com', 'stackoverflow.com', 'dev.to', 'medium.com', 
-            'freecodecamp.org', 'realpython.com', 'digitalocean.com',
-            'tutorialspoint.com', 'w3schools.com', 'mozilla.org', 'youtube.com',
-            'reddit.com', 'hackernews.com', 'substack.com', 'docs.google.com',
-            'kubernetes.io', 'docker.com', 'python.org', 'reactjs.org',
-            'angular.io', 'vuejs.org', 'rust-lang.org', 'golang.org',
-            'developer.mozilla.org', 'aws.amazon.com', 'cloud.google.com',
-            'docs.microsoft.com', 'graphql.org', 'postgresql.org', 'mysql.com',
-            
-            # Legacy language resources
-            'ibm.com', 'mainframestechhelp.com', 'microfocus.com', 'borland.com',
-            'fortran-lang.org', 'cobol.com', 'mainframegurukul.com', 'cobolforgcc.com',
-            'clarabridge.com', 'netcobol.com', 'ibm.github.io', 'legacy.cplusplus.com',
-            'sourcecodesworld.com', 'findbestopensource.com', 'alternet.cobol.com',
-            'opencobol.org', 'fujitsu.com', 'visualcobol.net', 'jics.macc.wisc.edu',
-            'fortranplus.co.uk', 'netlib.org', 'fortran.com', 'gfortran.com',
-            'j3-fortran.org', 'gcc.gnu.org', 'cse.yorku.ca',
-            
-            # Academic resources
-            'scholar.google.com', 'arxiv.org', 'dl.acm.org', 'ieeexplore.ieee.org',
-            'academia.edu', 'researchgate.net', 'mit.edu', 'stanford.edu',
-            'berkeley.edu', 'cam.ac.uk', 'ox.ac.uk', 'harvard.edu', 'princeton.edu',
-            
-            # Documentation and references
-            'devdocs.io', 'readthedocs.io', 'docs.oracle.com', 'wikiwand.com',
-            'cppreference.com', 'manual.com', 'docs.rs', 'dartdocs.org',
-            'apidock.com', 'jsdoc.app', 'kotlinlang.org', 'scaladoc.org',
-            
-            # Books and learning resources
-            'oreilly.com', 'manning.com', 'packtpub.com', 'informit.com',
-            'apress.com', 'wiley.com', 'springer.com', 'pragprog.com',
-            'edx.org', 'coursera.org', 'udemy.com', 'pluralsight.com',
-            'khanacademy.org', 'codecademy.com', 'udacity.com',
-            
-            # Additional forums and community sites
-            'hashnode.com', 'lobste.rs', 'slashdot.org', 'infoq.com',
-            'codingforums.com', 'quora.com', 'sitepoint.com', 'dzone.com'
-        ]
-        
         # Get the domain
         url_domain = urlparse(url).netloc
         
         # Always follow links from priority domains
-        if any(domain in url_domain for domain in priority_domains):
+        if any(domain in url_domain for domain in PRIORITY_DOMAINS):
             return True
             
         # Follow URLs with programming-related paths
@@ -344,74 +400,13 @@ class ResourceSpider(scrapy.Spider):
                     return True
         
         # Check for common programming content indicators
-        resource_indicators = [
-            # Code examples
-            response.css('pre'), response.css('code'), 
-            response.css('.highlight'), response.css('.code'),
-            response.css('.CodeMirror'), response.css('.ace_editor'),
-            response.css('.program'), response.css('.syntax'),
-            
-            # Documentation structures
-            response.css('.markdown-body'), response.css('.documentation'),
-            response.css('.api-docs'), response.css('.reference'),
-            response.css('.man-page'), response.css('.docstring'),
-            response.css('.manual'), response.css('.handbook'),
-            
-            # Tutorials and guides
-            response.xpath('//h1[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "guide")]'),
-            response.xpath('//h1[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "tutorial")]'),
-            response.xpath('//h1[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "how to")]'),
-            response.xpath('//h2[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "tutorial")]'),
-            response.xpath('//h2[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "guide")]'),
-            response.xpath('//h2[contains(translate(text(), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "introduction")]'),
-            
-            # Legacy language specific indicators
-            response.xpath('//pre[contains(@class, "cobol")]'),
-            response.xpath('//pre[contains(@class, "fortran")]'),
-            response.xpath('//code[contains(@class, "cobol")]'),
-            response.xpath('//code[contains(@class, "fortran")]'),
-            response.xpath('//table[contains(@class, "syntax")]'),
-            response.xpath('//div[contains(@class, "compiler")]'),
-            
-            # Common content containers
-            response.css('article'), response.css('.post'), 
-            response.css('.entry'), response.css('.content'),
-            response.css('#content'), response.css('main'),
-            response.css('.page'), response.css('.doc'),
-            
-            # Technical blogs
-            response.css('.blog-post'), response.css('.article'),
-            response.css('.entry-content'), response.css('.blog-entry'),
-            
-            # Forums and Q&A
-            response.css('.question'), response.css('.answer'),
-            response.css('.post-text'), response.css('.comment-body'),
-            response.css('.reply'), response.css('.discussion'),
-            
-            # Educational content
-            response.css('.lesson'), response.css('.course'),
-            response.css('.curriculum'), response.css('.tutorial'),
-            response.css('.lecture'), response.css('.module'),
-        ]
-        
         # If any indicators are found, this might be a resource page
-        if any(indicator for indicator in resource_indicators):
+        if match_any_rule(self, response, RESOURCE_INDICATOR_RULES):
             return True
             
         # Check for keywords in URLs that suggest valuable content
         url = response.url.lower()
-        valuable_url_patterns = [
-            'tutorial', 'guide', 'learn', 'how-to', 'lesson', 
-            'example', 'documentation', 'reference', 'course',
-            'manual', 'handbook', 'getting-started', 'intro',
-            'cheatsheet', 'cookbook', 'primer', 'samples',
-            'snippets', 'library', 'framework', 'language',
-            'spec', 'standard', 'book', 'ebook', 'workshop',
-            'specification', 'resources', 'cheat-sheet',
-            'cobol', 'fortran', 'mainframe', 'compiler',
-            'interpreter', 'coding', 'programming', 'developer'
-        ]
-        if any(pattern in url for pattern in valuable_url_patterns):
+        if any(pattern in url for pattern in VALUABLE_URL_PATTERNS):
             return True
             
         # Check meta tags for relevant keywords
@@ -474,10 +469,15 @@ class ResourceSpider(scrapy.Spider):
         # Extract domain to categorize content
         domain = urlparse(response.url).netloc
         
+        # Use the site-specific extractor for high-volume domains, if one applies
+        site_fields = extract_site_fields(response) if self.use_site_extractors else {}
+        
         # Extract title and description
-        title = response.css('title::text').get() or response.css('h1::text').get()
-        meta_desc = response.css('meta[name="description"]::attr(content)').get()
-        description = meta_desc if meta_desc else ' '.join(response.css('p::text').getall()[:3])
+        title = site_fields.get('title') or response.css('title::text').get() or response.css('h1::text').get()
+        description = site_fields.get('description')
+        if not description:
+            meta_desc = response.css('meta[name="description"]::attr(content)').get()
+            description = meta_desc if meta_desc else ' '.join(response.css('p::text').getall()[:3])
         
         # Skip if no meaningful content
         if not title or not description:
@@ -529,10 +529,18 @@ class ResourceSpider(scrapy.Spider):
             'git', 'vscode', 'vim', 'emacs', 'intellij', 'eclipse', 'atom',
             'testing', 'debugging', 'performance', 'optimization'
         ]
-        detected_languages = [lang for lang in languages if lang.lower() in (title + ' ' + description).lower()]
+        # Site extractors read tags from the page (e.g. the question tags on
+        # Stack Overflow), which name the language more reliably than the text
+        site_tags = {tag.strip().lower() for tag in site_fields.get('tags', '').split(',')}
+        text = (title + ' ' + description).lower()
+        detected_languages = [lang for lang in languages if lang.lower() in text or lang.lower() in site_tags]
         
         # For legacy languages, improve detection
-        page_text = ' '.join(response.css('body ::text').getall()).lower()
+        # Site extractors already isolated the main text, skip the full-body scan
+        if 'content' in site_fields:
+            page_text = site_fields['content'].lower()
+        else:
+            page_text = ' '.join(response.css('body ::text').getall()).lower()
         
         # If no languages detected yet, check page content
         if not detected_languages:
@@ -575,17 +583,19 @@ class ResourceSpider(scrapy.Spider):
             '.tutorial', '.lesson', '.guide'
         ]
         
-        content = None
-        for selector in content_selectors:
-            content = response.css(f'{selector}::text').getall()
-            if content:
-                content = ' '.join(content)
-                break
+        content = site_fields.get('content')
+        if not content:
+            for selector in content_selectors:
+                content = response.css(f'{selector}::text').getall()
+                if content:
+                    content = ' '.join(content)
+                    break
         
         # Extract code snippets
-        code_snippets = []
-        for code_block in response.css('pre code::text').getall():
-            code_snippets.append(code_block)
+        code_snippets = list(site_fields.get('code_snippets', []))
+        if not code_snippets:
+            for code_block in response.css('pre code::text').getall():
+                code_snippets.append(code_block)
         
         # Also check for pre tags without code for legacy languages
         if not code_snippets and self.search_query and self.search_query.lower() in ['cobol', 'fortran', 'pascal', 'basic', 'ada']:
@@ -595,7 +605,7 @@ class ResourceSpider(scrapy.Spider):
                     code_snippets.append(pre_block)
         
         # Extract tags/keywords
-        tags = response.css('meta[name="keywords"]::attr(content)').get()
+        tags = site_fields.get('tags') or response.css('meta[name="keywords"]::attr(content)').get()
         
         # Determine resource type
         resource_type = 'article'  # default
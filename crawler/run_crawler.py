@@ -3,16 +3,20 @@
 Standalone crawler runner script.
 
 This script runs the ResourceSpider in standalone mode.
-For distributed crawling, see the coordinator service instead.
+For distributed crawling, see the coordinator service instead. With
+CRAWLER_MODE=distributed, start_crawler() submits query jobs to the
+distributed workers instead of starting a spider.
 """  
 import os
 import sys
 import logging  
 import uuid
 import subprocess
+import redis
 from scrapy.utils.project import get_project_settings  
 from scrapy.utils.log import configure_logging
-from resource_crawler.spiders.resource_spider import ResourceSpider  
+from resource_crawler.jobs import QueryJobs
+from resource_crawler.spiders.resource_spider import ResourceSpider, search_seed_urls
 
 # Configure logging  
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")  
@@ -34,14 +38,34 @@ def run_crawler():
         '-a', f'search_query={search_query}'
     ])
 
+def query_jobs():
+    client = redis.Redis(host=os.environ.get('REDIS_HOST', 'redis'), port=int(os.environ.get('REDIS_PORT', 6379)))
+    return QueryJobs(client)
+
+def submit_query_job(job_id, query, seed_urls=None):
+    """Submit a query job to the distributed workers, seeded with the query's search URLs"""
+    budget = int(os.environ.get('QUERY_JOB_BUDGET', 500))
+    query_jobs().submit(query, seed_urls or search_seed_urls(query), budget, job_id=job_id)
+    logger.info(f"Submitted query job {job_id} for {query!r} to the distributed crawler (budget {budget} pages)")
+
 # Function to be called from the API
-def start_crawler(seed_urls=None, search_query=None):
+def start_crawler(seed_urls=None, search_query=None, distributed=None):
     # Generate a unique job ID
     job_id = str(uuid.uuid4())
     
     # Use provided search_query or default to "python"
     query = search_query if search_query else "python"
     
+    # Hand the crawl to the distributed workers when they are running
+    if distributed is None:
+        distributed = os.environ.get('CRAWLER_MODE') == 'distributed'
+    if distributed:
+        try:
+            submit_query_job(job_id, query, seed_urls)
+            return job_id
+        except redis.RedisError as e:
+            logger.error(f"Error submitting query job, starting a standalone crawler instead: {e}")
+    
     # Create command
     cmd = ['scrapy', 'crawl', 'resource_spider', '-a', f'search_query={query}']
     if seed_urls:
@@ -69,5 +93,9 @@ def start_crawler(seed_urls=None, search_query=None):
     
     return job_id
 
+def get_job_status(job_id):
+    """Progress of a distributed query job, or None if it is unknown or expired"""
+    return query_jobs().status(job_id)
+
 if __name__ == "__main__":  
     run_crawler()  
\ No newline at end of file
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+import redis
+
+from resource_crawler.frontier import WORKER_QUEUE_PREFIX, RedisFrontier, decode_entry, encode_entry
+
+
+@pytest.fixture
+def redis_client():
+    """A Redis server from REDIS_TEST_URL (flushed), or fakeredis when its Lua has redis.sha1hex"""
+    url = os.environ.get('REDIS_TEST_URL')
+    if url:
+        client = redis.Redis.from_url(url)
+        client.flushdb()
+        return client
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeRedis()
+    try:
+        client.eval("return redis.sha1hex('')", 0)
+    except redis.ResponseError:
+        pytest.skip("fakeredis Lua has no redis.sha1hex, set REDIS_TEST_URL to a Redis server")
+    return client
+
+
+def owner(frontier, url):
+    """Worker the distribute script routes a URL to, found by routing it alone"""
+    frontier.redis.delete(frontier.key)
+    frontier.redis.zadd(frontier.key, {encode_entry(url): 1})
+    frontier.distribute(1, 1000)
+    for worker in ('w1', 'w2', 'w3'):
+        if frontier.redis.lpop(WORKER_QUEUE_PREFIX + worker):
+            return worker
+
+
+def test_full_queue_of_hot_domain_does_not_starve_other_workers(redis_client):
+    frontier = RedisFrontier(redis_client)
+    frontier.set_ring(['w1', 'w2', 'w3'])
+    hot = owner(frontier, 'https://hot.example.com/')
+    frontier.redis.rpush(WORKER_QUEUE_PREFIX + hot, *[f'queued-{i}' for i in range(20)])
+
+    # The top of the frontier is all the hot domain, the rest is spread out
+    entries = {encode_entry(f'https://hot.example.com/{i}'): 100 - i for i in range(50)}
+    entries.update({encode_entry(f'https://site{i}.org/'): 10 - i / 100 for i in range(30)})
+    frontier.redis.zadd(frontier.key, entries)
+
+    routed, skipped = frontier.distribute(10, max_queue=20)
+
+    assert routed == 10
+    assert skipped >= 50
+    others = [worker for worker in ('w1', 'w2', 'w3') if worker != hot]
+    assert sum(frontier.redis.llen(WORKER_QUEUE_PREFIX + worker) for worker in others) == 10
+    assert frontier.redis.llen(WORKER_QUEUE_PREFIX + hot) == 20
+    # Skipped entries stay in the frontier, at their scores
+    left = [decode_entry(raw)['url'] for raw in frontier.redis.zrevrange(frontier.key, 0, 49)]
+    assert all(url.startswith('https://hot.example.com/') for url in left)
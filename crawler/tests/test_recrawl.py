@@ -0,0 +1,31 @@
+import time
+from unittest import mock
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+
+from resource_crawler.frontier import RECRAWL_DUE_KEY
+from resource_crawler.middlewares import IncrementalRecrawlMiddleware
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def middleware():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    return IncrementalRecrawlMiddleware(client, mock.Mock(), 86400, 3600, 2419200)
+
+
+def test_revisit_bypasses_http_cache(middleware):
+    request = Request('https://docs.python.org/3/', meta={'recrawl': True})
+    middleware.process_request(request, mock.Mock())
+    assert request.meta['dont_cache'] is True
+
+
+def test_cached_revisit_is_rescheduled(middleware):
+    url = 'https://docs.python.org/3/'
+    request = Request(url, meta={'recrawl': True})
+    response = HtmlResponse(url, body=b'<html></html>', request=request, flags=['cached'])
+
+    assert middleware.process_response(request, response, mock.Mock()) is response
+    assert middleware.redis.zscore(RECRAWL_DUE_KEY, url) > time.time()
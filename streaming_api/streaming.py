@@ -1,131 +1,691 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
-import redis
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
 import json
 import asyncio
 import logging
+import re
+import socket
+import time
 import uuid
+from collections import deque
 from elasticsearch import AsyncElasticsearch
 import os
 from datetime import datetime
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Resource Grep Streaming API")
 
-# Redis pubsub connection pool
-redis_pool = None
+# Results stream follower of this process
+result_stream = None
 # Elasticsearch connection
 es_client = None
 
+# Capped stream the crawler adds every newly indexed resource to
+RESULTS_STREAM = 'search:results:stream'
+# Consumer group and consumer of this instance. Every instance needs every
+# resource for its own clients, so each has a group of its own.
+STREAM_CONSUMER = socket.gethostname()
+STREAM_GROUP = os.environ.get('STREAM_GROUP', f'streaming:{STREAM_CONSUMER}')
+
+# Initial results are read in pages from an Elasticsearch point in time: a
+# small first page so the first results arrive quickly, then page_size more
+# whenever the client asks. The point in time is kept for
+# STREAM_PIT_KEEP_ALIVE between pages.
+FIRST_PAGE_SIZE = int(os.environ.get('STREAM_FIRST_PAGE_SIZE', 10))
+# Search results sent without waiting for 'more', as clients that never ask
+# for more pages got before paging
+PREFETCH_RESULTS = int(os.environ.get('STREAM_PREFETCH_RESULTS', 100))
+PIT_KEEP_ALIVE = os.environ.get('STREAM_PIT_KEEP_ALIVE', '5m')
+# Fields of the search results sent to clients
+RESULT_FIELDS = ['url', 'title', 'description', 'type', 'language', 'languages']
+
+# Words of queries and documents, keeping names like c++ and c#
+TOKEN_PATTERN = re.compile(r'[a-z0-9+#]+')
+# Fields of a new resource its words are taken from, as multi_match searches them
+MATCHED_FIELDS = ['title', 'description', 'tags', 'code_snippets']
+# Fields of stream entries used only for matching, not sent to clients
+MATCH_ONLY_FIELDS = {'code_snippets', 'query'}
+
+def stem(word):
+    """Singular of an English plural, like Elasticsearch's minimal_english stemmer"""
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies') and not word.endswith(('eies', 'aies')):
+        return word[:-3] + 'y'
+    if word.endswith('es') and not word.endswith(('aes', 'ees', 'oes')):
+        return word[:-1]
+    if word.endswith('s') and not word.endswith(('us', 'ss')):
+        return word[:-1]
+    return word
+
+def tokenize(text):
+    return {stem(word) for word in TOKEN_PATTERN.findall(text.lower())}
+
+def resource_terms(resource: dict):
+    parts = []
+    for field in MATCHED_FIELDS:
+        value = resource.get(field)
+        if isinstance(value, (list, tuple)):
+            parts.extend(str(part) for part in value)
+        elif value:
+            parts.append(str(value))
+    return tokenize(' '.join(parts))
+
+def field_values(resource: dict, field: str):
+    """Lowercased values of a resource field a filter checks, with language also matching languages"""
+    fields = ['language', 'languages'] if field == 'language' else [field]
+    values = set()
+    for name in fields:
+        value = resource.get(name)
+        for part in value if isinstance(value, (list, tuple)) else [value]:
+            if part:
+                values.add(str(part).lower())
+    return values
+
+def client_result(resource: dict):
+    """A stream entry as sent to clients"""
+    return {field: value for field, value in resource.items() if field not in MATCH_ONLY_FIELDS}
+
+class QueryMatcher:
+    """
+    Matches new resources against the live search queries, like an
+    Elasticsearch percolator kept in process.
+    
+    Queries and resources are analyzed alike: words are lowercased and
+    plurals reduced to singulars. A resource matches a query when its
+    title, description, tags and code snippets contain all of the query's
+    words, or when it was crawled for that query, and it passes the
+    query's filters the way the search filters do. Each distinct query
+    and filters pair is indexed once, under its longest word. A new
+    resource only checks the queries indexed under its own words, so the
+    cost grows with the new resources, not with the connected clients.
+    """
+    
+    def __init__(self):
+        # Word -> keys of the queries indexed under it
+        self.postings = {}
+        # Query key -> queues of the connections running it
+        self.queues = {}
+        self.matched = 0
+    
+    def register(self, query: str, filters: dict, queue: asyncio.Queue):
+        """Route resources matching a query to a queue, returning the key to unregister it with"""
+        terms = frozenset(tokenize(query))
+        if not terms:
+            return None
+        conditions = tuple(sorted((field, str(value).lower()) for field, value in filters.items() if value))
+        key = (terms, conditions)
+        queues = self.queues.setdefault(key, set())
+        if not queues:
+            self.postings.setdefault(self.index_term(terms), set()).add(key)
+        queues.add(queue)
+        return key
+    
+    def unregister(self, key, queue: asyncio.Queue):
+        queues = self.queues.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.queues[key]
+            term = self.index_term(key[0])
+            self.postings[term].discard(key)
+            if not self.postings[term]:
+                del self.postings[term]
+    
+    def index_term(self, terms):
+        # Longer words are rarer, so fewer resources check the query
+        return max(terms, key=lambda term: (len(term), term))
+    
+    def match(self, resource: dict):
+        """Keys of the queries a resource matches"""
+        terms = resource_terms(resource)
+        candidates = {key for term in terms for key in self.postings.get(term, ())}
+        crawled_for = self.crawled_for(resource)
+        if crawled_for:
+            candidates.update(self.postings.get(self.index_term(crawled_for), ()))
+        return [key for key in candidates if self.matches(key, resource, terms)]
+    
+    def crawled_for(self, resource: dict):
+        """Words of the query a resource was crawled for, if any"""
+        return frozenset(tokenize(resource.get('query') or ''))
+    
+    def matches(self, key, resource: dict, terms=None):
+        """Whether a resource matches the query registered under key"""
+        query_terms, conditions = key
+        if terms is None:
+            terms = resource_terms(resource)
+        if not (query_terms <= terms or query_terms == self.crawled_for(resource)):
+            return False
+        return all(value in field_values(resource, field) for field, value in conditions)
+    
+    def route(self, entry_id: str, resource: dict):
+        """Put a new resource and its stream ID on the queues of the connections whose queries it matches"""
+        for key in self.match(resource):
+            self.matched += 1
+            for queue in self.queues[key]:
+                queue.put_nowait((entry_id, resource))
+
+def parse_stream_id(stream_id: str):
+    """Stream entry ID as a comparable (milliseconds, sequence) pair"""
+    ms, _, seq = stream_id.partition('-')
+    return int(ms), int(seq or 0)
+
+class ResultStream:
+    """
+    Follows the results stream for all WebSocket connections.
+    
+    A reader task reads new entries through this instance's consumer group,
+    decodes each once, routes it with its ID to the connections whose
+    queries it matches and acknowledges it. The group remembers how far the
+    instance has read, so a restarted instance carries on from there.
+    Clients that reconnect are replayed the entries they missed straight
+    from the stream.
+    """
+    
+    def __init__(self, redis_client, matcher, group: str = STREAM_GROUP, consumer: str = STREAM_CONSUMER,
+                 count: int = 500):
+        self.redis = redis_client
+        self.matcher = matcher
+        self.group = group
+        self.consumer = consumer
+        self.count = count
+        self.reader = None
+        self.consumed = 0
+        self.replays = 0
+    
+    async def start(self):
+        await self.create_group()
+        self.reader = asyncio.create_task(self.read())
+    
+    async def create_group(self):
+        # A new group starts at the end of the stream
+        try:
+            await self.redis.xgroup_create(RESULTS_STREAM, self.group, id='$', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+    
+    async def read(self):
+        """Route new entries to the matching connections until cancelled"""
+        # Entries delivered before a restart but never acknowledged come
+        # first, then new entries
+        stream_id = '0'
+        while True:
+            try:
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {RESULTS_STREAM: stream_id}, count=self.count, block=0
+                )
+                entries = response[0][1] if response else []
+                if not entries and stream_id == '0':
+                    stream_id = '>'
+                    continue
+                for entry_id, resource in self.decode(entries):
+                    self.matcher.route(entry_id, resource)
+                    self.consumed += 1
+                if entries:
+                    await self.redis.xack(RESULTS_STREAM, self.group, *(entry_id for entry_id, _ in entries))
+            except ResponseError as e:
+                # The stream or its group was deleted
+                if 'NOGROUP' not in str(e):
+                    raise
+                logger.warning(f"Recreating consumer group {self.group}")
+                await self.create_group()
+            except RedisError as e:
+                logger.warning(f"Redis stream error, retrying: {e}")
+                await asyncio.sleep(1)
+    
+    def decode(self, entries):
+        for entry_id, fields in entries:
+            # Pending entries trimmed from the stream come back without fields
+            if not fields:
+                continue
+            try:
+                yield entry_id.decode(), json.loads(fields[b'data'])
+            except (KeyError, ValueError):
+                logger.warning(f"Skipping malformed stream entry {entry_id!r}")
+    
+    async def last_id(self):
+        """ID of the newest entry, '0-0' when the stream is empty"""
+        entries = await self.redis.xrevrange(RESULTS_STREAM, count=1)
+        return entries[0][0].decode() if entries else '0-0'
+    
+    async def covers(self, stream_id: str):
+        """Whether the stream still holds every entry after stream_id"""
+        entries = await self.redis.xrange(RESULTS_STREAM, count=1)
+        return not entries or parse_stream_id(entries[0][0].decode()) <= parse_stream_id(stream_id)
+    
+    async def replay(self, after: str, until: str):
+        """Entries after one ID up to another, oldest first, as (ID, resource) pairs"""
+        self.replays += 1
+        start = f'({after}'
+        while True:
+            entries = await self.redis.xrange(RESULTS_STREAM, min=start, max=until, count=self.count)
+            for entry in self.decode(entries):
+                yield entry
+            if len(entries) < self.count:
+                return
+            start = f'({entries[-1][0].decode()}'
+    
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        await self.redis.aclose()
+
+# Outbound messages each connection may hold, and what happens when a slow
+# client lets them fill up: drop_oldest drops the oldest result,
+# coalesce replaces the queued results with one 'overflow' message counting
+# them, and disconnect closes the connection
+OUTBOX_SIZE = int(os.environ.get('STREAM_OUTBOX_SIZE', 256))
+OVERFLOW_POLICY = os.environ.get('STREAM_OVERFLOW_POLICY', 'drop_oldest')
+
+class ClientConnection:
+    """
+    A WebSocket client, its outbound queue and the frame format it asked for.
+    
+    Messages are queued without waiting for the client, and a writer task
+    sends them. The queue holds at most OUTBOX_SIZE messages; when it is
+    full, OVERFLOW_POLICY decides what gives way.
+    
+    Messages are JSON text frames by default, or msgpack binary frames
+    with encoding=msgpack. With batch_size above 1, the writer sends
+    consecutive 'result' messages together in one 'batch' message holding
+    up to batch_size of them, at most batch_ms after the first one was
+    queued.
+    """
+    
+    def __init__(self, websocket: WebSocket, encoding: str = 'json', batch_size: int = 1, batch_ms: int = 0,
+                 max_queue: int = OUTBOX_SIZE, policy: str = OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.max_queue = max_queue
+        self.policy = policy
+        # (message, time queued) pairs waiting for the writer
+        self.outbox = deque()
+        self.ready = asyncio.Event()
+        self.overflow = None
+        self.overflowed = False
+        self.writer = None
+        
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+    
+    def start(self):
+        self.writer = asyncio.create_task(self.write())
+    
+    def send(self, message: dict):
+        """Queue a message for the client without waiting for it"""
+        if self.overflowed:
+            return
+        if len(self.outbox) >= self.max_queue:
+            self.make_room()
+            if self.overflowed:
+                return
+        self.outbox.append((message, time.monotonic()))
+        self.max_depth = max(self.max_depth, len(self.outbox))
+        self.ready.set()
+    
+    def make_room(self):
+        """Make room in a full outbox by dropping results, as the overflow policy says"""
+        if self.policy == 'disconnect':
+            self.dropped += len(self.outbox)
+            self.outbox.clear()
+            self.overflowed = True
+            self.ready.set()
+            return
+        if self.policy == 'coalesce':
+            kept = deque(item for item in self.outbox if item[0].get('type') != 'result')
+            coalesced = len(self.outbox) - len(kept)
+            if coalesced:
+                self.dropped += coalesced
+                if self.overflow is None:
+                    self.overflow = {'type': 'overflow', 'data': {'dropped': 0}}
+                    kept.append((self.overflow, time.monotonic()))
+                self.overflow['data']['dropped'] += coalesced
+                self.outbox = kept
+            return
+        # Drop the oldest result. Control messages (status, stats, page,
+        # overflow) are never dropped; a queue holding only those may grow
+        # past max_queue, which is bounded by how few of them there are.
+        for index, (message, _) in enumerate(self.outbox):
+            if message.get('type') == 'result':
+                del self.outbox[index]
+                self.dropped += 1
+                return
+    
+    async def next_message(self):
+        while not self.outbox:
+            if self.overflowed:
+                return None
+            self.ready.clear()
+            await self.ready.wait()
+        message, queued = self.outbox.popleft()
+        if message is self.overflow:
+            self.overflow = None
+        return message, queued
+    
+    async def write(self):
+        """Send queued messages until the connection closes"""
+        while True:
+            item = await self.next_message()
+            if item is None:
+                logger.warning(f"Closing slow client after {self.dropped} undelivered messages")
+                await self.websocket.close(code=1013)
+                return
+            message, queued = item
+            items = [item]
+            if self.batch_size > 1 and message.get('type') == 'result':
+                items = await self.collect_batch(item)
+                message = {'type': 'batch', 'data': [message for message, _ in items]}
+            await self.send_frame(message)
+            
+            now = time.monotonic()
+            for _, queued in items:
+                latency = now - queued
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            self.sent += len(items)
+    
+    async def collect_batch(self, first):
+        """Take the results following the first one, up to batch_size or until batch_ms has passed"""
+        items = [first]
+        deadline = first[1] + self.batch_ms / 1000
+        while len(items) < self.batch_size:
+            if self.outbox:
+                if self.outbox[0][0].get('type') != 'result':
+                    break
+                items.append(self.outbox.popleft())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if self.overflowed:
+                break
+        return items
+    
+    async def send_frame(self, message: dict):
+        if self.encoding == 'msgpack':
+            await self.websocket.send_bytes(msgpack.packb(message, use_bin_type=True))
+        else:
+            await self.websocket.send_text(json.dumps(message, separators=(',', ':')))
+    
+    def metrics(self):
+        return {
+            'depth': len(self.outbox),
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'send_latency_avg_ms': round(self.latency_total / self.sent * 1000, 2) if self.sent else 0.0,
+            'send_latency_max_ms': round(self.latency_max * 1000, 2),
+        }
+    
+    def close(self):
+        if self.writer:
+            self.writer.cancel()
+
 class StreamingSearchManager:
     def __init__(self):
         self.active_connections = {}
+        # Totals of connections that have closed
+        self.closed = {'connections': 0, 'sent': 0, 'dropped': 0, 'slow_disconnects': 0, 'latency_total': 0.0}
     
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, encoding: str = 'json', batch_size: int = 1,
+                      batch_ms: int = 0):
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        if encoding == 'msgpack' and msgpack is None:
+            logger.warning(f"msgpack is not installed, sending JSON to client {client_id}")
+            encoding = 'json'
+        connection = ClientConnection(websocket, encoding, batch_size, batch_ms)
+        connection.start()
+        self.active_connections[client_id] = connection
         logger.info(f"Client {client_id} connected. Active connections: {len(self.active_connections)}")
+        return connection
     
     def disconnect(self, client_id: str):
-        self.active_connections.pop(client_id, None)
+        connection = self.active_connections.pop(client_id, None)
+        if connection:
+            connection.close()
+            self.closed['connections'] += 1
+            self.closed['sent'] += connection.sent
+            self.closed['dropped'] += connection.dropped
+            self.closed['slow_disconnects'] += int(connection.overflowed)
+            self.closed['latency_total'] += connection.latency_total
         logger.info(f"Client {client_id} disconnected. Active connections: {len(self.active_connections)}")
     
     async def send_result(self, client_id: str, result: dict):
         if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(result)
+            self.active_connections[client_id].send(result)
+    
+    def metrics(self, per_connection: bool = False):
+        """Outbound queue depth, drops and send latency, in aggregate and optionally per connection"""
+        connections = {client_id: connection.metrics() for client_id, connection in self.active_connections.items()}
+        live = self.active_connections.values()
+        sent = self.closed['sent'] + sum(connection.sent for connection in live)
+        latency_total = self.closed['latency_total'] + sum(connection.latency_total for connection in live)
+        metrics = {
+            'connections': len(connections),
+            'closed_connections': self.closed['connections'],
+            'overflow_policy': OVERFLOW_POLICY,
+            'outbox_size': OUTBOX_SIZE,
+            'queued': sum(item['depth'] for item in connections.values()),
+            'max_depth': max((item['max_depth'] for item in connections.values()), default=0),
+            'sent': sent,
+            'dropped': self.closed['dropped'] + sum(connection.dropped for connection in live),
+            'slow_disconnects': self.closed['slow_disconnects'] + sum(connection.overflowed for connection in live),
+            'send_latency_avg_ms': round(latency_total / sent * 1000, 2) if sent else 0.0,
+            'send_latency_max_ms': max((item['send_latency_max_ms'] for item in connections.values()), default=0.0),
+        }
+        if per_connection:
+            metrics['per_connection'] = connections
+        return metrics
 
 # Create manager
 manager = StreamingSearchManager()
+# Live queries of all connections
+matcher = QueryMatcher()
 
 @app.on_event("startup")
 async def startup_event():
-    global redis_pool, es_client
+    global result_stream, es_client
     
-    # Connect to Redis
+    # Connect to Redis and match every newly indexed resource against the
+    # live queries
     redis_host = os.environ.get('REDIS_HOST', 'redis')
     redis_port = int(os.environ.get('REDIS_PORT', 6379))
-    redis_pool = redis.ConnectionPool(host=redis_host, port=redis_port)
+    result_stream = ResultStream(Redis(host=redis_host, port=redis_port), matcher)
+    await result_stream.start()
     
     # Connect to Elasticsearch
     es_host = os.environ.get('ELASTICSEARCH_HOST', 'elasticsearch')
     es_port = int(os.environ.get('ELASTICSEARCH_PORT', 9200))
     es_client = AsyncElasticsearch([f"http://{es_host}:{es_port}"])
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await result_stream.close()
+    await es_client.close()
+
+@app.get("/metrics")
+async def get_metrics(connections: bool = Query(False, description="Include per-connection metrics")):
+    """Outbound queue and live query metrics of the WebSocket connections"""
+    metrics = manager.metrics(per_connection=connections)
+    metrics['live_queries'] = len(matcher.queues)
+    metrics['realtime_matches'] = matcher.matched
+    metrics['stream_entries'] = result_stream.consumed
+    metrics['stream_replays'] = result_stream.replays
+    return metrics
+
 @app.websocket("/ws/search")
 async def websocket_search(
     websocket: WebSocket, 
     query: str = Query(...),
-    filters: str = Query(None)
+    filters: str = Query(None),
+    encoding: str = Query('json', pattern='^(json|msgpack)$', description="Frame encoding"),
+    batch_size: int = Query(1, ge=1, le=500, description="Results per batch message, 1 to send each on its own"),
+    batch_ms: int = Query(50, ge=0, le=5000, description="Longest time a result waits for its batch"),
+    last_id: str = Query(None, pattern=r'^\d+-\d+$', description="Stream ID of the last result received, to resume"),
+    page_size: int = Query(25, ge=1, le=100, description="Search results sent per 'more' request")
 ):
-    client_id = str(uuid.uuid4())
-    await manager.connect(websocket, client_id)
-    
-    # Parse filters if any
-    filter_dict = json.loads(filters) if filters else {}
+    # Parse filters if any, refusing the connection when they are not a JSON object
+    try:
+        filter_dict = json.loads(filters) if filters else {}
+    except ValueError:
+        filter_dict = None
+    if not isinstance(filter_dict, dict):
+        logger.warning(f"Refusing WebSocket connection with invalid filters: {filters}")
+        await websocket.close(code=1008)
+        return
     
-    # Start Redis pubsub listener
-    redis_client = redis.Redis(connection_pool=redis_pool)
-    pubsub = redis_client.pubsub()
+    client_id = str(uuid.uuid4())
+    connection = await manager.connect(websocket, client_id, encoding, batch_size, batch_ms)
     
-    # Subscribe to realtime results from crawler
-    search_channel = f"search:results:{query}"
-    pubsub.subscribe(search_channel)
+    # Receive newly indexed resources that match the query and filters.
+    # Those added to the stream after stream_id arrive through the matcher.
+    realtime_results = asyncio.Queue()
+    match_key = None
+    tasks = ()
     
     # Track seen results to avoid duplicates
     seen_urls = set()
-    
-    # Task to perform initial search
-    initial_search_task = None
+    # Set when the client asks for the next page of search results
+    more_requested = asyncio.Event()
     
     try:
-        # Start initial search in Elasticsearch
-        initial_search_task = asyncio.create_task(
-            search_elasticsearch(query, filter_dict, client_id, seen_urls)
+        match_key = matcher.register(query, filter_dict, realtime_results)
+        stream_id = await result_stream.last_id()
+        
+        # The initial results, the real-time results and the client's messages
+        # each run in their own task, waiting on events instead of polling. A
+        # client resuming from a result still in the stream only gets the
+        # results it missed, without searching Elasticsearch again.
+        if last_id and match_key and await result_stream.covers(last_id):
+            initial_search_task = asyncio.create_task(
+                replay_results(match_key, last_id, stream_id, client_id, seen_urls)
+            )
+        else:
+            initial_search_task = asyncio.create_task(
+                search_elasticsearch(query, filter_dict, client_id, seen_urls, stream_id, page_size, more_requested)
+            )
+        realtime_task = asyncio.create_task(
+            stream_realtime_results(realtime_results, client_id, seen_urls, stream_id)
         )
+        reader_task = asyncio.create_task(read_client_messages(websocket, more_requested))
+        tasks = (initial_search_task, realtime_task, reader_task)
         
-        # Listen for real-time results from crawler
-        while True:
-            message = pubsub.get_message(timeout=0.1)
-            if message and message['type'] == 'message':
-                # Process real-time result from Redis
-                result = json.loads(message['data'])
-                
-                # Skip if URL already seen
-                if result['url'] in seen_urls:
-                    continue
-                
-                # Add to seen URLs
-                seen_urls.add(result['url'])
-                
-                # Apply filters if needed
-                if filter_and_format_result(result, filter_dict):
-                    # Send to client
-                    await manager.send_result(client_id, {
-                        'type': 'result',
-                        'data': result,
-                        'source': 'realtime'
-                    })
-            
-            # Check if client is still connected
-            try:
-                await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
-            except asyncio.TimeoutError:
-                pass
-            
-    except WebSocketDisconnect:
-        logger.info(f"Client {client_id} disconnected")
-    except Exception as e:
-        logger.error(f"Error in WebSocket connection: {e}")
+        # The connection ends when the client disconnects, sending fails or
+        # the client is too slow
+        done, _ = await asyncio.wait(
+            (realtime_task, reader_task, connection.writer), return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            error = task.exception()
+            if error and not isinstance(error, WebSocketDisconnect):
+                logger.error(f"Error in WebSocket connection: {error}")
+    except RedisError as e:
+        logger.error(f"Error setting up WebSocket connection: {e}")
+        await websocket.close(code=1011)
     finally:
-        # Cleanup
+        # Cleanup, which also stops fetching search pages and closes the
+        # point in time
+        for task in tasks:
+            task.cancel()
         manager.disconnect(client_id)
-        pubsub.unsubscribe()
-        if initial_search_task and not initial_search_task.done():
-            initial_search_task.cancel()
+        matcher.unregister(match_key, realtime_results)
+
+async def read_client_messages(websocket: WebSocket, more_requested: asyncio.Event):
+    """Read client messages until the client disconnects"""
+    while True:
+        message = await websocket.receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        try:
+            if message.get('text') is not None:
+                request = json.loads(message['text'])
+            elif message.get('bytes') is not None and msgpack is not None:
+                request = msgpack.unpackb(message['bytes'])
+            else:
+                continue
+        except ValueError:
+            logger.warning("Ignoring malformed client message")
+            continue
+        if isinstance(request, dict) and request.get('type') == 'more':
+            more_requested.set()
+
+async def stream_realtime_results(realtime_results, client_id, seen_urls, after):
+    """Send newly indexed resources matching the client's query as they arrive"""
+    after = parse_stream_id(after)
+    while True:
+        entry_id, result = await realtime_results.get()
+        
+        # Skip results the initial search or replay covers, and URLs already seen
+        if parse_stream_id(entry_id) <= after or result['url'] in seen_urls:
+            continue
+        
+        # Add to seen URLs
+        seen_urls.add(result['url'])
+        
+        # Send to client
+        await manager.send_result(client_id, {
+            'type': 'result',
+            'data': client_result(result),
+            'source': 'realtime',
+            'stream_id': entry_id
+        })
 
-async def search_elasticsearch(query, filters, client_id, seen_urls):
-    """Perform search in Elasticsearch and stream results"""
+async def replay_results(match_key, last_id, stream_id, client_id, seen_urls):
+    """Send a reconnecting client the matching resources added to the stream while it was away"""
+    replayed = 0
+    try:
+        async for entry_id, result in result_stream.replay(last_id, stream_id):
+            if result['url'] in seen_urls or not matcher.matches(match_key, result):
+                continue
+            seen_urls.add(result['url'])
+            replayed += 1
+            await manager.send_result(client_id, {
+                'type': 'result',
+                'data': client_result(result),
+                'source': 'realtime',
+                'stream_id': entry_id
+            })
+        
+        await manager.send_result(client_id, {
+            'type': 'status',
+            'data': {
+                'message': 'Resumed, streaming real-time results',
+                'replayed': replayed,
+                'last_id': stream_id
+            }
+        })
+    except RedisError as e:
+        logger.error(f"Error replaying results stream: {e}")
+        await manager.send_result(client_id, {
+            'type': 'error',
+            'data': {
+                'message': f"Resume error: {str(e)}"
+            }
+        })
+
+async def search_elasticsearch(query, filters, client_id, seen_urls, last_id, page_size, more_requested):
+    """Search Elasticsearch and stream the results a page at a time"""
+    pit_id = None
     try:
         # Build the search query
         search_body = {
@@ -146,7 +706,9 @@ async def search_elasticsearch(query, filters, client_id, seen_urls):
                         }
                     ]
                 }
-            }
+            },
+            "_source": RESULT_FIELDS,
+            "sort": [{"_score": "desc"}, {"_shard_doc": "asc"}]
         }
         
         # Add filters if provided
@@ -168,68 +730,100 @@ async def search_elasticsearch(query, filters, client_id, seen_urls):
                         filter_clause = {"term": {field: value}}
                         search_body["query"]["bool"].setdefault("filter", []).append(filter_clause)
         
-        # Execute search
-        results = await es_client.search(
-            index="resources", 
-            body=search_body,
-            size=100
-        )
+        # Page through a point in time, so pages stay consistent while
+        # resources are indexed
+        pit = await es_client.open_point_in_time(index="resources", keep_alive=PIT_KEEP_ALIVE)
+        pit_id = pit["id"]
         
-        # Send total count first
-        total_hits = results["hits"]["total"]["value"]
-        await manager.send_result(client_id, {
-            'type': 'stats',
-            'data': {
-                'total': total_hits,
-                'took': results["took"]
-            }
-        })
-        
-        # Send each result
-        for hit in results["hits"]["hits"]:
-            source = hit["_source"]
-            url = source["url"]
-            
-            # Skip if already seen
-            if url in seen_urls:
-                continue
-            
-            # Add to seen URLs
-            seen_urls.add(url)
+        page = 0
+        fetched = 0
+        size = min(FIRST_PAGE_SIZE, page_size)
+        while True:
+            search_body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+            search_body["size"] = size
+            results = await es_client.search(body=search_body)
+            pit_id = results.get("pit_id", pit_id)
+            hits = results["hits"]["hits"]
+            page += 1
+            fetched += len(hits)
             
-            # Format result
-            result = {
-                'id': hit["_id"],
-                'score': hit["_score"],
-                'url': url,
-                'title': source["title"],
-                'description': source["description"],
-                'type': source["type"],
-                'source': 'elasticsearch'
-            }
+            if page == 1:
+                # Send total count first
+                total_hits = results["hits"]["total"]["value"]
+                await manager.send_result(client_id, {
+                    'type': 'stats',
+                    'data': {
+                        'total': total_hits,
+                        'took': results["took"]
+                    }
+                })
             
-            # Handle language field
-            if "language" in source:
-                result["language"] = source["language"]
-            elif "languages" in source and source["languages"]:
-                result["language"] = source["languages"][0]
+            # Send each result
+            for hit in hits:
+                source = hit["_source"]
+                url = source["url"]
+                
+                # Skip if already seen
+                if url in seen_urls:
+                    continue
+                
+                # Add to seen URLs
+                seen_urls.add(url)
+                
+                # Format result
+                result = {
+                    'id': hit["_id"],
+                    'score': hit["_score"],
+                    'url': url,
+                    'title': source["title"],
+                    'description': source["description"],
+                    'type': source["type"],
+                    'source': 'elasticsearch'
+                }
+                
+                # Handle language field
+                if "language" in source:
+                    result["language"] = source["language"]
+                elif "languages" in source and source["languages"]:
+                    result["language"] = source["languages"][0]
+                
+                # Send to client
+                await manager.send_result(client_id, {
+                    'type': 'result',
+                    'data': result
+                })
             
-            # Send to client
+            has_more = len(hits) == size
             await manager.send_result(client_id, {
-                'type': 'result',
-                'data': result
+                'type': 'page',
+                'data': {
+                    'page': page,
+                    'has_more': has_more
+                }
             })
             
-            # Small delay to avoid overwhelming the client
-            await asyncio.sleep(0.01)
-        
-        # Signal end of initial results
-        await manager.send_result(client_id, {
-            'type': 'status',
-            'data': {
-                'message': 'Initial search complete, streaming real-time results'
-            }
-        })
+            if page == 1:
+                # Signal end of initial results
+                await manager.send_result(client_id, {
+                    'type': 'status',
+                    'data': {
+                        'message': 'Initial search complete, streaming real-time results',
+                        'last_id': last_id
+                    }
+                })
+            
+            if not has_more:
+                break
+            
+            # Past the prefetched results, fetch the next page only when the
+            # client asks for it
+            if fetched >= PREFETCH_RESULTS:
+                await more_requested.wait()
+                more_requested.clear()
+                size = page_size
+            else:
+                size = min(page_size, PREFETCH_RESULTS - fetched)
+            search_body["search_after"] = hits[-1]["sort"]
         
     except Exception as e:
         logger.error(f"Error searching Elasticsearch: {e}")
@@ -239,23 +833,13 @@ async def search_elasticsearch(query, filters, client_id, seen_urls):
                 'message': f"Search error: {str(e)}"
             }
         })
-
-def filter_and_format_result(result, filters):
-    """Apply filters to a real-time result and format it"""
-    # Apply language filter
-    if 'language' in filters and filters['language']:
-        result_lang = result.get('language', '').lower()
-        if result_lang != filters['language'].lower():
-            return False
-    
-    # Apply type filter
-    if 'type' in filters and filters['type']:
-        result_type = result.get('type', '').lower()
-        if result_type != filters['type'].lower():
-            return False
-    
-    return True
+    finally:
+        if pit_id:
+            try:
+                await es_client.close_point_in_time(id=pit_id)
+            except Exception as e:
+                logger.warning(f"Could not close point in time: {e}")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("streaming:app", host="0.0.0.0", port=8001, reload=True) 
\ No newline at end of file
+    uvicorn.run("streaming:app", host="0.0.0.0", port=8001, reload=True, ws="websockets", ws_per_message_deflate=True) 
\ No newline at end of file